@@ -10,8 +10,19 @@ from motor5 import MotorController
 SOUND_APP_PATH = './soundapp'
 SERIAL_PORT = '/dev/ttyS9'
 MODEL_PATH = './yolov5.rknn'
-CAMERA_INDEX = 21
+SCAN_MODEL_PATH = None  # 小尺寸模型 (如 './yolov5_320.rknn'), 设置后扫描时用它, 看到目标后切回 MODEL_PATH 确认
+CAMERA_INDEX = 21  # 也可以是 GStreamer pipeline 字符串 (camera.mjpeg_pipeline)、视频文件或图片目录
+CAPTURE_ARGS = None  # 摄像头采集参数, 如 {'fourcc': 'MJPG', 'auto_mode': True}: 用 MJPEG 采集, 按模型输入的宽高比自动选择分辨率
 DISPLAY_DURATION_MS = 1000
+PIPELINED = False  # 设为 True 时采集/预处理/NPU推理/后处理多线程并行, 默认逐帧串行
+NPU_POOL = False  # 设为 True 时 3 个 NPU 核心各加载一份模型, 轮询分发帧 (配合 PIPELINED 使用)
+LATEST_FRAME = False  # 设为 True 时后台线程持续读摄像头, 只处理最新一帧, 避免小车移动时检测结果滞后
+HEADLESS = False  # 无界面模式: 不画框、不开窗口, 搜索以纯推理速度运行 (机器人上通常没人看屏幕)
+SEARCH_TIMEOUT_S = None  # 无界面模式下单次搜索的最长时间 (秒), None 表示不限
+CONFIRMATION = 'consecutive'  # 目标确认策略: 'consecutive' (连续 5 帧) / 'evidence' (按分数和位置一致性累积证据, 漏检一帧不清零)
+MOTION_GATE = False  # 设为 True 时, 画面相对上一次推理没有变化 (小车停着) 就复用上一次的检测结果, 不跑 NPU
+WARMUP_INFERENCES = 3  # 启动时预热推理的次数 (每个模型 / 每个 NPU 核心), 避免第一条指令的延迟尖峰
+TRACK_INTERVAL = 0  # 大于 1 时检测到目标后用 CPU 跟踪器跟住目标框, 每 N 帧才跑一次 NPU (仅 PIPELINED = False 时生效)
 
 KEYWORD_MAP = {
     "扳手": "wrench",
@@ -44,8 +55,15 @@ def run_tracking_in_background(motor, stop_event):
 
 def main():
     # 1. 初始化所有模块
-    detector = ObjectDetector(model_path=MODEL_PATH, camera_index=CAMERA_INDEX)
+    model_paths = [SCAN_MODEL_PATH, MODEL_PATH] if SCAN_MODEL_PATH else MODEL_PATH
+    detector = ObjectDetector(model_path=model_paths, camera_index=CAMERA_INDEX, pipelined=PIPELINED, npu_pool=NPU_POOL,
+                              latest_frame=LATEST_FRAME, headless=HEADLESS, track_interval=TRACK_INTERVAL,
+                              confirmation=CONFIRMATION, motion_gate=MOTION_GATE,
+                              capture_args=CAPTURE_ARGS)
     motor = MotorController()
+    # 预热摄像头和 NPU, 完成后才开始接受语音指令
+    if detector.warm_up(num_inferences=WARMUP_INFERENCES) is None:
+        print("错误：视觉模块预热失败 (摄像头无画面)")
 
     # 2. 在后台启动语音识别子进程
     print(f"启动语音识别程序: {SOUND_APP_PATH}")
@@ -93,7 +111,16 @@ def main():
                 tracking_thread.start()
 
                 # c. 在主线程中执行视觉搜索 (前台任务，会阻塞直到完成)
-                found, result_frame = detector.search_for_object_live(target_keyword_en)
+                if HEADLESS:
+                    result = detector.search_for_object(target_keyword_en, timeout=SEARCH_TIMEOUT_S)
+                    found, result_frame = result.found, None
+                    print(f"[视觉] 结果: {result.reason}, {result.frames} 帧, 用时 {result.elapsed_s:.2f}s")
+                    if result.decision_s is not None:
+                        print(f"[视觉] 从第一次看到目标到确认用时 {result.decision_s:.2f}s")
+                    for det in result.detections:
+                        print(f"[视觉]   {det.label}: {det.score:.2f} @ {tuple(round(v) for v in det.box)}")
+                else:
+                    found, result_frame = detector.search_for_object_live(target_keyword_en)
 
                 # d. 视觉搜索结束，立即停止循迹线程
                 print(">>> 视觉搜索结束，正在停止小车...")
@@ -101,11 +128,12 @@ def main():
                 tracking_thread.join()  # 等待循迹线程安全退出
 
                 # e. 处理并显示最终结果
-                if found and result_frame is not None:
+                if found:
                     print(f"✔ 任务成功! 已找到 {target_keyword_en}.")
-                    cv2.imshow("Target Found!", result_frame)
-                    cv2.waitKey(DISPLAY_DURATION_MS)
-                    cv2.destroyWindow("Target Found!")
+                    if result_frame is not None:
+                        cv2.imshow("Target Found!", result_frame)
+                        cv2.waitKey(DISPLAY_DURATION_MS)
+                        cv2.destroyWindow("Target Found!")
                 else:
                     print(f"✖ 任务失败. 未能确认找到 {target_keyword_en}。")
 
@@ -130,13 +158,14 @@ def main():
 
         detector.release()
         motor.cleanup()
-        cv2.destroyAllWindows()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
         print("系统已安全关闭。")
 
 
 if __name__ == '__main__':
-    # 确保显示环境可用
-    if 'DISPLAY' not in os.environ:
+    # 确保显示环境可用 (无界面模式不需要)
+    if not HEADLESS and 'DISPLAY' not in os.environ:
         os.environ['DISPLAY'] = ':0'
         print("警告: DISPLAY 环境变量未设置, 已自动设为 ':0'")
 
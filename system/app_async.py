@@ -0,0 +1,114 @@
+# app_async.py
+# 1.py 的 asyncio 版本: 语音识别子进程的输出、小车循迹和视觉搜索都在同一个事件循环里运行,
+# 不再需要循迹线程和 stop_tracking_event。视觉搜索在 AsyncDetector 的 executor 中执行 (无界面模式)。
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from async_detector import AsyncDetector
+from vision_module import ObjectDetector
+from motor5 import MotorController
+
+# --- 配置 (含义见 1.py) ---
+SOUND_APP_PATH = './soundapp'
+SERIAL_PORT = '/dev/ttyS9'
+MODEL_PATH = './yolov5.rknn'
+CAMERA_INDEX = 21
+CAPTURE_ARGS = None
+SEARCH_TIMEOUT_S = 60
+TRACKING_PERIOD_S = 0.02
+
+KEYWORD_MAP = {
+    "扳手": "wrench",
+    "锤子": "hammer",
+    "锉刀": "file",
+    "卷尺": "tape_measure",
+    "万用表": "multimeter",
+    "钳子": "pliers",
+    "螺丝刀": "screwdrivers",
+    "护目镜": "safety_goggles",
+    "塞尺": "feeler_gauge",
+    "游标卡尺": "vernier_caliper"
+}
+
+
+async def run_tracking(motor, motor_executor):
+    """
+    小车循迹协程, 被取消时停车。
+    tracking_move 会读传感器并 sleep, 放在电机专用的单线程 executor 中执行, 不阻塞事件循环;
+    停车也在同一个线程中执行, 排在可能还没执行完的 tracking_move 之后
+    """
+    loop = asyncio.get_running_loop()
+    print("[循迹] 已启动。")
+    try:
+        while True:
+            await loop.run_in_executor(motor_executor, motor.tracking_move)
+            await asyncio.sleep(TRACKING_PERIOD_S)
+    finally:
+        await asyncio.shield(loop.run_in_executor(motor_executor, motor.stop))
+        print("[循迹] 已停止。")
+
+
+async def handle_command(adet, motor, motor_executor, target):
+    tracking = asyncio.create_task(run_tracking(motor, motor_executor))
+    try:
+        result = await adet.search(target, timeout=SEARCH_TIMEOUT_S)
+    finally:
+        tracking.cancel()
+        await asyncio.gather(tracking, return_exceptions=True)
+    print(f"[视觉] 结果: {result.reason}, {result.frames} 帧, 用时 {result.elapsed_s:.2f}s")
+    if result.found:
+        print(f"✔ 任务成功! 已找到 {target}.")
+    else:
+        print(f"✖ 任务失败. 未能确认找到 {target}。")
+
+
+async def main():
+    detector = ObjectDetector(model_path=MODEL_PATH, camera_index=CAMERA_INDEX, pipelined=True, npu_pool=True,
+                              latest_frame=True, headless=True, confirmation='evidence', motion_gate=True,
+                              capture_args=CAPTURE_ARGS)
+    adet = AsyncDetector(detector)
+    motor = MotorController()
+    motor_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='motor')
+    await adet.warm_up()
+
+    voice = await asyncio.create_subprocess_exec(SOUND_APP_PATH, SERIAL_PORT, stdout=asyncio.subprocess.PIPE,
+                                                 stderr=asyncio.subprocess.DEVNULL)
+    print("系统准备就绪，等待语音指令...")
+    command = None  # 正在执行的搜索任务, 新指令到达时取消它
+    try:
+        async for raw in voice.stdout:
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if not line:
+                continue
+            print(f"[语音识别]: {line}")
+            for keyword_cn, keyword_en in KEYWORD_MAP.items():
+                if keyword_cn in line and "识别成功" in line:
+                    print(f"\n>>> 收到指令: 开始寻找 '{keyword_cn}' ({keyword_en})")
+                    if command is not None and not command.done():
+                        command.cancel()
+                        await asyncio.gather(command, return_exceptions=True)
+                    command = asyncio.create_task(handle_command(adet, motor, motor_executor, keyword_en))
+                    break
+    finally:
+        if command is not None and not command.done():
+            command.cancel()
+            await asyncio.gather(command, return_exceptions=True)
+        if voice.returncode is None:
+            voice.terminate()
+            await voice.wait()
+        adet.close()
+        detector.release()
+        motor_executor.shutdown(wait=True)
+        motor.cleanup()
+        print("系统已安全关闭。")
+
+
+if __name__ == '__main__':
+    if not os.path.exists(SOUND_APP_PATH) or not os.access(SOUND_APP_PATH, os.X_OK):
+        print(f"错误: 语音程序 '{SOUND_APP_PATH}' 不存在或没有执行权限!")
+    else:
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            print("\n程序被用户终止 (Ctrl+C)")
@@ -0,0 +1,65 @@
+# async_detector.py
+# ObjectDetector 的 asyncio 接口: 视觉、语音和电机控制可以在同一个事件循环里运行, 不需要为搜索单独开线程。
+# 阻塞的 NPU 推理 / OpenCV 调用都在一个单线程的 executor 中执行 (同一时间只有一个搜索或帧流在用摄像头和模型),
+# 事件循环本身不会被阻塞。
+#
+#   adet = AsyncDetector(ObjectDetector(..., headless=True))
+#   async with contextlib.aclosing(adet.frames('wrench')) as frames:
+#       async for item in frames:                  # 每帧的检测结果 (vision_module.FrameItem)
+#           ...
+#   result = await adet.search('wrench', timeout=30)  # SearchResult, 任务被取消时搜索会在下一帧停止
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncDetector:
+    def __init__(self, detector, executor=None):
+        """detector: vision_module.ObjectDetector (建议 headless=True, 窗口不能在非主线程中刷新)"""
+        self.detector = detector
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='vision')
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def warm_up(self, **kwargs):
+        return await self._run(lambda: self.detector.warm_up(**kwargs))
+
+    async def frames(self, target_label=None):
+        """
+        异步逐帧产出检测结果 (FrameItem: frame, boxes, scores, class_ids, latency ...), 包装 ObjectDetector.frames,
+        所以运动门控、模型切换和跟踪与同步搜索完全一致。
+        target_label 不为 None 时只解码该类别, 并在串行模式下启用跟踪 (见 ObjectDetector.track_interval)。
+        生成器关闭时 (任务被取消, 或 break 后由 contextlib.aclosing 关闭) 停止采集和流水线线程;
+        只 break 不关闭的话要等生成器被回收才会停止, 这之前不要调用 close()。
+        """
+        # 生成器的创建不执行任何代码, 之后的每一步 (包括 close) 都在 executor 的线程中执行,
+        # 检测器的状态只在这一个线程中被修改
+        gen = self.detector.frames(target_label)
+        try:
+            while True:
+                item = await self._run(next, gen, None)
+                if item is None:
+                    return
+                yield item
+        finally:
+            await asyncio.shield(self._run(gen.close))
+
+    async def search(self, target_label, timeout=None):
+        """
+        无界面搜索目标, 返回 SearchResult。
+        等待它的任务被取消时 (如 asyncio.wait_for 超时、收到新的语音指令), 通知搜索在下一帧停止,
+        等它真正结束后再抛出 CancelledError, 保证摄像头和模型不会被两个搜索同时使用。
+        """
+        cancel_event = threading.Event()
+        future = asyncio.ensure_future(self._run(self.detector.search_for_object, target_label, cancel_event, timeout))
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel_event.set()
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+    def close(self):
+        self.executor.shutdown(wait=True)
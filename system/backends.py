@@ -0,0 +1,142 @@
+# backends.py
+# 可替换的推理后端。所有后端都提供和 RKNNLite 相同的接口:
+#   inference(inputs=[img])  img 为 letterbox 后的 [1, H, W, 3] uint8 RGB 图像
+#   release()
+# 并返回相同布局的输出 [ndarray(1, 25200, 15) float32], 所以同一个 postprocess 可以直接使用,
+# 也可以在同一台机器上对比不同后端的延迟。
+#   rknn   - 板子上的 RKNNLite (.rknn), 可选按核心的上下文池; want_float=False 时请求 int8 原始输出 (见 quantized.py)
+#   onnx   - ONNX Runtime CPU (train_yolo/export.py 导出的 .onnx), 线程数可配置
+#   opencv - cv2.dnn 加载同一个 .onnx
+#   fake   - fake_npu.FakeRKNNLite, 不需要模型文件
+# 各后端的依赖都在构造时才导入, 所以在 x86 开发机 / CI 上不需要安装 rknnlite。
+
+import numpy as np
+from quantized import supports_raw_outputs
+
+
+def raw_output_kwargs(runtime, want_float):
+    """want_float=False 且运行时支持时返回 {'want_float': False}, 否则返回 {} (运行时反量化成 float)"""
+    if want_float:
+        return {}
+    if supports_raw_outputs(runtime):
+        return {'want_float': False}
+    print("--> Runtime does not support non-float outputs, using float outputs")
+    return {}
+
+
+class RKNNLiteBackend:
+    name = 'rknn'
+
+    def __init__(self, model_path, core_mask=None, runtime_cls=None, verbose=False, want_float=True):
+        """
+        runtime_cls: RKNNLite 或接口相同的类, 默认 rknnlite.api.RKNNLite
+        want_float: False 时请求不反量化的原始输出; 运行时不支持时仍使用 float 输出
+        """
+        if runtime_cls is None:
+            from rknnlite.api import RKNNLite
+            runtime_cls = RKNNLite
+        if core_mask is None:
+            core_mask = runtime_cls.NPU_CORE_0_1_2
+        self.rknn_lite = runtime_cls(verbose=verbose)
+        print(f'--> Loading RKNN model: {model_path}')
+        if self.rknn_lite.load_rknn(model_path) != 0:
+            self.rknn_lite.release()
+            raise RuntimeError(f"Failed to load RKNN model: {model_path}")
+        print('--> Init runtime environment')
+        if self.rknn_lite.init_runtime(core_mask=core_mask) != 0:
+            self.rknn_lite.release()
+            raise RuntimeError("Failed to init RKNN runtime")
+        self.inference_kwargs = raw_output_kwargs(self.rknn_lite, want_float)
+
+    def inference(self, inputs):
+        return self.rknn_lite.inference(inputs=inputs, **self.inference_kwargs)
+
+    def release(self):
+        self.rknn_lite.release()
+
+
+class _OnnxInputMixin:
+    """RKNN 模型把 /255 归一化和 NHWC->NCHW 放在了 NPU 上 (convert.py 中的 mean/std), ONNX 模型需要在 CPU 上做"""
+    def _to_blob(self, img):
+        if self._blob is None or self._blob.shape[2:] != img.shape[1:3]:
+            self._blob = np.empty((img.shape[0], 3, img.shape[1], img.shape[2]), dtype=np.float32)
+        np.multiply(img.transpose(0, 3, 1, 2), np.float32(1 / 255), out=self._blob)
+        return self._blob
+
+
+class OnnxRuntimeBackend(_OnnxInputMixin):
+    name = 'onnx'
+
+    def __init__(self, model_path, num_threads=4):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        print(f'--> Loading ONNX model with ONNX Runtime ({num_threads} threads): {model_path}')
+        try:
+            self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        except Exception as e:
+            raise RuntimeError(f"Failed to load ONNX model: {model_path} ({e})") from e
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        self._blob = None
+
+    def inference(self, inputs):
+        return self.session.run(self.output_names, {self.input_name: self._to_blob(inputs[0])})
+
+    def release(self):
+        self.session = None
+
+
+class OpenCVDNNBackend(_OnnxInputMixin):
+    name = 'opencv'
+
+    def __init__(self, model_path, num_threads=None):
+        import cv2
+        if num_threads:
+            cv2.setNumThreads(num_threads)
+        print(f'--> Loading ONNX model with cv2.dnn: {model_path}')
+        try:
+            self.net = cv2.dnn.readNetFromONNX(model_path)
+        except cv2.error as e:
+            raise RuntimeError(f"Failed to load ONNX model: {model_path} ({e})") from e
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.output_names = self.net.getUnconnectedOutLayersNames()
+        self._blob = None
+
+    def inference(self, inputs):
+        self.net.setInput(self._to_blob(inputs[0]))
+        return list(self.net.forward(self.output_names))
+
+    def release(self):
+        self.net = None
+
+
+BACKENDS = ('rknn', 'onnx', 'opencv', 'fake')
+
+
+def create_backend(name, model_path, num_threads=4, runtime_cls=None, npu_pool=False, want_float=True, **kwargs):
+    """
+    按名称创建推理后端, 加载失败时抛出 RuntimeError。
+    npu_pool 只对 rknn 有效: 为 True 时返回每个 NPU 核心一个上下文的 npu_pool.RKNNPool。
+    want_float 只对 rknn 有效: False 时请求 INT8 模型的 int8 原始输出。
+    其余关键字参数传给 fake_npu.FakeRKNNLite (latency, outputs)。
+    """
+    try:
+        if name == 'rknn':
+            if npu_pool:
+                from npu_pool import RKNNPool
+                return RKNNPool(model_path, runtime_cls=runtime_cls, want_float=want_float)
+            return RKNNLiteBackend(model_path, runtime_cls=runtime_cls, want_float=want_float)
+        if name == 'onnx':
+            return OnnxRuntimeBackend(model_path, num_threads=num_threads)
+        if name == 'opencv':
+            return OpenCVDNNBackend(model_path, num_threads=num_threads)
+        if name == 'fake':
+            from fake_npu import FakeRKNNLite
+            return FakeRKNNLite(**kwargs)
+    except ImportError as e:
+        raise RuntimeError(f"Backend '{name}' is not available: {e}") from e
+    raise ValueError(f"Unknown backend '{name}', choose from {BACKENDS}")
@@ -0,0 +1,205 @@
+# bench_pipeline.py
+# 视觉流程分级延迟基准: 用 Dataset/images/val 回放 letterbox -> inference -> postprocess -> draw_results,
+# 全部使用 vision_module 中的真实实现。推理后端可以是:
+#   fake: fake_npu.FakeRKNNLite, 返回录制的 [1,25200,15] 输出 (final.py --source ... --save_raw DIR),
+#         没有录制文件的图片使用模拟输出
+#   rknn: 板子上的真实 RKNNLite
+#   onnx / opencv: CPU 上运行导出的 .onnx (见 backends.py), 可以和 rknn 的结果直接对比
+# 输出每级的延迟直方图、每帧内存分配量, 并写入 JSON 结果文件, 可以用 --compare 与上一次结果对比。
+#
+# 运行: python3 bench_pipeline.py --outputs raw_outputs --json bench_results.json --compare last.json
+#       python3 bench_pipeline.py --backend onnx --model_path yolov5s.onnx --threads 4
+
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from backends import BACKENDS, create_backend
+from fake_npu import synthetic_outputs
+from model_set import load_model_info
+from vision_module import CLASSES, IMG_SIZE, Letterbox, draw_results, postprocess
+
+STAGES = ('preprocess', 'inference', 'postprocess', 'draw')
+HIST_EDGES_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)
+
+
+def load_images(image_dir, limit=None):
+    names = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    if limit:
+        names = names[:limit]
+    images = []
+    for name in names:
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is not None:
+            images.append((os.path.splitext(name)[0], img))
+    return images
+
+
+def make_runtime(args, images):
+    """返回 (推理后端, 名称)"""
+    backend = args.backend
+    if backend == 'auto':
+        try:
+            import rknnlite.api  # noqa: F401
+            backend = 'rknn' if os.path.exists(args.model_path) else 'fake'
+        except ImportError:
+            backend = 'fake'
+    if backend != 'fake':
+        try:
+            return create_backend(backend, args.model_path, num_threads=args.threads), backend
+        except RuntimeError as e:
+            exit(str(e))
+    # 假 NPU: 按图片顺序返回录制的输出, 没有录制文件时使用模拟输出
+    recorded, n_recorded = [], 0
+    for i, (stem, _) in enumerate(images):
+        path = os.path.join(args.outputs, stem + '.npy') if args.outputs else None
+        if path and os.path.exists(path):
+            recorded.append(np.load(path))
+            n_recorded += 1
+        else:
+            recorded.append(synthetic_outputs(args.img_size, seed=i))
+    print(f"--> Fake NPU: {n_recorded} recorded outputs, {len(images) - n_recorded} synthetic")
+    return create_backend('fake', None, latency=args.fake_latency, outputs=recorded), 'fake'
+
+
+def _measure(trace_alloc, func, *args):
+    """执行 func, 返回 (结果, 耗时秒) 或 (结果, 期间分配的峰值字节数)"""
+    if trace_alloc:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        out = func(*args)
+        return out, tracemalloc.get_traced_memory()[1] - before
+    t0 = time.perf_counter()
+    out = func(*args)
+    return out, time.perf_counter() - t0
+
+
+def run_frames(images, runtime, letterboxes, repeat, img_size=IMG_SIZE, trace_alloc=False):
+    """逐帧执行各级, 返回 {stage: [秒]} 或 (trace_alloc=True 时) {stage: [分配字节]}"""
+    results = {stage: [] for stage in STAGES}
+    for _ in range(repeat):
+        for _, img in images:
+            lb = letterboxes.get(img.shape)
+            if lb is None:
+                lb = letterboxes[img.shape] = Letterbox(img.shape, new_shape=(img_size, img_size))
+            canvas = img.copy()  # draw_results 会在原图上绘制, 这里的拷贝不计入任何一级
+            (img_input, ratio, pad), value = _measure(trace_alloc, lb, img)
+            results['preprocess'].append(value)
+            outputs, value = _measure(trace_alloc, runtime.inference, [img_input])
+            results['inference'].append(value)
+            (boxes, scores, class_ids), value = _measure(trace_alloc, postprocess, outputs, ratio, pad)
+            results['postprocess'].append(value)
+            _, value = _measure(trace_alloc, draw_results, canvas, boxes, scores, class_ids, CLASSES)
+            results['draw'].append(value)
+    return results
+
+
+def histogram(ms):
+    counts, _ = np.histogram(ms, bins=(0,) + HIST_EDGES_MS + (np.inf,))
+    labels = [f"<{e}" for e in HIST_EDGES_MS] + [f">={HIST_EDGES_MS[-1]}"]
+    return dict(zip(labels, counts.tolist()))
+
+
+def summarize(times, allocs):
+    summary = {}
+    for stage in STAGES:
+        ms = np.array(times[stage]) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        summary[stage] = {
+            'mean_ms': float(ms.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'alloc_kb_per_frame': float(np.mean(allocs[stage]) / 1024),
+            'histogram_ms': histogram(ms),
+        }
+    total = sum(np.array(times[s]) for s in STAGES) * 1000
+    summary['total'] = {'mean_ms': float(total.mean()), 'p50_ms': float(np.percentile(total, 50)),
+                        'p95_ms': float(np.percentile(total, 95)), 'p99_ms': float(np.percentile(total, 99))}
+    return summary
+
+
+def print_report(summary):
+    print(f"\n{'stage':<12}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'alloc/frame':>14}")
+    for stage in STAGES + ('total',):
+        s = summary[stage]
+        alloc = f"{s['alloc_kb_per_frame']:.1f} KB" if 'alloc_kb_per_frame' in s else ''
+        print(f"{stage:<12}{s['mean_ms']:>9.3f}{s['p50_ms']:>9.3f}{s['p95_ms']:>9.3f}{s['p99_ms']:>9.3f}{alloc:>14}")
+    for stage in STAGES:
+        hist = summary[stage]['histogram_ms']
+        peak = max(hist.values()) or 1
+        print(f"\n{stage} latency histogram (ms):")
+        for label, count in hist.items():
+            if count:
+                print(f"  {label:>6} | {'#' * max(1, int(40 * count / peak))} {count}")
+
+
+def print_compare(summary, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['stages']
+    print(f"\nCompared with {baseline_path} (p50, positive = slower):")
+    for stage in STAGES + ('total',):
+        if stage in baseline:
+            old, new = baseline[stage]['p50_ms'], summary[stage]['p50_ms']
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"  {stage:<12}{old:>9.3f} -> {new:>9.3f} ms ({change:+.1f}%)")
+
+
+def main(args):
+    images = load_images(args.images, args.limit)
+    if not images:
+        exit(f"No images found in {args.images}")
+    print(f"--> Loaded {len(images)} images from {args.images}")
+    if args.img_size is None:
+        args.img_size = load_model_info(args.model_path, default_size=IMG_SIZE).img_size
+    print(f"--> Model input size: {args.img_size}")
+    runtime, backend = make_runtime(args, images)
+    letterboxes = {}
+
+    run_frames(images[:5], runtime, letterboxes, 1, args.img_size)  # 预热
+    times = run_frames(images, runtime, letterboxes, args.repeat, args.img_size)
+    # 内存分配单独跑一遍, tracemalloc 会拖慢计时
+    tracemalloc.start()
+    allocs = run_frames(images, runtime, letterboxes, 1, args.img_size, trace_alloc=True)
+    tracemalloc.stop()
+    runtime.release()
+
+    summary = summarize(times, allocs)
+    print_report(summary)
+    if args.compare:
+        print_compare(summary, args.compare)
+
+    result = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'backend': backend,
+        'img_size': args.img_size,
+        'images': len(images),
+        'repeat': args.repeat,
+        'frames': len(images) * args.repeat,
+        'stages': summary,
+    }
+    with open(args.json, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-stage latency benchmark for the vision pipeline")
+    parser.add_argument('--images', type=str, default='../vision_module/Dataset/images/val', help='Images to replay')
+    parser.add_argument('--backend', choices=('auto',) + BACKENDS, default='auto',
+                        help='auto uses RKNNLite when rknnlite and the model are available, otherwise the fake NPU')
+    parser.add_argument('--model_path', type=str, default='./yolov5.rknn',
+                        help='.rknn for the rknn backend, .onnx for the onnx / opencv backends')
+    parser.add_argument('--threads', type=int, default=4, help='CPU threads for the onnx / opencv backends')
+    parser.add_argument('--img_size', type=int, default=None,
+                        help='Model input size (default: from the model .json metadata, else 640)')
+    parser.add_argument('--outputs', type=str, default=None, help='Recorded outputs (.npy per image) for the fake NPU')
+    parser.add_argument('--fake_latency', type=float, default=0.0, help='Simulated NPU latency in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='Passes over the images')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N images')
+    parser.add_argument('--json', type=str, default='bench_results.json', help='Result file')
+    parser.add_argument('--compare', type=str, default=None, help='Previous result file to compare against')
+    main(parser.parse_args())
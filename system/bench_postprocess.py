@@ -0,0 +1,214 @@
+# bench_postprocess.py
+# 后处理微基准: 在录制的模型输出上比较旧版 (全量解码 + 类别无关 NMS) 和新版 (top-k 预筛选 + 按类别 NMS) 的单帧耗时,
+# 以及只解码单个目标类别 (postprocess 的 target_class, 无界面搜索时使用) 的耗时。
+# --raw_heads: 验证拆分检测头 (export.py --raw-heads) 的主机端稀疏解码与完整解码后的输出结果一致, 并比较耗时和读取的字节数
+# --quantized: INT8 模型的 int8 输出在量化域中筛选 (quantized.py) vs 运行时全部反量化成 float 后再后处理
+#
+# 录制输出: python3 final.py --image_path xxx.jpg --save_raw raw_outputs
+# 运行:     python3 bench_postprocess.py --outputs raw_outputs --repeat 50
+# 不指定 --outputs 时使用 fake_npu.synthetic_outputs 生成的模拟输出
+
+import argparse
+import glob
+import os
+import time
+import cv2
+import numpy as np
+from fake_npu import synthetic_outputs, synthetic_raw_heads
+from vision_module import CLASSES, CONF_THRESHOLD, NMS_THRESHOLD, postprocess
+from quantized import QuantParams, dense_candidates, dequantize, quantize
+from yolo_heads import get_decoder
+
+
+def postprocess_legacy(outputs, ratio, pad):
+    """旧版后处理 (类别无关的 cv2.dnn.NMSBoxes), 仅作为对比基准"""
+    predictions = np.squeeze(outputs[0])
+    obj_conf_mask = predictions[:, 4] > CONF_THRESHOLD
+    predictions = predictions[obj_conf_mask]
+    if not predictions.shape[0]: return [], [], []
+    class_scores = predictions[:, 5:]
+    class_ids = np.argmax(class_scores, axis=1)
+    scores = np.max(class_scores, axis=1) * predictions[:, 4]
+    score_mask = scores > CONF_THRESHOLD
+    predictions = predictions[score_mask]
+    class_ids = class_ids[score_mask]
+    scores = scores[score_mask]
+    if not predictions.shape[0]: return [], [], []
+    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+    x1 = cx - w / 2; y1 = cy - h / 2
+    boxes = np.column_stack((x1, y1, w, h))
+    indices = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), CONF_THRESHOLD, NMS_THRESHOLD)
+    if len(indices) == 0: return [], [], []
+    indices = np.array(indices).flatten()
+    final_boxes = boxes[indices]
+    final_boxes[:, 0] = np.clip((final_boxes[:, 0] - pad[0]) / ratio, 0, None)
+    final_boxes[:, 1] = np.clip((final_boxes[:, 1] - pad[1]) / ratio, 0, None)
+    final_boxes[:, 2] /= ratio
+    final_boxes[:, 3] /= ratio
+    return final_boxes, scores[indices], class_ids[indices]
+
+
+def load_recorded(path):
+    """读取录制的输出: 单个 .npy/.npz 文件或包含 .npy 文件的目录"""
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*.npy')))
+        return [np.load(f) for f in files]
+    data = np.load(path)
+    if isinstance(data, np.lib.npyio.NpzFile):
+        return [data[k] for k in sorted(data.files)]
+    return [data] if data.ndim == 3 else [d[None] for d in data]
+
+
+def time_per_frame(func, recorded, repeat, **kwargs):
+    times = []
+    for _ in range(repeat):
+        for out in recorded:
+            t0 = time.perf_counter()
+            func([out], 1.0, (0.0, 0.0), **kwargs)
+            times.append(time.perf_counter() - t0)
+    return np.array(times) * 1000
+
+
+def bench_raw_heads(args):
+    """同一组原始检测头输出: 完整解码 (等价于现在 NPU 上的 Detect 输出) 后处理 vs 稀疏解码后处理"""
+    samples = [synthetic_raw_heads(args.img_size, num_objects=args.objects, seed=i) for i in range(20)]
+    decoder = get_decoder(tuple(tuple(o.shape[1:]) for o in samples[0]))
+    dense = [decoder.decode_dense(heads) for heads in samples]
+    mismatches, total = 0, 0
+    for heads, full in zip(samples, dense):
+        a, b = postprocess([full], 1.0, (0, 0)), postprocess(heads, 1.0, (0, 0))
+        total += len(a[0])
+        same = len(a[0]) == len(b[0]) and (not len(a[0]) or (
+            np.array_equal(a[2], b[2]) and np.allclose(a[0], b[0], atol=1e-3) and np.allclose(a[1], b[1], atol=1e-6)))
+        mismatches += not same
+    print(f"Equivalence: {len(samples) - mismatches}/{len(samples)} frames identical ({total} detections)")
+
+    times = {}
+    for name, data in (('decoded', [[d] for d in dense]), ('raw heads', samples)):
+        postprocess(data[0], 1.0, (0, 0))  # 预热
+        ms = []
+        for _ in range(args.repeat):
+            for out in data:
+                t0 = time.perf_counter()
+                postprocess(out, 1.0, (0, 0))
+                ms.append(time.perf_counter() - t0)
+        times[name] = np.array(ms) * 1000
+        print(f"{name:>9}: mean {times[name].mean():.3f} ms | p95 {np.percentile(times[name], 95):.3f} ms per frame")
+    # 解码后的输出每行 (5 + nc) * 4 字节, 读 objectness 一列也要经过每一行所在的缓存行;
+    # 原始输出中每个 anchor 的 objectness 是一块连续内存, 只需读这些平面和通过阈值的 K 个格子
+    kept = np.mean([len(decoder.decode(h, CONF_THRESHOLD)[1]) for h in samples])
+    dense_bytes = dense[0].nbytes
+    raw_bytes = decoder.num_rows * 4 + kept * decoder.no * 4
+    print(f"Bytes read per frame: decoded {dense_bytes / 1024:.0f} KiB -> raw heads {raw_bytes / 1024:.0f} KiB "
+          f"({kept:.0f} cells pass objectness)")
+    print(f"Host postprocess: {times['decoded'].mean() / times['raw heads'].mean():.2f}x "
+          f"(NPU no longer runs sigmoid/grid/anchor/concat)")
+
+
+def calibrate(tensors):
+    """按 min/max 估计非对称 int8 的 (zero_point, scale), 与 RKNN 的 normal 量化算法相同"""
+    lo, hi = min(float(t.min()) for t in tensors), max(float(t.max()) for t in tensors)
+    scale = (hi - lo) / 255
+    return QuantParams(int(round(-128 - lo / scale)), scale)
+
+
+def bench_quantized(args):
+    """
+    float 路径: 运行时把 int8 输出全部反量化 (每个元素读 1 字节、写 4 字节), 后处理再读 float;
+    量化路径: 只读 objectness 的 int8 值, 只反量化通过阈值的行
+    """
+    layouts = {
+        'decoded': [[synthetic_outputs(args.img_size, num_objects=args.objects, seed=i)] for i in range(20)],
+        'raw heads': [synthetic_raw_heads(args.img_size, num_objects=args.objects, seed=i) for i in range(20)],
+    }
+    for layout, samples in layouts.items():
+        quant = [calibrate([s[i] for s in samples]) for i in range(len(samples[0]))]
+        q_samples = [[quantize(o, qp) for o, qp in zip(s, quant)] for s in samples]
+        f_samples = [[dequantize(o, qp) for o, qp in zip(s, quant)] for s in q_samples]
+        same = sum(
+            all(np.array_equal(a, b) for a, b in zip(postprocess(f, 1.0, (0, 0)), postprocess(q, 1.0, (0, 0), quant=quant)))
+            for f, q in zip(f_samples, q_samples))
+        detections = sum(len(postprocess(q, 1.0, (0, 0), quant=quant)[0]) for q in q_samples)
+        float_ms, quant_ms = [], []
+        for _ in range(args.repeat):
+            for q in q_samples:
+                t0 = time.perf_counter()
+                postprocess([dequantize(o, qp) for o, qp in zip(q, quant)], 1.0, (0, 0))
+                t1 = time.perf_counter()
+                postprocess(q, 1.0, (0, 0), quant=quant)
+                t2 = time.perf_counter()
+                float_ms.append(t1 - t0)
+                quant_ms.append(t2 - t1)
+        float_ms, quant_ms = np.array(float_ms) * 1000, np.array(quant_ms) * 1000
+        elements = sum(o.size for o in q_samples[0])
+        no = q_samples[0][0].shape[-1] if layout == 'decoded' else q_samples[0][0].shape[1] // 3
+        rows = elements // no
+        # 解码后的布局中 objectness 是每行的一列, 读它会经过每一行所在的缓存行; 拆分检测头中它是连续的平面
+        obj_bytes = elements if layout == 'decoded' else rows
+        float_bytes = elements * (1 + 4) + elements * 4
+        if layout == 'decoded':
+            kept = np.mean([len(dense_candidates(q[0], CONF_THRESHOLD, quant[0])) for q in q_samples])
+        else:
+            decoder = get_decoder(tuple(tuple(o.shape[1:]) for o in q_samples[0]))
+            kept = np.mean([len(decoder.decode(q, CONF_THRESHOLD, quant)[1]) for q in q_samples])
+        quant_bytes = obj_bytes + kept * no * (1 + 4)  # 通过阈值的行: 读 int8, 写 float
+        print(f"[{layout}] identical detections: {same}/{len(q_samples)} frames ({detections} detections), "
+              f"zero_point/scale {[(qp.zero_point, round(qp.scale, 4)) for qp in quant]}")
+        print(f"  float path: {float_ms.mean():.3f} ms, ~{float_bytes / 1024:.0f} KiB touched per frame "
+              f"(dequantize everything + postprocess)")
+        print(f"  int8 path:  {quant_ms.mean():.3f} ms, ~{quant_bytes / 1024:.0f} KiB touched per frame "
+              f"({float_ms.mean() / quant_ms.mean():.2f}x, {kept:.0f} rows dequantized)")
+        if layout == 'decoded' and not detections:
+            print("  Note: pixel coordinates and probabilities share one scale in the decoded layout, so int8 "
+                  "objectness loses its resolution; export INT8 models with --raw-heads")
+
+
+def main(args):
+    if args.raw_heads:
+        bench_raw_heads(args)
+        return
+    if args.quantized:
+        bench_quantized(args)
+        return
+    if args.outputs:
+        recorded = load_recorded(args.outputs)
+        print(f"Loaded {len(recorded)} recorded outputs from {args.outputs}")
+    else:
+        recorded = [synthetic_outputs(num_objects=args.objects, seed=i) for i in range(20)]
+        print(f"No --outputs given, using {len(recorded)} synthetic outputs ({args.objects} objects each)")
+    if not recorded:
+        print("No outputs to benchmark.")
+        return
+
+    n_legacy = sum(len(postprocess_legacy([o], 1.0, (0, 0))[0]) for o in recorded)
+    n_new = sum(len(postprocess([o], 1.0, (0, 0))[0]) for o in recorded)
+    print(f"Detections: legacy={n_legacy} (class-agnostic NMS), new={n_new} (class-aware NMS)")
+
+    results = {}
+    for name, func in (('legacy', postprocess_legacy), ('new', postprocess)):
+        func([recorded[0]], 1.0, (0, 0))  # 预热
+        ms = time_per_frame(func, recorded, args.repeat)
+        results[name] = ms
+        print(f"{name:>7}: mean {ms.mean():.3f} ms | p50 {np.percentile(ms, 50):.3f} ms | "
+              f"p95 {np.percentile(ms, 95):.3f} ms per frame")
+    saved = results['legacy'].mean() - results['new'].mean()
+    print(f"Latency reduction: {saved:.3f} ms/frame ({results['legacy'].mean() / results['new'].mean():.2f}x)")
+
+    target = CLASSES.index(args.target)
+    n_target = sum(len(postprocess([o], 1.0, (0, 0), target_class=target)[0]) for o in recorded)
+    ms = time_per_frame(postprocess, recorded, args.repeat, target_class=target)
+    print(f" target: mean {ms.mean():.3f} ms | p50 {np.percentile(ms, 50):.3f} ms | "
+          f"p95 {np.percentile(ms, 95):.3f} ms per frame ('{args.target}' only, {n_target} detections)")
+    print(f"Target-only vs full decode: {results['new'].mean() / ms.mean():.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Postprocess microbenchmark on recorded model outputs")
+    parser.add_argument('--outputs', type=str, default=None, help='Recorded outputs (.npy/.npz file or directory of .npy)')
+    parser.add_argument('--repeat', type=int, default=20, help='Passes over the recorded outputs')
+    parser.add_argument('--target', type=str, default=CLASSES[0], choices=CLASSES, help='Class for the target-only decode')
+    parser.add_argument('--objects', type=int, default=3, help='Objects per synthetic output (without --outputs)')
+    parser.add_argument('--raw_heads', action='store_true', help='Validate and time the split-head host decode')
+    parser.add_argument('--quantized', action='store_true', help='Compare the int8-domain threshold to the float path')
+    parser.add_argument('--img_size', type=int, default=640, help='Input size for the synthetic raw heads')
+    main(parser.parse_args())
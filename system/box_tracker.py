@@ -0,0 +1,96 @@
+# box_tracker.py
+# 轻量的 CPU 目标框跟踪, 用于在两次 NPU 检测之间跟住已经发现的目标, 减少 NPU 推理次数。
+#   flow:       在框内取角点, 用金字塔 LK 光流 + 前向/后向一致性校验跟踪,
+#               按点的位移中位数平移框、按点到中心距离的比例中位数缩放框;
+#               置信度 = 通过校验的点所占比例
+#   kcf/mosse:  OpenCV 的相关滤波跟踪器 (需要 opencv-contrib), 跟踪成功时置信度为 1, 失败为 0
+
+import cv2
+import numpy as np
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+FB_MAX_ERROR = 1.0  # 前向-后向误差 (像素) 超过该值的点视为跟丢
+
+
+def _create_cv_tracker(method):
+    names = {'kcf': 'TrackerKCF_create', 'mosse': 'TrackerMOSSE_create'}
+    for module in (cv2, getattr(cv2, 'legacy', None)):
+        if module is not None and hasattr(module, names[method]):
+            return getattr(module, names[method])()
+    raise RuntimeError(f"OpenCV tracker '{method}' is not available (install opencv-contrib-python)")
+
+
+class BoxTracker:
+    def __init__(self, method='flow', max_points=50, min_points=8):
+        if method not in ('flow', 'kcf', 'mosse'):
+            raise ValueError(f"Unknown tracker method '{method}'")
+        self.method = method
+        self.max_points = max_points
+        self.min_points = min_points
+        self.box = None
+        self._tracker = None
+        self._prev_gray = None
+        self._points = None
+
+    def init(self, frame, box):
+        """frame 为 BGR 图像, box 为 (x, y, w, h); 成功返回 True"""
+        h_img, w_img = frame.shape[:2]
+        x, y, w, h = [int(round(v)) for v in box]
+        x, y = max(0, x), max(0, y)
+        w, h = min(w, w_img - x), min(h, h_img - y)
+        if w < 4 or h < 4:
+            return False
+        self.box = np.array([x, y, w, h], dtype=np.float32)
+        if self.method != 'flow':
+            self._tracker = _create_cv_tracker(self.method)
+            self._tracker.init(frame, (x, y, w, h))
+            return True
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        mask = np.zeros_like(gray)
+        mask[y:y + h, x:x + w] = 255
+        points = cv2.goodFeaturesToTrack(gray, maxCorners=self.max_points, qualityLevel=0.01,
+                                         minDistance=max(3, min(w, h) // 10), mask=mask)
+        if points is None or len(points) < self.min_points:
+            # 纹理太少时在框内均匀撒点, 由前向-后向校验剔除跟不住的点
+            xs, ys = np.meshgrid(np.linspace(x + w * 0.1, x + w * 0.9, 6), np.linspace(y + h * 0.1, y + h * 0.9, 6))
+            points = np.stack((xs.ravel(), ys.ravel()), axis=1).reshape(-1, 1, 2)
+        self._points = points.astype(np.float32)
+        self._prev_gray = gray
+        return True
+
+    def update(self, frame):
+        """返回 (ok, box, confidence), box 为 (x, y, w, h)"""
+        if self.box is None:
+            return False, None, 0.0
+        if self.method != 'flow':
+            ok, box = self._tracker.update(frame)
+            if ok:
+                self.box = np.array(box, dtype=np.float32)
+            return bool(ok), tuple(self.box), 1.0 if ok else 0.0
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        p0 = self._points
+        p1, st1, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, p0, None, **LK_PARAMS)
+        p0r, st2, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, p1, None, **LK_PARAMS)
+        fb_error = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+        good = (st1.ravel() == 1) & (st2.ravel() == 1) & (fb_error < FB_MAX_ERROR)
+        confidence = float(good.sum()) / len(p0)
+        if good.sum() < 4:
+            return False, tuple(self.box), confidence
+
+        old, new = p0[good].reshape(-1, 2), p1[good].reshape(-1, 2)
+        shift = np.median(new - old, axis=0)
+        # 缩放: 各点到点集中心距离的比值的中位数
+        d_old = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        d_new = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = d_old > 1e-3
+        scale = float(np.median(d_new[valid] / d_old[valid])) if valid.any() else 1.0
+        x, y, w, h = self.box
+        cx, cy = x + w / 2 + shift[0], y + h / 2 + shift[1]
+        w, h = w * scale, h * scale
+        self.box = np.array([cx - w / 2, cy - h / 2, w, h], dtype=np.float32)
+        self._points = p1[good].reshape(-1, 1, 2)
+        self._prev_gray = gray
+        return True, tuple(self.box), confidence
@@ -0,0 +1,232 @@
+# camera.py
+# 摄像头采集
+# cap.read() 返回的是驱动队列里最旧的一帧, 推理速度跟不上摄像头帧率时检测结果会落后好几帧。
+# LatestFrameGrabber 在后台线程里不停读取, 只保留最新的一帧和它的采集时间戳。
+#
+# open_capture 统一打开各种采集源, 返回和 cv2.VideoCapture 接口相同的对象:
+#   21 / '/dev/video21'      V4L2 摄像头, 可指定 fourcc (如 'MJPG')、分辨率、帧率,
+#                            auto_mode=True 时用 v4l2-ctl 列出摄像头支持的模式, 选一个宽高比最接近模型输入的
+#   'v4l2src ... ! appsink'  GStreamer pipeline 字符串 (见 mjpeg_pipeline / videotest_pipeline)
+#   'xxx.mp4'                视频文件回放
+#   'images/'                图片目录回放 (按文件名排序)
+
+import glob
+import os
+import re
+import subprocess
+import threading
+import time
+import cv2
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class LatestFrameGrabber:
+    def __init__(self, cap):
+        """cap: 已打开的 cv2.VideoCapture (或接口相同的对象)"""
+        self.cap = cap
+        self.frames_grabbed = 0
+        self.frames_dropped = 0  # 被更新的帧覆盖、从未被取走的帧数
+        self._cond = threading.Condition()
+        self._frame = None
+        self._timestamp = None
+        self._seq = 0  # 最新一帧的序号
+        self._consumed_seq = 0  # 最近被取走的帧的序号
+        self._ended = False
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def _loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            timestamp = time.perf_counter()
+            with self._cond:
+                if not ret:
+                    self._ended = True
+                    self._cond.notify_all()
+                    return
+                if self._seq > self._consumed_seq:
+                    self.frames_dropped += 1
+                self._frame = frame
+                self._timestamp = timestamp
+                self._seq += 1
+                self.frames_grabbed += 1
+                self._cond.notify_all()
+
+    def read_latest(self, timeout=2.0):
+        """
+        等待一帧比上次取走的更新的画面, 返回 (ret, frame, timestamp, seq)。
+        timestamp 为 time.perf_counter() 时间, 表示这一帧从驱动读出的时刻。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > self._consumed_seq or self._ended, timeout):
+                return False, None, None, self._consumed_seq
+            if self._seq <= self._consumed_seq:  # 已结束且没有新帧
+                return False, None, None, self._consumed_seq
+            self._consumed_seq = self._seq
+            return True, self._frame, self._timestamp, self._seq
+
+    def read(self):
+        """与 cv2.VideoCapture.read 相同的接口"""
+        ret, frame, _, _ = self.read_latest()
+        return ret, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def release(self):
+        self.stop()
+        self.cap.release()
+
+
+class ImageDirSource:
+    """把图片目录当作摄像头回放, 接口与 cv2.VideoCapture 相同"""
+    def __init__(self, path, fps=None, loop=False):
+        """fps: 按该帧率回放 (模拟摄像头), None 表示尽快读取; loop: 读完后从头开始"""
+        self.paths = sorted(p for p in glob.glob(os.path.join(path, '*')) if p.lower().endswith(IMAGE_EXTS))
+        self.fps = fps
+        self.loop = loop
+        self._index = 0
+        self._next_time = None
+
+    def read(self):
+        if self._index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self._index = 0
+        if self.fps:
+            now = time.perf_counter()
+            if self._next_time is not None and now < self._next_time:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + 1.0 / self.fps
+        frame = cv2.imread(self.paths[self._index])
+        self._index += 1
+        return frame is not None, frame
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return 0.0
+
+    def release(self):
+        self.paths = []
+
+
+def mjpeg_pipeline(device='/dev/video21', width=1280, height=720, fps=30, decoder='jpegdec'):
+    """
+    V4L2 MJPEG 摄像头的 GStreamer pipeline: 摄像头输出 MJPEG, 由 decoder 解码
+    (RK3588 上可用硬件解码 'mppjpegdec'), appsink 只保留最新一帧
+    """
+    return (f'v4l2src device={device} io-mode=2 ! image/jpeg,width={width},height={height},framerate={fps}/1 ! '
+            f'{decoder} ! videoconvert ! video/x-raw,format=BGR ! appsink drop=true max-buffers=1 sync=false')
+
+
+def videotest_pipeline(width=640, height=480, fps=30, num_frames=300):
+    """GStreamer 测试源 videotestsrc, 用于在没有摄像头的机器上测试采集链路"""
+    return (f'videotestsrc num-buffers={num_frames} pattern=ball ! video/x-raw,width={width},height={height},'
+            f'framerate={fps}/1 ! videoconvert ! video/x-raw,format=BGR ! appsink sync=false')
+
+
+def list_v4l2_modes(device):
+    """用 v4l2-ctl 列出摄像头支持的模式, 返回 [(fourcc, width, height, fps), ...], 失败时返回 []"""
+    try:
+        text = subprocess.run(['v4l2-ctl', '-d', str(device), '--list-formats-ext'],
+                              capture_output=True, text=True, timeout=5).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    modes, fourcc, size = [], None, None
+    for line in text.splitlines():
+        m = re.search(r"'(\w{4})'", line)
+        if m and '[' in line:
+            fourcc = m.group(1)
+            continue
+        m = re.search(r'Size: Discrete (\d+)x(\d+)', line)
+        if m:
+            size = (int(m.group(1)), int(m.group(2)))
+            continue
+        m = re.search(r'\(([\d.]+) fps\)', line)
+        if m and fourcc and size:
+            modes.append((fourcc, size[0], size[1], float(m.group(1))))
+    return modes
+
+
+def choose_capture_mode(modes, model_size=(640, 640), fourcc='MJPG', min_fps=15):
+    """
+    从摄像头支持的模式中选择采集模式: 宽高比最接近模型输入 (letterbox 填充和 resize 的工作量最小),
+    其次分辨率最接近且不小于模型输入 (不浪费带宽和缩放时间), 再其次帧率最高。
+    model_size 为 (宽, 高); 返回 (fourcc, width, height, fps), 没有可用模式时返回 None。
+    """
+    candidates = [m for m in modes if m[0] == fourcc and m[3] >= min_fps] or [m for m in modes if m[3] >= min_fps]
+    if not candidates:
+        return None
+    target_aspect = model_size[0] / model_size[1]
+
+    def cost(mode):
+        _, w, h, fps = mode
+        too_small = w < model_size[0] or h < model_size[1]
+        return (round(abs(w / h - target_aspect), 2), too_small, w * h, -fps)
+    return min(candidates, key=cost)
+
+
+def _v4l2_device(source):
+    if isinstance(source, int):
+        return source
+    if isinstance(source, str) and re.fullmatch(r'\d+', source):
+        return int(source)
+    if isinstance(source, str) and source.startswith('/dev/video'):
+        return source
+    return None
+
+
+def open_capture(source, fourcc=None, width=None, height=None, fps=None, auto_mode=False,
+                 model_size=(640, 640), replay_fps=None, loop=False):
+    """
+    打开采集源, 返回与 cv2.VideoCapture 接口相同的对象 (调用者检查 isOpened())。
+    fourcc / width / height / fps: 只对 V4L2 摄像头有效, 不指定时使用驱动默认的协商结果
+    auto_mode: V4L2 摄像头未指定分辨率时, 按 choose_capture_mode 自动选择 (需要 v4l2-ctl)
+    replay_fps / loop: 图片目录回放的帧率和是否循环
+    """
+    device = _v4l2_device(source)
+    if device is not None:
+        if auto_mode and width is None:
+            mode = choose_capture_mode(list_v4l2_modes(device if isinstance(device, str) else f'/dev/video{device}'),
+                                       model_size=model_size, fourcc=fourcc or 'MJPG')
+            if mode is not None:
+                fourcc, width, height, fps = mode[0], mode[1], mode[2], fps or mode[3]
+                print(f"--> Capture mode: {fourcc} {width}x{height} @ {fps:g} fps")
+        if fourcc is None and width is None and fps is None:
+            return cv2.VideoCapture(device)
+        cap = cv2.VideoCapture(device, cv2.CAP_V4L2)
+        # fourcc 要在分辨率之前设置, 否则部分驱动会按 YUYV 协商分辨率
+        if fourcc:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        if width and height:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        if fps:
+            cap.set(cv2.CAP_PROP_FPS, fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    if '!' in source:
+        return cv2.VideoCapture(source, cv2.CAP_GSTREAMER)
+    if os.path.isdir(source):
+        return ImageDirSource(source, fps=replay_fps, loop=loop)
+    return cv2.VideoCapture(source)
@@ -0,0 +1,108 @@
+# confirmation.py
+# 目标确认策略: 每帧输入目标类别的检测结果, 判断是否已经足够确定"找到了目标"。
+#   consecutive - 原来的逻辑: 连续 N 帧检测到目标才算成功, 中间漏检一帧就从头开始
+#   evidence    - 在时间窗口内累积证据, 每次检测贡献 分数 x 框位置一致性 (与上一次检测框的 IoU),
+#                 证据足够时立即确认; 漏检一帧不清零, 高置信度的目标可以比 N 帧更早确认
+# 两种策略接口相同:
+#   update(boxes, scores, timestamp) -> bool   boxes/scores 只包含目标类别, timestamp 为 time.perf_counter()
+#   reset()
+#   progress_text()                            实时画面上显示的进度
+#   decision_s                                 确认时, 从第一次看到目标到确认所用的时间 (秒)
+
+from collections import deque
+import numpy as np
+
+
+def box_iou(a, b):
+    """两个 (x, y, w, h) 框的 IoU"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+class ConsecutiveConfirmer:
+    def __init__(self, frames=5):
+        self.frames = frames
+        self.reset()
+
+    def reset(self):
+        self.counter = 0
+        self.first_seen = None
+        self.decision_s = None
+
+    def update(self, boxes, scores, timestamp):
+        if len(scores):
+            if self.counter == 0:
+                self.first_seen = timestamp
+            self.counter += 1
+        else:
+            self.counter = 0  # 如果断了，就重置计数器
+            self.first_seen = None
+        if self.counter >= self.frames:
+            self.decision_s = timestamp - self.first_seen
+            return True
+        return False
+
+    def progress_text(self):
+        return f"Confirming: {self.counter}/{self.frames}" if self.counter > 0 else None
+
+
+class EvidenceConfirmer:
+    def __init__(self, window_s=1.0, evidence=2.5, min_frames=2, first_weight=0.5):
+        """
+        window_s: 只累计最近 window_s 秒内的检测
+        evidence: 确认所需的证据总量 (默认约等于 4 帧 0.8 分、位置稳定的检测)
+        min_frames: 至少需要的检测帧数, 防止单帧误检直接确认
+        first_weight: 窗口内第一次检测没有可比较的上一个框, 位置一致性按该值计
+        """
+        self.window_s = window_s
+        self.evidence = evidence
+        self.min_frames = min_frames
+        self.first_weight = first_weight
+        self.reset()
+
+    def reset(self):
+        self._history = deque()  # (timestamp, 证据)
+        self._last_box = None
+        self.total = 0.0
+        self.first_seen = None
+        self.decision_s = None
+
+    def update(self, boxes, scores, timestamp):
+        while self._history and timestamp - self._history[0][0] > self.window_s:
+            self.total -= self._history.popleft()[1]
+        if not self._history:
+            self.total = 0.0  # 窗口已清空, 同时消除浮点累计误差
+            self._last_box = None
+            self.first_seen = None
+        if len(scores):
+            best = int(np.argmax(scores))
+            box = boxes[best]
+            consistency = box_iou(box, self._last_box) if self._last_box is not None else self.first_weight
+            weight = float(scores[best]) * consistency
+            self._history.append((timestamp, weight))
+            self.total += weight
+            self._last_box = box
+            if self.first_seen is None:
+                self.first_seen = timestamp
+        if self.total >= self.evidence and len(self._history) >= self.min_frames:
+            self.decision_s = timestamp - self.first_seen
+            return True
+        return False
+
+    def progress_text(self):
+        return f"Evidence: {self.total:.1f}/{self.evidence:.1f}" if self._history else None
+
+
+CONFIRMERS = ('consecutive', 'evidence')
+
+
+def create_confirmer(name, **kwargs):
+    """按名称创建确认策略, 关键字参数传给对应的类"""
+    if name == 'consecutive':
+        return ConsecutiveConfirmer(**kwargs)
+    if name == 'evidence':
+        return EvidenceConfirmer(**kwargs)
+    raise ValueError(f"Unknown confirmation strategy '{name}', choose from {CONFIRMERS}")
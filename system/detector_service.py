@@ -0,0 +1,485 @@
+# detector_service.py
+# 常驻的检测服务: 模型只在这个进程里加载一次 (RKNN 的 init_runtime 要好几秒, 每个工具各加载一份还会重复占用 NPU 内存),
+# 其他程序 (1.py, final.py, 临时脚本) 通过 Unix socket 请求检测。
+#   帧数据: 客户端创建 multiprocessing.shared_memory, 把帧拷进去, 服务端直接在共享内存上做 letterbox, 不经过 socket
+#   消息:   socket 上只传很小的 JSON (4 字节大端长度 + UTF-8 JSON)
+#   批处理: 工作线程每次取出队列中已有的请求 (最多 max_batch 个, 第一个到达后最多再等 batch_wait_s),
+#           使用 NPU 上下文池时一批请求同时提交到多个核心; 其他后端按顺序推理, 只节省线程切换和唤醒
+#   背压:   等待队列满时立即回复 busy, 客户端抛出 ServiceBusy, 由调用者决定丢帧还是重试
+#
+# 启动服务: python3 detector_service.py --backend rknn --model_path ./yolov5.rknn --npu_pool
+#           python3 detector_service.py --backend onnx --model_path yolov5s.onnx   (开发机上用 CPU 测试)
+# 测试客户端: python3 detector_service.py --client ../vision_module/Dataset/images/val --clients 2
+
+import argparse
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import wait
+from multiprocessing import shared_memory
+import numpy as np
+from backends import BACKENDS, create_backend
+from model_set import load_model_info
+from vision_module import CLASSES, IMG_SIZE, Detection, Letterbox, postprocess
+
+SOCKET_PATH = '/tmp/detector.sock'
+_HEADER = struct.Struct('>I')
+
+ServiceResult = namedtuple('ServiceResult', ['detections', 'queue_ms', 'infer_ms'])
+_created_shm = set()  # 本进程中客户端创建的共享内存 (服务和客户端在同一进程时, 不能重复从 resource_tracker 注销)
+
+
+class ServiceBusy(RuntimeError):
+    """服务端等待队列已满, 本次请求被拒绝"""
+
+
+def send_msg(sock, obj):
+    data = json.dumps(obj).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_msg(sock):
+    """读取一条消息, 对端关闭连接时返回 None"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, _HEADER.unpack(header)[0])
+    return None if data is None else json.loads(data.decode('utf-8'))
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _attach_shm(name):
+    """打开客户端创建的共享内存; 不交给本进程的 resource_tracker 管理, 否则服务退出时会把它删掉"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _created_shm:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _frame_view(shm, shape, offset):
+    """共享内存中 offset 处形状为 shape 的 uint8 帧 (不拷贝); shape / offset 来自客户端, 不合法时抛出 ValueError"""
+    if not (isinstance(shape, list) and len(shape) == 3 and
+            all(isinstance(v, int) and not isinstance(v, bool) and v > 0 for v in shape) and shape[2] == 3):
+        raise ValueError(f"invalid frame shape {shape!r}, expected [H, W, 3]")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise ValueError(f"invalid frame offset {offset!r}")
+    nbytes = shape[0] * shape[1] * shape[2]  # dtype 为 uint8, 每个元素 1 字节
+    if offset + nbytes > shm.size:
+        raise ValueError(f"frame {shape} at offset {offset} exceeds the {shm.size}-byte shared memory")
+    return np.ndarray(tuple(shape), dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+        self.shm = None
+
+    def send(self, obj):
+        with self.send_lock:
+            try:
+                send_msg(self.sock, obj)
+            except OSError:
+                pass  # 客户端已断开
+
+    def close(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except BufferError:
+                pass  # 还有请求引用着这块内存, 交给垃圾回收
+            self.shm = None
+        self.sock.close()
+
+
+class _Request:
+    __slots__ = ('conn', 'id', 'frame', 'target', 'received')
+
+    def __init__(self, conn, req_id, frame, target):
+        self.conn = conn
+        self.id = req_id
+        self.frame = frame
+        self.target = target
+        self.received = time.perf_counter()
+
+
+class DetectorService:
+    def __init__(self, model_path, backend='rknn', socket_path=SOCKET_PATH, num_threads=4, npu_pool=False,
+                 max_batch=4, batch_wait_s=0.002, max_pending=16, runtime_cls=None):
+        info = load_model_info(model_path, default_size=IMG_SIZE, default_classes=CLASSES)
+        self.img_size = info.img_size
+        self.anchors = info.anchors
+        self.classes = info.classes
+        self.backend = create_backend(backend, model_path, num_threads=num_threads,
+                                      runtime_cls=runtime_cls, npu_pool=npu_pool)
+        self.pooled = hasattr(self.backend, 'submit')
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.batch_wait_s = batch_wait_s
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._letterboxes = {}
+        self._running = False
+        self._server = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'rejected': 0, 'errors': 0, 'batches': 0, 'infer_s': 0.0}
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # 上次异常退出留下的 socket 文件
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen()
+        self._server.settimeout(0.5)  # accept 定期返回, 以便 stop() 时退出
+        self._running = True
+        self._threads = [threading.Thread(target=self._accept_loop, daemon=True),
+                         threading.Thread(target=self._worker_loop, daemon=True)]
+        for t in self._threads:
+            t.start()
+        print(f"--> Detector service listening on {self.socket_path} "
+              f"(input {self.img_size}, max_batch {self.max_batch}, max_pending {self._queue.maxsize})")
+        return self
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while self._running:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._running = False
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for t in self._threads:
+            t.join(timeout=2.0)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.backend.release()
+
+    def stats(self):
+        with self._lock:
+            c = dict(self.counters)
+        c['avg_batch'] = (c['requests'] - c['rejected'] - c['errors']) / c['batches'] if c['batches'] else 0.0
+        c['pending'] = self._queue.qsize()
+        return c
+
+    # --- socket ---
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            sock.settimeout(None)
+            threading.Thread(target=self._client_loop, args=(_Connection(sock),), daemon=True).start()
+
+    def _client_loop(self, conn):
+        try:
+            while self._running:
+                msg = recv_msg(conn.sock)
+                if msg is None:
+                    return
+                op = msg.get('op')
+                if op == 'attach':
+                    conn.shm = _attach_shm(msg['shm'])
+                    conn.send({'op': 'attach', 'img_size': self.img_size, 'classes': list(self.classes)})
+                elif op == 'detect':
+                    self._enqueue(conn, msg)
+                elif op == 'stats':
+                    conn.send({'op': 'stats', 'stats': self.stats()})
+                else:
+                    conn.send({'id': msg.get('id'), 'error': f"unknown op '{op}'"})
+        except (OSError, ValueError, KeyError) as e:
+            print(f"--> Client error: {e}")
+        finally:
+            conn.close()
+
+    def _enqueue(self, conn, msg):
+        with self._lock:
+            self.counters['requests'] += 1
+        if conn.shm is None:
+            conn.send({'id': msg['id'], 'error': 'no shared memory attached'})
+            return
+        try:
+            frame = _frame_view(conn.shm, msg.get('shape'), msg.get('offset'))
+        except ValueError as e:
+            conn.send({'id': msg['id'], 'error': str(e)})
+            return
+        target = self.classes.index(msg['target']) if msg.get('target') in self.classes else None
+        try:
+            self._queue.put_nowait(_Request(conn, msg['id'], frame, target))
+        except queue.Full:
+            with self._lock:
+                self.counters['rejected'] += 1
+            conn.send({'id': msg['id'], 'error': 'busy'})
+
+    # --- 推理 ---
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _preprocess(self, frame):
+        letterbox = self._letterboxes.get(frame.shape[:2])
+        if letterbox is None:
+            # 一批中的每个请求各占一个输入缓冲区
+            letterbox = self._letterboxes[frame.shape[:2]] = Letterbox(
+                frame.shape, new_shape=(self.img_size, self.img_size), num_buffers=self.max_batch)
+        return letterbox(frame)
+
+    def _worker_loop(self):
+        while self._running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            # 一次推理失败 (如 NPU 偶发错误) 只让相关的请求收到 error, 工作线程继续运行
+            t0 = time.perf_counter()
+            try:
+                inputs = [self._preprocess(req.frame) for req in batch]
+                if self.pooled:
+                    futures = [self.backend.submit(inputs=[img]) for img, _, _ in inputs]
+                    wait(futures)  # 出错时也等整批结束, 下一批才能复用输入缓冲区
+                    outputs = [f.result() for f in futures]
+                else:
+                    outputs = [self.backend.inference(inputs=[img]) for img, _, _ in inputs]
+            except Exception as e:
+                for req in batch:
+                    self._fail(req, e)
+                continue
+            infer_s = time.perf_counter() - t0
+            with self._lock:
+                self.counters['batches'] += 1
+                self.counters['infer_s'] += infer_s
+            for req, (_, ratio, pad), out in zip(batch, inputs, outputs):
+                try:
+                    boxes, scores, class_ids = postprocess(out, ratio, pad, target_class=req.target,
+                                                            anchors=self.anchors)
+                except Exception as e:
+                    self._fail(req, e)
+                    continue
+                req.frame = None  # 释放对共享内存的引用
+                req.conn.send({
+                    'id': req.id,
+                    'detections': [[self.classes[cid], float(score), [float(v) for v in box]]
+                                   for box, score, cid in zip(boxes, scores, class_ids)],
+                    'queue_ms': (t0 - req.received) * 1000,
+                    'infer_ms': infer_s / len(batch) * 1000,
+                })
+
+    def _fail(self, req, error):
+        print(f"--> Request {req.id} failed: {error!r}")
+        with self._lock:
+            self.counters['errors'] += 1
+        req.frame = None
+        req.conn.send({'id': req.id, 'error': str(error) or type(error).__name__})
+
+
+class DetectorClient:
+    def __init__(self, frame_shape, socket_path=SOCKET_PATH, slots=2, timeout=5.0):
+        """
+        frame_shape: 要发送的帧的形状 (H, W, 3), 共享内存按它分配 slots 个帧槽,
+                     最多同时有 slots 个请求在途, 超过时 submit 等待最早的请求完成
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self.slots = slots
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+        _created_shm.add(self.shm.name)
+        self._frames = [np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self.shm.buf,
+                                   offset=i * self.frame_bytes) for i in range(slots)]
+        self._cond = threading.Condition()
+        self._replies = {}
+        self._in_flight = set()
+        self._next_id = 0
+        self._closed = False
+        send_msg(self.sock, {'op': 'attach', 'shm': self.shm.name})
+        reply = recv_msg(self.sock)
+        if reply is None:
+            raise RuntimeError("Detector service closed the connection")
+        self.img_size, self.classes = reply['img_size'], tuple(reply['classes'])
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        while True:
+            try:
+                msg = recv_msg(self.sock)
+            except OSError:
+                msg = None
+            with self._cond:
+                if msg is None:
+                    self._closed = True
+                    self._cond.notify_all()
+                    return
+                self._replies[msg.get('id', msg.get('op'))] = msg
+                self._in_flight.discard(msg.get('id'))
+                self._cond.notify_all()
+
+    def submit(self, frame, target=None):
+        """把 frame 拷贝到共享内存并发送请求, 返回请求编号 (用 result 取结果)"""
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the client's {self.frame_shape}")
+        with self._cond:
+            req_id = self._next_id
+            slot = req_id % self.slots
+            # 帧槽还被上一轮的请求占用时等待它完成
+            if not self._cond.wait_for(lambda: req_id - self.slots not in self._in_flight or self._closed,
+                                       self.timeout):
+                raise TimeoutError("Detector service did not answer in time")
+            if self._closed:
+                raise RuntimeError("Detector service closed the connection")
+            self._next_id += 1
+            self._in_flight.add(req_id)
+        np.copyto(self._frames[slot], frame)
+        send_msg(self.sock, {'op': 'detect', 'id': req_id, 'offset': slot * self.frame_bytes,
+                             'shape': list(self.frame_shape), 'target': target})
+        return req_id
+
+    def result(self, req_id, timeout=None):
+        """等待请求的结果, 返回 ServiceResult; 服务繁忙时抛出 ServiceBusy"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: req_id in self._replies or self._closed, timeout or self.timeout):
+                raise TimeoutError("Detector service did not answer in time")
+            if req_id not in self._replies:
+                raise RuntimeError("Detector service closed the connection")
+            msg = self._replies.pop(req_id)
+        if msg.get('error') == 'busy':
+            raise ServiceBusy("Detector service is busy")
+        if 'error' in msg:
+            raise RuntimeError(f"Detector service error: {msg['error']}")
+        detections = [Detection(label, score, tuple(box)) for label, score, box in msg['detections']]
+        return ServiceResult(detections, msg['queue_ms'], msg['infer_ms'])
+
+    def detect(self, frame, target=None):
+        """同步检测一帧, target 为类别名时服务端只解码该类别"""
+        return self.result(self.submit(frame, target))
+
+    def stats(self):
+        send_msg(self.sock, {'op': 'stats'})
+        with self._cond:
+            self._cond.wait_for(lambda: 'stats' in self._replies or self._closed, self.timeout)
+            return self._replies.pop('stats', {}).get('stats')
+
+    def close(self):
+        self.sock.close()
+        self._reader.join(timeout=1.0)
+        self._frames = []
+        self.shm.close()
+        self.shm.unlink()
+        _created_shm.discard(self.shm.name)
+
+
+def run_clients(args):
+    """测试客户端: 多个客户端并发地把图片目录中的图片发给服务, 统计吞吐量和被拒绝的请求"""
+    import cv2
+    from camera import ImageDirSource
+    frames = []
+    source = ImageDirSource(args.client)
+    while True:
+        ret, frame = source.read()
+        if not ret:
+            break
+        frames.append(frame)
+    if not frames:
+        exit(f"No images found in {args.client}")
+    shape = frames[0].shape
+    frames = [f if f.shape == shape else cv2.resize(f, (shape[1], shape[0])) for f in frames]
+    results = {'done': 0, 'busy': 0}
+    lock = threading.Lock()
+
+    def worker(index):
+        client = DetectorClient(shape, socket_path=args.socket, slots=args.slots)
+        pending = []
+        for frame in frames[index::args.clients]:
+            pending.append(client.submit(frame, args.target))
+            if len(pending) >= args.slots:
+                _collect(client, pending.pop(0))
+        for req_id in pending:
+            _collect(client, req_id)
+        client.close()
+
+    def _collect(client, req_id):
+        try:
+            client.result(req_id)
+            key = 'done'
+        except ServiceBusy:
+            key = 'busy'
+        with lock:
+            results[key] += 1
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    client = DetectorClient(shape, socket_path=args.socket, slots=1)
+    print(f"{results['done']} frames in {elapsed:.2f}s ({results['done'] / elapsed:.1f} FPS), "
+          f"{results['busy']} rejected as busy | server: {client.stats()}")
+    client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Long-lived detector service over a Unix socket")
+    parser.add_argument('--socket', type=str, default=SOCKET_PATH, help='Unix socket path')
+    parser.add_argument('--backend', choices=BACKENDS, default='rknn')
+    parser.add_argument('--model_path', type=str, default='./yolov5.rknn')
+    parser.add_argument('--threads', type=int, default=4, help='CPU threads for the onnx / opencv backends')
+    parser.add_argument('--npu_pool', action='store_true', help='One RKNN context per NPU core')
+    parser.add_argument('--max_batch', type=int, default=4, help='Max requests processed per batch')
+    parser.add_argument('--batch_wait_ms', type=float, default=2.0, help='Wait for more requests after the first')
+    parser.add_argument('--max_pending', type=int, default=16, help='Queue size before requests are rejected as busy')
+    parser.add_argument('--client', type=str, default=None,
+                        help='Run as a test client sending the images in this directory')
+    parser.add_argument('--clients', type=int, default=2, help='Concurrent test clients')
+    parser.add_argument('--slots', type=int, default=2, help='Requests in flight per test client')
+    parser.add_argument('--target', type=str, default=None, help='Only decode this class in the test client')
+    args = parser.parse_args()
+    if args.client:
+        run_clients(args)
+    else:
+        try:
+            service = DetectorService(args.model_path, backend=args.backend, socket_path=args.socket,
+                                      num_threads=args.threads, npu_pool=args.npu_pool, max_batch=args.max_batch,
+                                      batch_wait_s=args.batch_wait_ms / 1000, max_pending=args.max_pending)
+        except RuntimeError as e:
+            exit(str(e))
+        service.serve_forever()
@@ -0,0 +1,256 @@
+# evaluate_map.py
+# 离线精度评估: 在 Dataset/images/val 上运行任意推理后端, 计算每个类别的 AP@0.5 / AP@0.5:0.95 和 mAP,
+# 并和推理延迟一起写成每个模型一份的 "精度 vs 延迟" 报告, 用来判断更快的模型 (更小输入 / INT8 / 拆分检测头)
+# 是否仍然够用, 不再靠肉眼看 final.py 的输出图片。
+#   onnx / opencv : CPU 上运行导出的 .onnx (backends.py)
+#   rknn          : 板子上的 RKNNLite 运行 .rknn
+#   rknn_sim      : x86 上用 rknn-toolkit2 从 .onnx 构建后在模拟器中运行 (--quant fp16/int8, 见 convert_rknn/convert.py)
+#   recorded      : 录制的输出目录, 每张图片一个 <名字>.npy (final.py --save_raw) 或 .npz (多个输出)
+# 推理、解码和匹配分块交给进程池 (--workers); 测延迟时建议 --workers 1, 否则各进程会互相争抢 CPU。
+# 标签读取、评估用的 NMS、匹配 (与 YOLOv5 val.py 相同) 和 101 点插值的 AP 都来自 convert_rknn/sim_eval.py,
+# 和 convert.py / convert_matrix.py / analyze.py 报告的 mAP@0.5 是同一个定义。
+#
+# 运行: python3 evaluate_map.py --backend onnx --models best_320.onnx best_640.onnx --workers 4
+#       python3 evaluate_map.py --backend rknn_sim --models best.onnx --quant int8
+#       python3 evaluate_map.py --backend recorded --models raw_outputs --img_size 640
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from model_set import load_model_info
+from quantized import dense_candidates, is_quantized, output_params
+from vision_module import CLASSES, IMG_SIZE
+from yolo_heads import decode_heads, is_raw_heads
+
+VISION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vision_module')
+CONVERT_DIR = os.path.join(VISION_DIR, 'convert_rknn')
+sys.path.append(CONVERT_DIR)
+import sim_eval  # 不依赖 rknn-toolkit2
+from sim_eval import EVAL_CONF_THRESHOLD, PackedDataset, match, pack_dir
+
+IMAGE_DIR = os.path.join(VISION_DIR, 'Dataset', 'images', 'val')
+BACKEND_CHOICES = ('onnx', 'opencv', 'rknn', 'rknn_sim', 'recorded')
+
+
+# --- 数据 ---
+def open_packed(image_dir, img_size):
+    """vision_module/pack_dataset.py 打包过同一 split 和输入尺寸时返回 PackedDataset, 否则返回 None"""
+    dataset_dir = os.path.dirname(os.path.dirname(os.path.abspath(image_dir)))
+    path = pack_dir(os.path.basename(os.path.normpath(image_dir)), img_size, dataset_dir)
+    return PackedDataset(path) if os.path.exists(os.path.join(path, 'meta.json')) else None
+
+
+def list_items(image_dir, img_size, limit=None, use_packed=True):
+    """返回 [(名字, 图片路径或打包数据集中的下标)] 和是否使用打包数据集"""
+    packed = open_packed(image_dir, img_size) if use_packed else None
+    if packed is not None:
+        items = [(os.path.splitext(name)[0], i) for i, name in enumerate(packed.names)]
+    else:
+        names = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(sim_eval.IMAGE_EXTS))
+        items = [(os.path.splitext(name)[0], os.path.join(image_dir, name)) for name in names]
+    return items[:limit] if limit else items, packed is not None
+
+
+# --- 解码 ---
+def decode(outputs, ratio, pad, anchors=None, quant=None):
+    """
+    模型输出 -> 原图上的 (x1, y1, x2, y2) 框、分数、类别。
+    候选行用检测程序的方式取得 (拆分检测头只解码通过阈值的格子, int8 输出在量化域中筛选), 之后与 sim_eval 相同
+    """
+    if is_raw_heads(outputs):
+        predictions = decode_heads(outputs, EVAL_CONF_THRESHOLD, anchors, quant)
+    elif is_quantized(outputs[0]):
+        predictions = dense_candidates(outputs[0], EVAL_CONF_THRESHOLD, output_params(outputs, 0, quant))
+    else:
+        predictions = np.squeeze(outputs[0], axis=0)
+    return sim_eval.decode_predictions(predictions, ratio, pad)
+
+
+# --- 推理后端 (在每个工作进程中创建) ---
+def _import_convert():
+    """vision_module/convert_rknn/convert.py (依赖 rknn-toolkit2, 只能在 x86 开发机上使用)"""
+    import convert
+    return convert
+
+
+def model_input_size(backend, model, img_size=None):
+    """模型输入尺寸: --img_size > ONNX 输入形状 > 模型元数据 (.json) / 文件名"""
+    if img_size:
+        return img_size
+    if backend == 'recorded':
+        return IMG_SIZE
+    if model.endswith('.onnx'):
+        import onnx
+        dims = onnx.load(model).graph.input[0].type.tensor_type.shape.dim
+        if dims[2].dim_value:
+            return dims[2].dim_value
+    return load_model_info(model, default_size=IMG_SIZE).img_size
+
+
+def create_runtime(backend, model, opts):
+    """返回 (infer(img, name) -> 输出列表或 None, anchors, quant)"""
+    if backend == 'recorded':
+        def infer(img, name):
+            path = os.path.join(model, name)
+            if os.path.exists(path + '.npz'):
+                data = np.load(path + '.npz')
+                return [data[k] for k in sorted(data.files)]
+            if os.path.exists(path + '.npy'):
+                return [np.load(path + '.npy')]
+            return None
+        return infer, None, None
+    if backend == 'rknn_sim':
+        convert = _import_convert()
+        rknn = convert.build_rknn(model, opts['platform'], quantize=opts['quant'] == 'int8',
+                                  dataset=opts['dataset'], verbose=False)
+        if rknn.init_runtime() != 0:
+            raise RuntimeError('Failed to init the RKNN simulator')
+        anchors = sim_eval.onnx_head_anchors(model)
+        return (lambda img, name: rknn.inference(inputs=[img], data_format='nhwc'),
+                None if anchors == 'default' else anchors, None)
+    from backends import create_backend
+    info = load_model_info(model, default_size=opts['img_size'], default_classes=CLASSES)
+    runtime = create_backend(backend, model, num_threads=opts['threads'], want_float=info.quant is None)
+    return lambda img, name: runtime.inference(inputs=[img]), info.anchors, info.quant
+
+
+_worker = {}
+
+
+def _init_worker(backend, model, opts):
+    infer, anchors, quant = create_runtime(backend, model, opts)
+    packed = open_packed(opts['image_dir'], opts['img_size']) if opts['packed'] else None
+    _worker.update(infer=infer, img_size=opts['img_size'], anchors=anchors, quant=quant, packed=packed)
+
+
+def _run_chunk(items):
+    """在工作进程中处理一块图片, 返回逐张的 (correct, scores, pred_cls, gt_cls, inference_ms, decode_ms)"""
+    results = []
+    for name, source in items:
+        sample = sim_eval.load_sample(source, _worker['img_size'], _worker['packed'])
+        if sample is None:
+            continue
+        inp, ratio, pad, gt_cls, gt_boxes = sample
+        t0 = time.perf_counter()
+        outputs = _worker['infer'](inp, name)
+        t1 = time.perf_counter()
+        if outputs is None:  # recorded: 这张图片没有录制的输出
+            continue
+        boxes, scores, class_ids = decode(outputs, ratio, pad, _worker['anchors'], _worker['quant'])
+        t2 = time.perf_counter()
+        results.append((match(boxes, class_ids, gt_boxes, gt_cls), scores, class_ids, gt_cls,
+                        (t1 - t0) * 1000, (t2 - t1) * 1000))
+    return results
+
+
+def evaluate_model(backend, model, opts):
+    """评估一个模型, 返回报告字典"""
+    img_size = model_input_size(backend, model, opts['img_size'])
+    if backend == 'rknn_sim' and opts['quant'] == 'int8' and not opts['dataset']:
+        # 所有工作进程共用一份校准列表
+        opts = dict(opts, dataset=os.path.abspath(os.path.join(opts['out_dir'], 'dataset.txt')))
+        sim_eval.make_calibration_list(opts['dataset'], img_size=img_size)
+    items, packed = list_items(opts['image_dir'], img_size, opts['limit'], opts['use_packed'])
+    opts = dict(opts, img_size=img_size, packed=packed)
+    t_start = time.perf_counter()
+    workers = max(1, min(opts['workers'], len(items)))
+    if workers == 1:
+        _init_worker(backend, model, opts)
+        results = _run_chunk(items)
+    else:
+        chunk = max(1, len(items) // (workers * 4))
+        chunks = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+        # rknn-toolkit2 不是 fork 安全的, 子进程用 spawn 启动
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(backend, model, opts)) as pool:
+            results = [r for part in pool.map(_run_chunk, chunks) for r in part]
+    wall_s = time.perf_counter() - t_start
+    if not results:
+        raise RuntimeError(f'No images evaluated for {model}')
+
+    summary = sim_eval.summarize([r[:4] for r in results], len(CLASSES))
+    inference_ms = np.array([r[4] for r in results])
+    decode_ms = np.array([r[5] for r in results])
+    report = {
+        'model': os.path.abspath(model),
+        'backend': backend,
+        'quant': opts['quant'] if backend == 'rknn_sim' else None,
+        'img_size': img_size,
+        'model_size_mb': os.path.getsize(model) / 1e6 if os.path.isfile(model) else None,
+        'images': len(results),
+        'packed_dataset': packed,
+        **summary,
+        'workers': workers,
+        'wall_s': wall_s,
+    }
+    if backend != 'recorded':
+        report['latency_ms'] = {'mean': float(inference_ms.mean()), 'p50': float(np.percentile(inference_ms, 50)),
+                                'p95': float(np.percentile(inference_ms, 95))}
+        report['fps'] = 1000.0 / float(inference_ms.mean())
+    report['decode_ms'] = float(decode_ms.mean())
+    return report
+
+
+def print_report(report):
+    lat = report.get('latency_ms')
+    latency = f"{lat['mean']:.1f} ms (p95 {lat['p95']:.1f})" if lat else 'n/a (recorded)'
+    print(f"\n{os.path.basename(report['model'])} [{report['backend']}"
+          f"{', ' + report['quant'] if report['quant'] else ''}, {report['img_size']}px]: "
+          f"mAP@0.5 {report['map50']:.4f} | mAP@0.5:0.95 {report['map50_95']:.4f} | "
+          f"inference {latency} | decode {report['decode_ms']:.2f} ms | {report['images']} images")
+    for name, r in report['per_class'].items():
+        print(f"  {name:<16} AP@0.5 {r['ap50']:.3f}  AP@0.5:0.95 {r['ap50_95']:.3f}  ({r['labels']} labels)")
+
+
+def main(args):
+    opts = {'img_size': args.img_size, 'threads': args.threads, 'platform': args.platform, 'quant': args.quant,
+            'dataset': args.dataset, 'image_dir': args.images, 'limit': args.limit, 'workers': args.workers,
+            'use_packed': not args.no_packed, 'out_dir': args.out_dir}
+    os.makedirs(args.out_dir, exist_ok=True)
+    reports = []
+    for model in args.models:
+        try:
+            report = evaluate_model(args.backend, model, opts)
+        except RuntimeError as e:
+            print(f"--> {model}: {e}")
+            continue
+        print_report(report)
+        stem = os.path.splitext(os.path.basename(os.path.normpath(model)))[0]
+        suffix = f"_{args.quant}" if args.backend == 'rknn_sim' else ''
+        path = os.path.join(args.out_dir, f"{stem}_{args.backend}{suffix}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"--> Report saved to {path}")
+        reports.append(report)
+    if len(reports) > 1:
+        print('\n' + '=' * 84)
+        print(f"{'model':<32} {'input':>5} {'mAP@.5':>8} {'mAP@.5:.95':>11} {'latency ms':>11} {'FPS':>7}")
+        for r in sorted(reports, key=lambda r: r.get('latency_ms', {}).get('mean', 0)):
+            lat = r.get('latency_ms')
+            print(f"{os.path.basename(r['model'])[:32]:<32} {r['img_size']:>5} {r['map50']:8.4f} {r['map50_95']:11.4f} "
+                  f"{(lat['mean'] if lat else float('nan')):11.1f} {r.get('fps', float('nan')):7.1f}")
+        print('=' * 84)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="mAP evaluation on Dataset/images/val with an accuracy-vs-latency report")
+    parser.add_argument('--backend', choices=BACKEND_CHOICES, default='onnx')
+    parser.add_argument('--models', nargs='+', required=True,
+                        help='Model files (.onnx / .rknn), or recorded output directories for --backend recorded')
+    parser.add_argument('--images', type=str, default=IMAGE_DIR, help='Validation images (labels in ../../labels/<split>)')
+    parser.add_argument('--img_size', type=int, default=None, help='Override the model input size')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N images')
+    parser.add_argument('--workers', type=int, default=1, help='Processes for inference and matching')
+    parser.add_argument('--threads', type=int, default=4, help='CPU threads per process for the onnx / opencv backends')
+    parser.add_argument('--platform', type=str, default='rk3588', help='rknn_sim: target platform')
+    parser.add_argument('--quant', choices=('fp16', 'int8'), default='fp16', help='rknn_sim: build FP16 or INT8')
+    parser.add_argument('--dataset', type=str, default=None, help='rknn_sim: INT8 calibration list')
+    parser.add_argument('--no_packed', action='store_true', help='Decode the JPEGs even if a packed dataset exists')
+    parser.add_argument('--out_dir', type=str, default='eval_reports', help='Where the per-model reports go')
+    main(parser.parse_args())
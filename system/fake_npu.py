@@ -0,0 +1,118 @@
+# fake_npu.py
+# 模拟 RKNNLite 接口的假 NPU, 用于在没有 RK3588 的开发机上跑通视觉流程和测量流水线效果。
+# 推理时 sleep 指定的延迟 (释放 GIL, 和真实 NPU 一样不占用 CPU), 返回录制好的输出或全零输出。
+
+import time
+import numpy as np
+
+
+def num_output_rows(img_size):
+    """YOLOv5 三个检测头 (stride 8/16/32, 每个 3 个 anchor) 的总行数, 640 -> 25200"""
+    return sum(3 * (img_size // s) ** 2 for s in (8, 16, 32))
+
+
+def synthetic_outputs(img_size=640, num_objects=3, num_classes=10, rows_per_object=40, seed=None):
+    """
+    生成与 YOLOv5 解码后输出形状相同的模拟数据 [1, rows, 5 + num_classes]:
+    大部分行是低置信度背景, 每个目标周围有一簇高置信度、互相重叠的候选框 (和真实输出一样需要 NMS)。
+    """
+    rng = np.random.default_rng(seed)
+    rows = num_output_rows(img_size)
+    out = np.empty((rows, 5 + num_classes), dtype=np.float32)
+    out[:, 0:2] = rng.uniform(0, img_size, (rows, 2))
+    out[:, 2:4] = rng.uniform(4, img_size / 4, (rows, 2))
+    out[:, 4] = rng.uniform(0, 0.02, rows)
+    out[:, 5:] = rng.uniform(0, 0.1, (rows, num_classes))
+    for _ in range(num_objects):
+        idx = rng.choice(rows, rows_per_object, replace=False)
+        center = rng.uniform(img_size * 0.2, img_size * 0.8, 2)
+        size = rng.uniform(img_size * 0.05, img_size * 0.3, 2)
+        out[idx, 0:2] = center + rng.normal(0, size.min() * 0.05, (rows_per_object, 2))
+        out[idx, 2:4] = size * rng.uniform(0.9, 1.1, (rows_per_object, 2))
+        out[idx, 4] = rng.uniform(0.5, 0.95, rows_per_object)
+        out[idx, 5 + rng.integers(num_classes)] = rng.uniform(0.7, 0.98, rows_per_object)
+    return out[None]
+
+
+def synthetic_raw_heads(img_size=640, num_objects=3, num_classes=10, seed=None):
+    """
+    生成 export.py --raw-heads 模型形状的模拟输出: 三个检测层的原始卷积结果 [1, 3 * (5 + num_classes), ny, nx]。
+    背景格子的 objectness logit 远低于阈值, 每个目标在某一层的一个 anchor 上有 3x3 个相邻格子通过阈值。
+    """
+    rng = np.random.default_rng(seed)
+    no = 5 + num_classes
+    heads = []
+    for s in (8, 16, 32):
+        n = img_size // s
+        out = rng.normal(0.0, 1.0, (3, no, n, n)).astype(np.float32)
+        out[:, 4] = rng.normal(-9.0, 1.5, (3, n, n))
+        out[:, 5:] = rng.normal(-6.0, 1.5, (3, num_classes, n, n))
+        heads.append(out)
+    for _ in range(num_objects):
+        out = heads[rng.integers(3)]
+        n = out.shape[-1]
+        a, cls = rng.integers(3), rng.integers(num_classes)
+        y, x = rng.integers(1, n - 1, 2)
+        out[a, 4, y - 1:y + 2, x - 1:x + 2] = rng.uniform(0.5, 4.0, (3, 3))
+        out[a, 5 + cls, y - 1:y + 2, x - 1:x + 2] = rng.uniform(1.0, 4.0, (3, 3))
+    return [h.reshape(1, 3 * no, *h.shape[2:]) for h in heads]
+
+
+class FakeRKNNLite:
+    NPU_CORE_AUTO = 0
+    NPU_CORE_0 = 1
+    NPU_CORE_1 = 2
+    NPU_CORE_2 = 4
+    NPU_CORE_0_1 = 3
+    NPU_CORE_0_1_2 = 7
+
+    def __init__(self, verbose=False, latency=0.03, outputs=None, num_classes=10, output_quant=None):
+        """
+        latency: 每次 inference 模拟的耗时 (秒)
+        outputs: 录制的模型输出, 可以是 .npy/.npz 文件路径或 ndarray 列表, 按顺序循环返回
+        output_quant: 模拟 INT8 模型输出的 quantized.QuantParams, inference(want_float=False) 时返回 int8 输出
+        """
+        self.output_quant = output_quant
+        self.verbose = verbose
+        self.latency = latency
+        self.num_classes = num_classes
+        self.core_mask = None
+        self._recorded = self._load_outputs(outputs)
+        self._index = 0
+
+    @staticmethod
+    def _load_outputs(outputs):
+        if outputs is None:
+            return []
+        if isinstance(outputs, str):
+            data = np.load(outputs)
+            if isinstance(data, np.lib.npyio.NpzFile):
+                return [data[k] for k in sorted(data.files)]
+            return [data] if data.ndim == 3 else list(data[:, None])
+        return list(outputs)
+
+    def load_rknn(self, path):
+        return 0
+
+    def init_runtime(self, core_mask=NPU_CORE_AUTO):
+        self.core_mask = core_mask
+        return 0
+
+    def inference(self, inputs, want_float=True):
+        img = inputs[0]
+        if self.latency:
+            time.sleep(self.latency)
+        if self._recorded:
+            out = self._recorded[self._index % len(self._recorded)]
+            self._index += 1
+        else:
+            out = np.zeros((1, num_output_rows(img.shape[1]), 5 + self.num_classes), dtype=np.float32)
+        if self.output_quant is not None:
+            from quantized import quantize
+            out = quantize(out, self.output_quant[0])
+            if want_float:  # 和真实运行时一样, 默认把 int8 输出全部反量化成 float
+                out = (out.astype(np.float32) - self.output_quant[0].zero_point) * self.output_quant[0].scale
+        return [out]
+
+    def release(self):
+        pass
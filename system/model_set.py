@@ -0,0 +1,146 @@
+# model_set.py
+# 多分辨率模型组: 同时加载同一个检测模型在不同输入尺寸 (如 320/416/640) 下转换出的多个 RKNN 模型,
+# 运行时按搜索阶段、帧延迟或小车速度在它们之间切换:
+#   扫描阶段 (还没看到目标) 用小尺寸模型, 快; 看到目标后切到最大尺寸模型确认, 准。
+# 每个模型旁边有一个同名的 .json 元数据文件 (convert.py 生成), 描述输入尺寸和类别:
+#   yolov5_320.rknn -> yolov5_320.json: {"img_size": 320, "classes": ["wrench", ...]}
+# 拆分检测头的模型 (export.py --raw-heads) 的元数据中还有 "anchors": 每层 [w0, h0, w1, h1, w2, h2] (像素)。
+# INT8 模型可以有 "output_quant": 每个输出的 [zero_point, scale], 有它时推理请求 int8 原始输出 (见 quantized.py)。
+# 没有元数据文件时从文件名中的 _<尺寸> 推断输入尺寸, 否则使用默认值。
+
+import json
+import os
+import re
+from collections import namedtuple
+from quantized import QuantParams
+
+ModelInfo = namedtuple('ModelInfo', ['path', 'img_size', 'classes', 'anchors', 'quant'], defaults=(None, None))
+ModelEntry = namedtuple('ModelEntry', ['info', 'backend'])
+
+
+def metadata_path(model_path):
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def load_model_info(model_path, default_size=640, default_classes=None):
+    """读取模型的元数据, 返回 ModelInfo"""
+    meta = {}
+    if os.path.exists(metadata_path(model_path)):
+        with open(metadata_path(model_path), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    img_size = meta.get('img_size')
+    if img_size is None:
+        m = re.search(r'_(\d{3,4})$', os.path.splitext(os.path.basename(model_path))[0])
+        img_size = int(m.group(1)) if m else default_size
+    classes = tuple(meta.get('classes') or default_classes or ())
+    anchors = meta.get('anchors')
+    if anchors is not None:
+        anchors = tuple(tuple(level) for level in anchors)  # 可哈希, 作为 yolo_heads 解码器缓存的键
+    quant = meta.get('output_quant')
+    if quant is not None:
+        quant = tuple(QuantParams(int(zp), float(scale)) for zp, scale in quant)
+    return ModelInfo(model_path, int(img_size), classes, anchors, quant)
+
+
+def save_model_info(model_path, img_size, classes, anchors=None, quant=None):
+    """写出模型的元数据文件 (convert.py 导出模型后调用)"""
+    meta = {'img_size': int(img_size), 'classes': list(classes)}
+    if anchors is not None:
+        meta['anchors'] = [list(level) for level in anchors]
+    if quant is not None:
+        meta['output_quant'] = [[int(zp), float(scale)] for zp, scale in quant]
+    with open(metadata_path(model_path), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+class SwitchPolicy:
+    """
+    选择当前使用哪个尺寸的模型 (下标按输入尺寸从小到大):
+      phase: 'scan' 时用最小的模型, 'confirm' 时用最大的模型
+      latency_budget_s: 最近帧延迟的滑动平均超过预算时降一档, 低于预算一半时升一档 (不超过阶段给出的上限)
+      cooldown_frames: 按延迟升降一档后, 至少再观察这么多帧才会再次按延迟升降, 让滑动平均先反映新模型的延迟,
+                       一段短暂的卡顿不会一路降到最小的模型
+      fast_speed: 小车速度超过该值时最多用次小的模型 (运动模糊下大分辨率收益小, 低延迟更重要)
+    """
+    def __init__(self, latency_budget_s=None, fast_speed=None, smoothing=0.2, cooldown_frames=15):
+        self.latency_budget_s = latency_budget_s
+        self.fast_speed = fast_speed
+        self.smoothing = smoothing
+        self.cooldown_frames = cooldown_frames
+        self.avg_latency = None
+        self._cooldown = 0
+
+    def observe_latency(self, seconds):
+        self._cooldown = max(0, self._cooldown - 1)
+        if self.avg_latency is None:
+            self.avg_latency = seconds
+        else:
+            self.avg_latency += self.smoothing * (seconds - self.avg_latency)
+
+    def choose(self, num_models, current, phase='confirm', speed=None):
+        limit = 0 if phase == 'scan' else num_models - 1
+        if self.fast_speed is not None and speed is not None and speed > self.fast_speed:
+            limit = min(limit, 1)
+        if self.latency_budget_s is None or self.avg_latency is None:
+            return limit
+        index = min(current, limit)
+        if self._cooldown:
+            return index
+        if self.avg_latency > self.latency_budget_s and index > 0:
+            index -= 1
+        elif self.avg_latency < self.latency_budget_s / 2 and index < limit:
+            index += 1
+        else:
+            return index
+        self._cooldown = self.cooldown_frames
+        return index
+
+
+class ModelSet:
+    def __init__(self, model_paths, create, policy=None, default_size=640, default_classes=None):
+        """
+        model_paths: 模型路径列表 (单个路径也可以)
+        create: create(path) -> 推理后端, 如 backends.create_backend 的包装
+        """
+        if isinstance(model_paths, str):
+            model_paths = [model_paths]
+        infos = sorted((load_model_info(p, default_size, default_classes) for p in model_paths),
+                       key=lambda info: info.img_size)
+        classes = {info.classes for info in infos}
+        if len(classes) > 1:
+            raise RuntimeError("All models in a model set must have the same classes")
+        self.models = []
+        try:
+            for info in infos:
+                self.models.append(ModelEntry(info, create(info.path)))
+        except Exception:
+            self.release()  # 后面的模型加载失败时释放已经加载的模型
+            raise
+        self.classes = infos[0].classes
+        self.policy = policy or SwitchPolicy()
+        self.active = len(self.models) - 1  # 默认使用最大尺寸
+        self.switches = 0
+
+    def __len__(self):
+        return len(self.models)
+
+    def __getitem__(self, index):
+        return self.models[index]
+
+    @property
+    def current(self):
+        return self.models[self.active]
+
+    def update(self, phase='confirm', latency=None, speed=None):
+        """根据最新的阶段 / 帧延迟 / 速度选择模型, 返回当前模型的下标"""
+        if latency is not None:
+            self.policy.observe_latency(latency)
+        index = self.policy.choose(len(self.models), self.active, phase=phase, speed=speed)
+        if index != self.active:
+            self.active = index
+            self.switches += 1
+        return self.active
+
+    def release(self):
+        for entry in self.models:
+            entry.backend.release()
@@ -0,0 +1,60 @@
+# motion_gate.py
+# 运动门控: 小车停着的时候相邻帧几乎一样, 没必要每帧都跑 NPU 推理和后处理。
+# 把每帧缩小成很小的灰度图, 和上一次真正推理的那一帧比较, 变化不超过阈值就直接复用上一次的检测结果。
+# 和"上一次推理的帧"而不是"上一帧"比较, 这样缓慢的累积变化 (如小车慢慢挪动) 也会在超过阈值时触发推理。
+
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    def __init__(self, threshold=2.0, pixel_threshold=20, changed_fraction=0.002, size=(64, 48), max_skip=30):
+        """
+        threshold: 缩小后灰度图的平均绝对差 (0-255) 超过该值视为画面有变化
+        pixel_threshold / changed_fraction: 差值超过 pixel_threshold 的像素占比超过 changed_fraction 也视为有变化
+                                            (画面大部分不变、只有一个小物体移动时平均差很小)
+        size: 比较用的缩小尺寸 (宽, 高)
+        max_skip: 最多连续复用多少帧, 之后强制推理一次, 防止一直使用过时的结果
+        """
+        self.threshold = threshold
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.size = size
+        self.max_skip = max_skip
+        self.frames_checked = 0
+        self.frames_skipped = 0
+        self.reset()
+
+    def reset(self):
+        """清除参考帧, 下一帧一定会推理 (每次搜索开始时调用)"""
+        self._reference = None
+        self._skipped_in_row = 0
+        self._small = np.empty(self.size[::-1], dtype=np.uint8)
+        self._diff = np.empty(self.size[::-1], dtype=np.uint8)
+
+    def _shrink(self, frame):
+        # 先缩小再转灰度, 缩小时 INTER_AREA 本身就起到了去噪的作用
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._small)
+
+    def should_infer(self, frame, force=False):
+        """
+        画面相对上一次推理的帧有变化时返回 True (并把本帧作为新的参考帧), 否则返回 False。
+        force: 无论画面是否变化都推理 (如刚切换了模型)
+        """
+        self.frames_checked += 1
+        small = self._shrink(frame)
+        if not force and self._reference is not None and self._skipped_in_row < self.max_skip:
+            cv2.absdiff(small, self._reference, dst=self._diff)
+            if (self._diff.mean() <= self.threshold and
+                    np.count_nonzero(self._diff > self.pixel_threshold) <= self.changed_fraction * self._diff.size):
+                self.frames_skipped += 1
+                self._skipped_in_row += 1
+                return False
+        self._reference = small.copy()
+        self._skipped_in_row = 0
+        return True
+
+    def summary(self):
+        ratio = self.frames_skipped / self.frames_checked * 100 if self.frames_checked else 0.0
+        return f"motion gate skipped {self.frames_skipped}/{self.frames_checked} frames ({ratio:.0f}%)"
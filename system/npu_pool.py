@@ -0,0 +1,78 @@
+# npu_pool.py
+# RK3588 有 3 个 NPU 核心。小模型用 NPU_CORE_0_1_2 单上下文时多核加速很有限,
+# 这里把同一个 .rknn 分别加载到 3 个 RKNNLite 上下文, 每个绑定一个核心, 按轮询方式分发帧,
+# 结果按提交顺序返回。
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from backends import raw_output_kwargs
+
+
+class RKNNPool:
+    def __init__(self, model_path, core_masks=None, runtime_cls=None, verbose=False, want_float=True):
+        """
+        core_masks: 每个上下文绑定的核心, 默认 (NPU_CORE_0, NPU_CORE_1, NPU_CORE_2)
+        runtime_cls: RKNNLite 或接口相同的类 (如 fake_npu.FakeRKNNLite), 用于在开发机上测试
+        want_float: False 时请求不反量化的原始输出 (见 backends.raw_output_kwargs)
+        """
+        if runtime_cls is None:
+            from rknnlite.api import RKNNLite
+            runtime_cls = RKNNLite
+        if core_masks is None:
+            core_masks = (runtime_cls.NPU_CORE_0, runtime_cls.NPU_CORE_1, runtime_cls.NPU_CORE_2)
+        self.contexts = []
+        self.executors = []
+        self.inference_fns = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self._pending = deque()
+        for i, core_mask in enumerate(core_masks):
+            rknn = runtime_cls(verbose=verbose)
+            print(f'--> [Pool {i}] Loading RKNN model: {model_path}')
+            if rknn.load_rknn(model_path) != 0:
+                rknn.release()
+                self.release()
+                raise RuntimeError(f"Failed to load RKNN model: {model_path}")
+            if rknn.init_runtime(core_mask=core_mask) != 0:
+                rknn.release()
+                self.release()
+                raise RuntimeError(f"Failed to init RKNN runtime on core mask {core_mask}")
+            self.contexts.append(rknn)
+            self.inference_fns.append(partial(rknn.inference, **raw_output_kwargs(rknn, want_float)))
+            # 每个上下文只能被一个线程使用, 所以每个上下文配一个单线程 executor
+            self.executors.append(ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'npu{i}'))
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def submit(self, inputs):
+        """异步推理, 轮询选择上下文, 返回 Future (result() 为 inference 的输出)"""
+        with self._lock:
+            i = self._next
+            self._next = (self._next + 1) % len(self.contexts)
+        return self.executors[i].submit(self.inference_fns[i], inputs=inputs)
+
+    def inference(self, inputs):
+        """与 RKNNLite.inference 相同的同步接口, 可直接替换"""
+        return self.submit(inputs).result()
+
+    # --- 流式接口: put 提交一帧, get 按提交顺序取回结果 ---
+    def put(self, inputs):
+        self._pending.append(self.submit(inputs))
+
+    def get(self):
+        if not self._pending:
+            return None
+        return self._pending.popleft().result()
+
+    def release(self):
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+        for rknn in self.contexts:
+            rknn.release()
+        self.executors = []
+        self.contexts = []
+        self.inference_fns = []
+        self._pending.clear()
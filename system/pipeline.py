@@ -0,0 +1,185 @@
+# pipeline.py
+# 多线程流水线: 采集 -> 预处理 -> NPU推理 -> 后处理
+# 各级之间用有界队列连接, 第 N 帧在 NPU 上推理时, 第 N+1 帧可以同时采集和 letterbox,
+# 第 N-1 帧可以同时做后处理。
+
+import queue
+import threading
+import time
+
+_END = object()  # 流水线结束标记
+
+
+class StageStats:
+    """记录每一级的忙碌时间, 用于计算占用率 (occupancy) 和整体 FPS"""
+    def __init__(self, stage_names):
+        self.stage_names = list(stage_names)
+        self.busy = {name: 0.0 for name in self.stage_names}
+        self.count = {name: 0 for name in self.stage_names}
+        self.frames = 0
+        self.latencies = []  # 每帧从采集到检测结果可用的延迟 (秒)
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.busy[name] += seconds
+            self.count[name] += 1
+
+    def add_latency(self, seconds):
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def frame_done(self):
+        with self._lock:
+            self.frames += 1
+
+    def finish(self):
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    def elapsed(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        return max(end - self.start_time, 1e-9)
+
+    def report(self):
+        """返回 {'fps', 'frames', 'elapsed_s', 'latency_ms', 'stages': {name: {...}}}"""
+        elapsed = self.elapsed()
+        stages = {}
+        for name in self.stage_names:
+            n = self.count[name]
+            stages[name] = {
+                'frames': n,
+                'avg_ms': self.busy[name] / n * 1000 if n else 0.0,
+                'occupancy': self.busy[name] / elapsed,
+            }
+        latency = {}
+        if self.latencies:
+            ms = sorted(x * 1000 for x in self.latencies)
+            latency = {'p50': ms[len(ms) // 2], 'p95': ms[min(len(ms) - 1, int(len(ms) * 0.95))], 'max': ms[-1]}
+        return {'fps': self.frames / elapsed, 'frames': self.frames,
+                'elapsed_s': elapsed, 'latency_ms': latency, 'stages': stages}
+
+    def summary(self):
+        rep = self.report()
+        parts = [f"{name}: {s['avg_ms']:.1f}ms {s['occupancy'] * 100:.0f}%"
+                 for name, s in rep['stages'].items()]
+        text = f"{rep['fps']:.1f} FPS ({rep['frames']} frames) | " + " | ".join(parts)
+        if rep['latency_ms']:
+            lat = rep['latency_ms']
+            text += f" | capture->detection p50 {lat['p50']:.1f}ms p95 {lat['p95']:.1f}ms"
+        return text
+
+
+class FramePipeline:
+    """
+    source: 无参函数, 每次返回一个新的数据项, 返回 None 表示数据源结束 (如摄像头断开)
+    stages: [(name, func), ...], 每个 func 接收上一级的结果并返回本级结果
+    每一级 (包括 source) 运行在自己的线程中, 级间队列长度为 queue_size。
+    """
+    def __init__(self, source, stages, queue_size=2, source_name='capture'):
+        self.source = source
+        self.source_name = source_name
+        self.stages = list(stages)
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(self.stages) + 1)]
+        self.stats = StageStats([source_name] + [name for name, _ in self.stages])
+        self.error = None
+        self._stop = threading.Event()
+        self._threads = []
+        self._finished = False
+
+    def start(self):
+        self.stats.start_time = time.perf_counter()
+        self._threads = [threading.Thread(target=self._source_loop, daemon=True)]
+        for i, (name, func) in enumerate(self.stages):
+            t = threading.Thread(target=self._stage_loop,
+                                 args=(name, func, self.queues[i], self.queues[i + 1]), daemon=True)
+            self._threads.append(t)
+        for t in self._threads:
+            t.start()
+        return self
+
+    def _put(self, q, item):
+        # 下游队列满时阻塞 (背压), 但要能响应 stop()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.05)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _source_loop(self):
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                item = self.source()
+                self.stats.add(self.source_name, time.perf_counter() - t0)
+                if item is None:
+                    break
+                if not self._put(self.queues[0], item):
+                    return
+        except Exception as e:
+            self.error = e
+        self._put(self.queues[0], _END)
+
+    def _stage_loop(self, name, func, in_q, out_q):
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                self._put(out_q, _END)
+                return
+            try:
+                t0 = time.perf_counter()
+                result = func(item)
+                self.stats.add(name, time.perf_counter() - t0)
+            except Exception as e:
+                self.error = e
+                self._stop.set()
+                return
+            if not self._put(out_q, result):
+                return
+
+    def get(self):
+        """取出下一个完整处理的结果; 流水线结束时返回 None (若某一级出错则抛出异常)"""
+        if self._finished:
+            return None
+        item = self._get(self.queues[-1])
+        if item is _END:
+            self._finished = True
+            self.stats.finish()
+            if self.error is not None:
+                raise self.error
+            return None
+        self.stats.frame_done()
+        return item
+
+    def __iter__(self):
+        while True:
+            item = self.get()
+            if item is None:
+                return
+            yield item
+
+    def stop(self):
+        """停止所有线程并清空队列"""
+        self._stop.set()
+        self.stats.finish()
+        for q in self.queues:
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
+        for t in self._threads:
+            t.join(timeout=1.0)
+        self._finished = True
@@ -0,0 +1,60 @@
+# quantized.py
+# INT8 模型的输出在量化域中做阈值筛选。INT8 RKNN 模型的输出张量本来就是 int8 (值 = (q - zero_point) * scale),
+# 默认的 float 输出让运行时每帧把所有元素都反量化一遍, 而 99% 以上的行随后就被 CONF_THRESHOLD 筛掉了。
+# 运行时支持时 (inference 接受 want_float 参数, 对应 C API 的 rknn_output.want_float) 直接取 int8 输出,
+# 把阈值换算成整数后比较, 只反量化通过的行。零点和缩放来自模型元数据 (.json 的 "output_quant",
+# 每个输出一个 [zero_point, scale], 由 convert.py --quant_cfg 写入)。
+
+import inspect
+from collections import namedtuple
+import numpy as np
+
+QuantParams = namedtuple('QuantParams', ['zero_point', 'scale'])
+
+
+def supports_raw_outputs(runtime):
+    """运行时的 inference 是否可以返回不反量化的原始输出"""
+    try:
+        return 'want_float' in inspect.signature(runtime.inference).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def is_quantized(output):
+    return not np.issubdtype(output.dtype, np.floating)
+
+
+def output_params(outputs, i, quant):
+    """第 i 个输出的 QuantParams; float 输出返回 None, int 输出缺少元数据中的量化参数时抛出 ValueError"""
+    if not is_quantized(outputs[i]):
+        return None
+    if quant is None:
+        raise ValueError("Quantized model outputs need the (zero_point, scale) from the model metadata")
+    return quant[i]
+
+
+def quantize_threshold(value, qp):
+    """整数阈值 t: 对整数 q, q > t 与 (q - zero_point) * scale > value 等价"""
+    return int(np.floor(value / qp.scale + qp.zero_point))
+
+
+def dequantize(q, qp):
+    return (q.astype(np.float32) - np.float32(qp.zero_point)) * np.float32(qp.scale)
+
+
+def quantize(x, qp, dtype=np.int8):
+    """float -> 量化值 (fake_npu 和基准测试用, 模拟 NPU 的 int8 输出)"""
+    info = np.iinfo(dtype)
+    return np.clip(np.round(x / qp.scale + qp.zero_point), info.min, info.max).astype(dtype)
+
+
+def dense_candidates(output, threshold, qp):
+    """
+    解码后的 [1, N, 5 + nc] int8 输出: 只比较 objectness 一列的整数值,
+    返回通过阈值的行反量化后的 [K, 5 + nc] float32。
+    注意这种输出中像素坐标和概率共用一个 scale, objectness 的分辨率很低; 拆分检测头 (export.py --raw-heads)
+    的每层输出只有 logit, 量化误差小得多, INT8 模型建议使用后者
+    """
+    q = output.reshape(-1, output.shape[-1])
+    rows = np.flatnonzero(q[:, 4] > quantize_threshold(threshold, qp))
+    return dequantize(q[rows], qp)
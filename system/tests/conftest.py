@@ -0,0 +1,7 @@
+import os
+import sys
+
+# system/ 下的模块都用平铺的 import (从 system 目录运行)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# vision_module/pack_dataset.py 不在 system 下, 测试时同样平铺 import
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'vision_module'))
@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+import threading
+import cv2
+import numpy as np
+import pytest
+from async_detector import AsyncDetector
+from fake_npu import FakeRKNNLite, synthetic_outputs
+from motion_gate import MotionGate
+from vision_module import CLASSES, ObjectDetector, postprocess
+
+OUTPUTS = [synthetic_outputs(640, num_objects=3, seed=3)]
+PRESENT = sorted({CLASSES[c] for c in postprocess(OUTPUTS, 1.0, (0.0, 0.0))[2]})
+
+
+class RecordedRKNNLite(FakeRKNNLite):
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose, latency=0.001, outputs=OUTPUTS)
+
+
+@pytest.fixture
+def detector(tmp_path):
+    frame = np.random.default_rng(0).integers(0, 255, (640, 640, 3), dtype=np.uint8)
+    for i in range(20):
+        cv2.imwrite(str(tmp_path / f'{i:03d}.png'), frame)
+    det = ObjectDetector('model.rknn', str(tmp_path), runtime_cls=RecordedRKNNLite, headless=True,
+                         motion_gate=MotionGate(max_skip=100))
+    yield det
+    det.release()
+
+
+class RecordingDetector:
+    """记录检测器状态在哪些线程中被修改"""
+    def __init__(self, detector):
+        self.detector = detector
+        self.threads = set()
+        original = detector._select_model
+
+        def select_model(*args, **kwargs):
+            self.threads.add(threading.current_thread().name)
+            return original(*args, **kwargs)
+        detector._select_model = select_model
+
+
+def test_frames_wraps_the_public_iterator(detector):
+    recorder = RecordingDetector(detector)
+
+    async def run():
+        adet = AsyncDetector(detector)
+        items = []
+        async with contextlib.aclosing(adet.frames(PRESENT[0])) as frames:
+            async for item in frames:
+                items.append(item)
+                if len(items) == 5:
+                    break
+        adet.close()
+        return items
+
+    items = asyncio.run(run())
+    assert len(items) == 5
+    assert all(set(np.asarray(item.class_ids)) <= {CLASSES.index(PRESENT[0])} for item in items)
+    # 和同步搜索一样经过运动门控: 画面不变, 第一帧之后都复用结果
+    assert not items[0].reused and all(item.reused for item in items[1:])
+    assert detector._decode_class is None
+    assert recorder.threads and all(name.startswith('vision') for name in recorder.threads)
+
+
+def test_search_and_cancel(detector):
+    async def run():
+        adet = AsyncDetector(detector)
+        task = asyncio.ensure_future(adet.search(CLASSES[-1] if CLASSES[-1] not in PRESENT else CLASSES[0]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        adet.close()
+
+    asyncio.run(run())
+    assert detector._decode_class is None
@@ -0,0 +1,111 @@
+import re
+import time
+import cv2
+import numpy as np
+import pytest
+from camera import ImageDirSource, LatestFrameGrabber, choose_capture_mode, open_capture, videotest_pipeline
+
+NUM_FRAMES = 12
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    # 每张图片的像素值等于它的序号, 读出来就能知道是哪一帧
+    for i in range(NUM_FRAMES):
+        cv2.imwrite(str(tmp_path / f'{i:03d}.png'), np.full((48, 64, 3), i, dtype=np.uint8))
+    (tmp_path / 'classes.txt').write_text('not an image\n')
+    return tmp_path
+
+
+def frame_index(frame):
+    return int(frame[0, 0, 0])
+
+
+def test_image_dir_source_replays_in_order(image_dir):
+    cap = open_capture(str(image_dir))
+    assert isinstance(cap, ImageDirSource) and cap.isOpened()
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == NUM_FRAMES
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame_index(frame))
+    assert frames == list(range(NUM_FRAMES))
+    cap.release()
+    assert not cap.isOpened()
+
+
+def test_image_dir_source_loops_at_replay_fps(image_dir):
+    cap = open_capture(str(image_dir), replay_fps=200, loop=True)
+    t0 = time.perf_counter()
+    frames = [frame_index(cap.read()[1]) for _ in range(NUM_FRAMES + 3)]
+    elapsed = time.perf_counter() - t0
+    assert frames == list(range(NUM_FRAMES)) + [0, 1, 2]
+    assert elapsed >= (NUM_FRAMES + 2) / 200
+
+
+def test_latest_frame_grabber_keeps_up_with_a_fast_consumer(image_dir):
+    grabber = LatestFrameGrabber(ImageDirSource(str(image_dir), fps=100)).start()
+    frames = []
+    while True:
+        ret, frame, timestamp, seq = grabber.read_latest()
+        if not ret:
+            break
+        frames.append(frame_index(frame))
+        assert seq == len(frames) and timestamp <= time.perf_counter()
+    grabber.release()
+    assert frames == list(range(NUM_FRAMES))
+    assert grabber.frames_grabbed == NUM_FRAMES and grabber.frames_dropped == 0
+
+
+def test_latest_frame_grabber_drops_stale_frames_for_a_slow_consumer(image_dir):
+    grabber = LatestFrameGrabber(ImageDirSource(str(image_dir), fps=200)).start()
+    frames = []
+    while True:
+        ret, frame = grabber.read()
+        if not ret:
+            break
+        frames.append(frame_index(frame))
+        time.sleep(0.02)  # 处理一帧的时间内摄像头出了约 4 帧
+    grabber.release()
+    assert frames == sorted(frames) and len(set(frames)) == len(frames)
+    assert frames[-1] == NUM_FRAMES - 1  # 最后总能拿到最新的一帧
+    assert len(frames) < NUM_FRAMES
+    assert grabber.frames_grabbed == NUM_FRAMES
+    assert grabber.frames_dropped == NUM_FRAMES - len(frames)
+
+
+def test_video_file_replay(tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    if not writer.isOpened():
+        pytest.skip('OpenCV was built without a video writer backend')
+    for i in range(NUM_FRAMES):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+    grabber = LatestFrameGrabber(open_capture(path)).start()
+    count = 0
+    while grabber.read_latest()[0]:
+        count += 1
+    grabber.release()
+    assert count >= 1 and grabber.frames_grabbed == NUM_FRAMES
+
+
+@pytest.mark.skipif(not re.search(r'GStreamer:\s+YES', cv2.getBuildInformation()),
+                    reason='OpenCV was built without GStreamer')
+def test_videotestsrc_pipeline():
+    cap = open_capture(videotest_pipeline(width=320, height=240, num_frames=5))
+    assert cap.isOpened()
+    ret, frame = cap.read()
+    cap.release()
+    assert ret and frame.shape == (240, 320, 3)
+
+
+def test_choose_capture_mode_prefers_model_aspect():
+    modes = [('YUYV', 640, 480, 30.0), ('MJPG', 1920, 1080, 30.0), ('MJPG', 1280, 720, 30.0),
+             ('MJPG', 640, 480, 30.0), ('MJPG', 320, 240, 30.0), ('MJPG', 640, 480, 5.0)]
+    assert choose_capture_mode(modes, model_size=(640, 480)) == ('MJPG', 640, 480, 30.0)
+    assert choose_capture_mode(modes, model_size=(640, 360)) == ('MJPG', 1280, 720, 30.0)
+    assert choose_capture_mode([('YUYV', 640, 480, 30.0)]) == ('YUYV', 640, 480, 30.0)
+    assert choose_capture_mode([('MJPG', 640, 480, 5.0)]) is None
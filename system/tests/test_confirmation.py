@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from confirmation import ConsecutiveConfirmer, EvidenceConfirmer, create_confirmer
+
+BOX = np.array([[100.0, 100.0, 50.0, 50.0]])
+NONE = (np.zeros((0, 4)), np.zeros(0))
+
+
+def seen(score=1.0, box=BOX):
+    return box, np.array([score])
+
+
+def feed(confirmer, frames, start=0.0, dt=0.1):
+    """从 start 秒开始按 dt 秒一帧依次输入, 返回每帧的确认结果"""
+    return [confirmer.update(*frame, timestamp=start + i * dt) for i, frame in enumerate(frames)]
+
+
+def test_first_weight_and_consistency():
+    confirmer = EvidenceConfirmer(evidence=10, first_weight=0.5)
+    confirmer.update(*seen(0.8), timestamp=0.0)
+    assert confirmer.total == pytest.approx(0.4)  # 第一次检测: 分数 x first_weight
+    confirmer.update(*seen(0.8), timestamp=0.1)
+    assert confirmer.total == pytest.approx(1.2)  # 同一位置: IoU 1
+    confirmer.update(*seen(0.8, BOX + [25, 0, 0, 0]), timestamp=0.2)
+    assert confirmer.total == pytest.approx(1.2 + 0.8 / 3)  # 平移半个框: IoU 1/3
+
+
+@pytest.mark.parametrize('first_weight, frames', [(1.0, 3), (0.5, 3), (0.0, 4)])
+def test_confirms_once_evidence_is_reached(first_weight, frames):
+    confirmer = EvidenceConfirmer(evidence=2.5, first_weight=first_weight)
+    assert feed(confirmer, [seen()] * frames) == [False] * (frames - 1) + [True]
+    assert confirmer.decision_s == pytest.approx((frames - 1) * 0.1)
+
+
+def test_min_frames_blocks_a_single_strong_detection():
+    confirmer = EvidenceConfirmer(evidence=0.5, min_frames=3, first_weight=1.0)
+    assert feed(confirmer, [seen()] * 3) == [False, False, True]
+
+
+def test_missed_frame_does_not_reset_evidence():
+    confirmer = EvidenceConfirmer(evidence=2.5)
+    assert feed(confirmer, [seen(), seen(), NONE, seen(), seen()]) == [False, False, False, True, True]
+
+
+def test_window_expiry_drops_old_evidence():
+    confirmer = EvidenceConfirmer(window_s=1.0, evidence=2.5)
+    confirmer.update(*seen(), timestamp=0.0)
+    confirmer.update(*seen(), timestamp=0.5)
+    assert confirmer.total == pytest.approx(1.5)
+    # 0.0 的检测已经超出窗口, 只剩 0.5 和 1.2 两次
+    assert not confirmer.update(*seen(), timestamp=1.2)
+    assert confirmer.total == pytest.approx(2.0) and len(confirmer._history) == 2
+    assert confirmer.first_seen == 0.0
+
+
+def test_target_that_disappears_starts_over():
+    confirmer = EvidenceConfirmer(window_s=1.0, evidence=2.5)
+    feed(confirmer, [seen(), seen()])
+    assert confirmer.progress_text() == 'Evidence: 1.5/2.5'
+    # 目标消失超过一个窗口: 证据清零, 重新出现时按第一次检测计, 位置不和消失前的框比较
+    assert not confirmer.update(*NONE, timestamp=1.5)
+    assert confirmer.total == 0.0 and confirmer.first_seen is None and confirmer.progress_text() is None
+    far = BOX + [300, 300, 0, 0]
+    assert feed(confirmer, [seen(box=far)] * 4, start=1.6) == [False, False, True, True]
+    assert confirmer.first_seen == pytest.approx(1.6) and confirmer.decision_s == pytest.approx(0.3)
+
+
+def test_consecutive_resets_on_a_missed_frame():
+    confirmer = create_confirmer('consecutive', frames=3)
+    assert isinstance(confirmer, ConsecutiveConfirmer)
+    assert feed(confirmer, [seen(), seen(), NONE, seen(), seen(), seen()]) == [False] * 5 + [True]
+    with pytest.raises(ValueError):
+        create_confirmer('majority')
@@ -0,0 +1,98 @@
+import socket
+from multiprocessing import shared_memory
+import numpy as np
+import pytest
+import detector_service
+from detector_service import DetectorClient, DetectorService, recv_msg, send_msg
+from fake_npu import FakeRKNNLite, synthetic_outputs
+from vision_module import CLASSES, postprocess
+
+OUTPUTS = [synthetic_outputs(640, num_objects=3, seed=3)]
+FRAME_SHAPE = (480, 640, 3)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    # fake 后端的关键字参数 (latency, outputs) 由 create_backend 传给 FakeRKNNLite
+    create = detector_service.create_backend
+    monkeypatch.setattr(detector_service, 'create_backend',
+                        lambda *args, **kwargs: create(*args, latency=0.001, outputs=OUTPUTS, **kwargs))
+    svc = DetectorService('model.rknn', backend='fake', socket_path=str(tmp_path / 'detector.sock')).start()
+    yield svc
+    svc.stop()
+
+
+def test_detect_through_shared_memory(service):
+    client = DetectorClient(FRAME_SHAPE, socket_path=service.socket_path)
+    try:
+        result = client.detect(np.zeros(FRAME_SHAPE, np.uint8))
+        expected = {CLASSES[c] for c in postprocess(OUTPUTS, 1.0, (0.0, 80.0))[2]}
+        assert {d.label for d in result.detections} == expected
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize('shape, offset', [
+    ([480, 640], 0),                      # 维数不对
+    ([480, 640, 4], 0),                   # 不是 3 通道
+    ([480, 'x', 3], 0),                   # 不是整数 (以前会在 np.ndarray 中抛出 TypeError, 杀掉客户端线程)
+    ([-1, 640, 3], 0),
+    (None, 0),
+    ([480, 640, 3], -1),
+    ([480, 640, 3], '0'),
+    ([480, 640, 3], 1),                   # 超出共享内存末尾
+    ([481, 640, 3], 0),
+])
+def test_malformed_detect_gets_error_reply(service, shape, offset):
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(FRAME_SHAPE)))
+    detector_service._created_shm.add(shm.name)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5.0)
+    try:
+        sock.connect(service.socket_path)
+        send_msg(sock, {'op': 'attach', 'shm': shm.name})
+        assert recv_msg(sock)['op'] == 'attach'
+        send_msg(sock, {'op': 'detect', 'id': 7, 'shape': shape, 'offset': offset})
+        reply = recv_msg(sock)
+        assert reply['id'] == 7 and 'error' in reply
+        # 连接仍然可用
+        send_msg(sock, {'op': 'detect', 'id': 8, 'shape': list(FRAME_SHAPE), 'offset': 0})
+        reply = recv_msg(sock)
+        assert reply['id'] == 8 and 'detections' in reply
+    finally:
+        sock.close()
+        shm.close()
+        shm.unlink()
+        detector_service._created_shm.discard(shm.name)
+
+
+class FlakyRKNNLite(FakeRKNNLite):
+    """第一次推理抛出异常, 模拟一次 NPU 偶发错误"""
+    failures = 0
+
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose, latency=0.001, outputs=OUTPUTS)
+
+    def inference(self, inputs, want_float=True):
+        if FlakyRKNNLite.failures == 0:
+            FlakyRKNNLite.failures += 1
+            raise RuntimeError('npu hiccup')
+        return super().inference(inputs, want_float)
+
+
+@pytest.mark.parametrize('npu_pool', [False, True])
+def test_backend_error_fails_only_that_request(tmp_path, monkeypatch, npu_pool):
+    monkeypatch.setattr(FlakyRKNNLite, 'failures', 0)
+    svc = DetectorService('model.rknn', backend='rknn', runtime_cls=FlakyRKNNLite, npu_pool=npu_pool,
+                          socket_path=str(tmp_path / 'detector.sock')).start()
+    client = DetectorClient(FRAME_SHAPE, socket_path=svc.socket_path)
+    try:
+        with pytest.raises(RuntimeError, match='npu hiccup'):
+            client.detect(np.zeros(FRAME_SHAPE, np.uint8))
+        # 工作线程还活着, 之后的请求正常返回
+        for _ in range(3):
+            assert client.detect(np.zeros(FRAME_SHAPE, np.uint8)).detections
+        assert svc.stats()['errors'] == 1
+    finally:
+        client.close()
+        svc.stop()
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+import evaluate_map
+import sim_eval
+from fake_npu import num_output_rows, synthetic_raw_heads
+from yolo_heads import get_decoder
+
+IMG_SIZE = 320
+NUM_IMAGES = 6
+RATIO, PAD = 0.5, (0.0, 40.0)  # 640x480 -> 320x320
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Dataset/images/val + labels/val, 以及每张图片一个录制的 [1, N, 15] 输出 (部分命中、部分错位或错类)"""
+    rng = np.random.default_rng(0)
+    image_dir, label_dir, recorded = (tmp_path / 'images' / 'val', tmp_path / 'labels' / 'val', tmp_path / 'raw')
+    for d in (image_dir, label_dir, recorded):
+        d.mkdir(parents=True)
+    outputs = []
+    for i in range(NUM_IMAGES):
+        cv2.imwrite(str(image_dir / f'{i:03d}.jpg'), np.zeros((480, 640, 3), np.uint8))
+        labels = np.column_stack((rng.integers(0, 3, 3), rng.uniform(0.25, 0.75, (3, 2)), rng.uniform(0.1, 0.2, (3, 2))))
+        (label_dir / f'{i:03d}.txt').write_text(''.join(f'{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n'
+                                                        for c, x, y, w, h in labels))
+        out = np.zeros((num_output_rows(IMG_SIZE), 15), np.float32)
+        out[:, 2:4] = 10.0
+        out[:, 4] = rng.uniform(0, 0.0005, len(out))  # 背景, 低于评估阈值
+        for j, (c, x, y, w, h) in enumerate(labels):
+            row = out[j * 7]
+            row[:4] = x * 640 * RATIO + PAD[0], y * 480 * RATIO + PAD[1], w * 640 * RATIO, h * 480 * RATIO
+            if j == 1:
+                row[:2] += row[2:4] * rng.uniform(0.1, 0.4)  # IoU 在 0.5:0.95 之间的不同位置
+            row[4] = rng.uniform(0.3, 0.95)
+            row[5 + (int(c) if j < 2 or i % 2 else (int(c) + 1) % 10)] = rng.uniform(0.5, 0.99)
+        out[100, :5] = (160, 160, 30, 30, 0.9)  # 没有真值的误检
+        out[100, 5] = 0.8
+        np.save(recorded / f'{i:03d}.npy', out[None])
+        outputs.append(out[None])
+    return image_dir, recorded, outputs
+
+
+def test_evaluate_map_and_sim_eval_report_the_same_map(dataset, tmp_path):
+    image_dir, recorded, outputs = dataset
+    opts = {'img_size': IMG_SIZE, 'threads': 1, 'platform': None, 'quant': None, 'dataset': None,
+            'image_dir': str(image_dir), 'limit': None, 'workers': 1, 'use_packed': False, 'out_dir': str(tmp_path)}
+    report = evaluate_map.evaluate_model('recorded', str(recorded), opts)
+    remaining = iter(outputs)
+    result = sim_eval.evaluate(lambda img: [next(remaining)], sim_eval.list_images('val', dataset_dir=str(tmp_path)),
+                               img_size=IMG_SIZE)
+    assert report['images'] == result['images'] == NUM_IMAGES
+    assert 0.0 < report['map50_95'] < report['map50'] < 1.0
+    assert report['map50'] == result['map50'] and report['map50_95'] == result['map50_95']
+    assert report['per_class'] == result['per_class']
+    parallel = evaluate_map.evaluate_model('recorded', str(recorded), dict(opts, workers=2))
+    assert parallel['map50'] == report['map50'] and parallel['per_class'] == report['per_class']
+
+
+def test_compute_ap_is_101_point_interpolated():
+    assert sim_eval.compute_ap(np.array([0.5, 1.0]), np.array([1.0, 1.0])) == 1.0
+    # recall 只到 0.5: 101 个采样点中有 51 个落在 precision 1 上
+    assert sim_eval.compute_ap(np.array([0.25, 0.5]), np.array([1.0, 1.0])) == pytest.approx(51 / 101)
+    # 一个误检排在唯一的真值前面: 包络在所有 recall 上都是 0.5
+    assert sim_eval.compute_ap(np.array([0.0, 1.0]), np.array([0.0, 0.5])) == pytest.approx(0.5)
+
+
+def test_sim_eval_decodes_raw_heads_like_the_dense_output():
+    heads = synthetic_raw_heads(IMG_SIZE, num_objects=6, seed=7)
+    dense = get_decoder(tuple(tuple(h.shape[1:]) for h in heads)).decode_dense(heads)
+    result = sim_eval.decode(heads, RATIO, PAD, conf_threshold=0.25)
+    expected = sim_eval.decode([dense], RATIO, PAD, conf_threshold=0.25)
+    assert len(result[0])
+    for a, b in zip(result, expected):
+        np.testing.assert_allclose(a, b, rtol=1e-5)
@@ -0,0 +1,65 @@
+import pytest
+from fake_npu import FakeRKNNLite
+from model_set import ModelSet, SwitchPolicy
+
+PATHS = ['yolov5_640.rknn', 'yolov5_320.rknn', 'yolov5_416.rknn']
+
+
+class Backend(FakeRKNNLite):
+    def __init__(self, path):
+        super().__init__(latency=0)
+        self.path = path
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+def test_models_sorted_by_input_size():
+    models = ModelSet(PATHS, Backend)
+    assert [entry.info.img_size for entry in models] == [320, 416, 640]
+    assert models.current.info.img_size == 640
+
+
+def test_failed_load_releases_loaded_models():
+    created = []
+
+    def create(path):
+        if path.endswith('_640.rknn'):
+            raise RuntimeError(f"Failed to load RKNN model: {path}")
+        created.append(Backend(path))
+        return created[-1]
+
+    with pytest.raises(RuntimeError):
+        ModelSet(PATHS, create)
+    assert len(created) == 2 and all(b.released for b in created)
+
+
+def test_phase_selects_smallest_and_largest():
+    models = ModelSet(PATHS, Backend)
+    assert models.update(phase='scan') == 0
+    assert models.update(phase='confirm') == 2
+    assert models.switches == 2
+
+
+def test_slow_stretch_steps_down_once_per_cooldown():
+    models = ModelSet(PATHS, Backend, policy=SwitchPolicy(latency_budget_s=0.05, cooldown_frames=10))
+    indices = [models.update(latency=0.2) for _ in range(12)]
+    # 第一次超预算降一档, 之后冷却 10 帧才会再降, 不会连续几帧就降到最小的模型
+    assert indices[:10] == [1] * 10
+    assert indices[10:] == [0, 0]
+
+
+def test_fast_frames_step_back_up_after_cooldown():
+    policy = SwitchPolicy(latency_budget_s=0.05, cooldown_frames=3, smoothing=1.0)
+    models = ModelSet(PATHS, Backend, policy=policy)
+    models.update(phase='scan')
+    indices = [models.update(phase='confirm', latency=0.01) for _ in range(8)]
+    assert indices == [1, 1, 1, 2, 2, 2, 2, 2]
+    assert models.update(phase='confirm', latency=0.04) == 2  # 在预算一半和预算之间保持不变
+
+
+def test_fast_speed_caps_model():
+    models = ModelSet(PATHS, Backend, policy=SwitchPolicy(fast_speed=0.5))
+    assert models.update(phase='confirm', speed=1.0) == 1
+    assert models.update(phase='confirm', speed=0.1) == 2
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from fake_npu import FakeRKNNLite, synthetic_outputs
+from npu_pool import RKNNPool
+
+
+class TrackingRKNNLite(FakeRKNNLite):
+    """记录创建和释放的上下文; fail_on 指定第几个上下文 (从 0 开始) 在 load / init 时失败"""
+    created = []
+    fail_on = None
+    fail_stage = 'load'
+
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose, latency=0)
+        self.released = False
+        self.index = len(TrackingRKNNLite.created)
+        TrackingRKNNLite.created.append(self)
+
+    def load_rknn(self, path):
+        return -1 if self.fail_stage == 'load' and self.index == self.fail_on else 0
+
+    def init_runtime(self, core_mask=FakeRKNNLite.NPU_CORE_AUTO):
+        if self.fail_stage == 'init' and self.index == self.fail_on:
+            return -1
+        return super().init_runtime(core_mask)
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def runtime_cls():
+    TrackingRKNNLite.created = []
+    TrackingRKNNLite.fail_on = None
+    yield TrackingRKNNLite
+
+
+def test_round_robin_over_cores(runtime_cls):
+    pool = RKNNPool('model.rknn', runtime_cls=runtime_cls)
+    assert len(pool) == 3
+    assert [c.core_mask for c in pool.contexts] == [1, 2, 4]
+    inp = np.zeros((1, 640, 640, 3), np.uint8)
+    for _ in range(6):
+        pool.put([inp])
+    results = [pool.get() for _ in range(6)]
+    assert all(r[0].shape == (1, 25200, 15) for r in results)
+    assert pool.get() is None
+    pool.release()
+    assert all(c.released for c in runtime_cls.created)
+
+
+def test_results_in_submission_order():
+    frames = [synthetic_outputs(320, seed=i) for i in range(3)]
+    contexts = []
+
+    def runtime(verbose=False):
+        # 第 i 个上下文总是返回 frames[i]; 轮询分发后结果应按提交顺序回来
+        ctx = FakeRKNNLite(verbose=verbose, latency=0.01 * (3 - len(contexts)), outputs=[frames[len(contexts)]])
+        contexts.append(ctx)
+        return ctx
+    runtime.NPU_CORE_0, runtime.NPU_CORE_1, runtime.NPU_CORE_2 = 1, 2, 4
+
+    pool = RKNNPool('model.rknn', runtime_cls=runtime)
+    inp = np.zeros((1, 320, 320, 3), np.uint8)
+    for _ in range(6):
+        pool.put([inp])
+    for i in range(6):
+        assert pool.get()[0] is frames[i % 3]
+    pool.release()
+
+
+@pytest.mark.parametrize('stage', ['load', 'init'])
+@pytest.mark.parametrize('fail_on', [0, 2])
+def test_failed_context_raises_runtime_error_and_releases_all(runtime_cls, stage, fail_on):
+    runtime_cls.fail_on, runtime_cls.fail_stage = fail_on, stage
+    with pytest.raises(RuntimeError):
+        RKNNPool('model.rknn', runtime_cls=runtime_cls)
+    assert len(runtime_cls.created) == fail_on + 1
+    assert all(c.released for c in runtime_cls.created)
+
+
+@pytest.mark.parametrize('stage', ['load', 'init'])
+def test_single_context_backend_releases_on_failure(runtime_cls, stage):
+    from backends import RKNNLiteBackend
+    runtime_cls.fail_on, runtime_cls.fail_stage = 0, stage
+    with pytest.raises(RuntimeError):
+        RKNNLiteBackend('model.rknn', runtime_cls=runtime_cls)
+    assert len(runtime_cls.created) == 1 and runtime_cls.created[0].released
@@ -0,0 +1,104 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from pack_dataset import PackedDataset, letterbox, pack, pack_dir
+
+IMG_SIZE = 64
+SIZES = {'a.jpg': (48, 64), 'b.png': (64, 32), 'c.png': (30, 40)}  # (h, w)
+LABELS = {'a': '0 0.5 0.5 0.2 0.2\n3 0.25 0.25 0.1 0.1\n', 'b': 'classes\n1 0.5 0.5 0.4 0.4\n'}  # c 没有标签
+
+
+def write_image(path, shape, seed):
+    img = np.random.default_rng(seed).integers(0, 255, (*shape, 3), dtype=np.uint8)
+    cv2.imwrite(str(path), img)
+    return cv2.imread(str(path))  # jpg 有损, 以读回的图像为准
+
+
+def touch(path, seconds):
+    """改内容后把修改时间推后, 不依赖文件系统的时间精度"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + int(seconds * 1e9)))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    image_dir, label_dir = tmp_path / 'images' / 'val', tmp_path / 'labels' / 'val'
+    image_dir.mkdir(parents=True)
+    label_dir.mkdir(parents=True)
+    originals = {name: write_image(image_dir / name, shape, i) for i, (name, shape) in enumerate(SIZES.items())}
+    for stem, text in LABELS.items():
+        (label_dir / f'{stem}.txt').write_text(text)
+    (image_dir / 'broken.jpg').write_bytes(b'not an image')
+    return tmp_path, originals
+
+
+def expected_input(img):
+    return letterbox(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), IMG_SIZE)
+
+
+def test_pack_letterboxes_images_and_merges_labels(dataset):
+    root, originals = dataset
+    ds, rebuilt = pack('val', IMG_SIZE, str(root))
+    assert rebuilt == 3 and ds.path == pack_dir('val', IMG_SIZE, str(root))
+    assert ds.names == ['a.jpg', 'b.png', 'c.png']  # 读不出来的图片被跳过
+    assert ds.images.shape == (3, IMG_SIZE, IMG_SIZE, 3) and ds.offsets.tolist() == [0, 2, 3, 3]
+    for i, name in enumerate(ds.names):
+        inp, ratio, (dw, dh) = expected_input(originals[name])
+        img, labels, info = ds[i]
+        np.testing.assert_array_equal(img, inp)
+        assert (info['width'], info['height']) == SIZES[name][::-1]
+        assert info['ratio'] == pytest.approx(ratio) and (info['pad_w'], info['pad_h']) == (dw, dh)
+    np.testing.assert_allclose(ds[0][1], [[0, 0.5, 0.5, 0.2, 0.2], [3, 0.25, 0.25, 0.1, 0.1]])
+    np.testing.assert_allclose(ds[1][1], [[1, 0.5, 0.5, 0.4, 0.4]])  # 非数字行被跳过
+    assert ds[2][1].shape == (0, 5)
+    assert not os.path.exists(ds.path + '.tmp')
+
+
+def test_packed_dataset_views(dataset):
+    root, _ = dataset
+    pack('val', IMG_SIZE, str(root))
+    ds = PackedDataset.open('val', IMG_SIZE, str(root))
+    assert len(ds) == 3
+    assert ds.classes_of(0).tolist() == [0, 3] and ds.classes_of(2).tolist() == []
+    assert ds.image_path(1) == os.path.join(str(root / 'images' / 'val'), 'b.png')
+    head = ds.head(2)
+    assert len(head) == 2 and head.images.shape[0] == 2 and len(ds) == 3
+    np.testing.assert_array_equal(head[1][0], ds[1][0])
+    assert ds.head(None) is ds
+
+
+def test_repack_only_redecodes_changed_images(dataset):
+    root, originals = dataset
+    image_dir, label_dir = root / 'images' / 'val', root / 'labels' / 'val'
+    first, _ = pack('val', IMG_SIZE, str(root))
+    before = np.array(first.images)
+    del first
+    ds, rebuilt = pack('val', IMG_SIZE, str(root))
+    assert rebuilt == 0
+    np.testing.assert_array_equal(ds.images, before)
+
+    # 只改标签: 图片直接复制, 标签重新读取
+    (label_dir / 'a.txt').write_text('2 0.5 0.5 0.3 0.3\n')
+    touch(label_dir / 'a.txt', 2)
+    # 替换一张图片, 新增一张
+    replaced = write_image(image_dir / 'b.png', (40, 40), 10)
+    touch(image_dir / 'b.png', 2)
+    added = write_image(image_dir / 'aa.png', (20, 64), 11)
+    del ds
+    ds, rebuilt = pack('val', IMG_SIZE, str(root))
+    assert rebuilt == 2 and ds.names == ['a.jpg', 'aa.png', 'b.png', 'c.png']
+    np.testing.assert_array_equal(ds[0][0], before[0])
+    np.testing.assert_allclose(ds[0][1], [[2, 0.5, 0.5, 0.3, 0.3]])
+    np.testing.assert_array_equal(ds[1][0], expected_input(added)[0])
+    np.testing.assert_array_equal(ds[2][0], expected_input(replaced)[0])
+    assert (ds[2][2]['width'], ds[2][2]['height']) == (40, 40)
+    np.testing.assert_array_equal(ds[3][0], before[2])
+
+    # 删除的图片从包中去掉; force 时全部重新解码
+    os.remove(image_dir / 'aa.png')
+    del ds
+    ds, rebuilt = pack('val', IMG_SIZE, str(root))
+    assert rebuilt == 0 and ds.names == ['a.jpg', 'b.png', 'c.png']
+    del ds
+    assert pack('val', IMG_SIZE, str(root), force=True)[1] == 3
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from fake_npu import synthetic_outputs
+from vision_module import CONF_THRESHOLD, nms_boxes
+
+
+def greedy_class_nms(boxes, scores, class_ids, iou_threshold):
+    """逐对比较的按类别贪心 NMS (参考实现): 按分数从高到低, 与已保留的同类框 IoU > 阈值的被抑制"""
+    boxes = boxes.astype(np.float64)
+    keep = []
+    for i in sorted(range(len(scores)), key=lambda i: -scores[i]):
+        suppressed = False
+        for j in keep:
+            if class_ids[i] != class_ids[j]:
+                continue
+            w = min(boxes[i, 2], boxes[j, 2]) - max(boxes[i, 0], boxes[j, 0])
+            h = min(boxes[i, 3], boxes[j, 3]) - max(boxes[i, 1], boxes[j, 1])
+            inter = max(w, 0) * max(h, 0)
+            union = np.prod(boxes[i, 2:] - boxes[i, :2]) + np.prod(boxes[j, 2:] - boxes[j, :2]) - inter
+            if inter > iou_threshold * union:
+                suppressed = True
+                break
+        if not suppressed:
+            keep.append(i)
+    return np.asarray(keep, dtype=np.intp)
+
+
+@pytest.mark.parametrize('n', [1, 5, 40, 200])
+def test_nms_matches_greedy_reference_on_random_boxes(n):
+    rng = np.random.default_rng(n)
+    for _ in range(5):
+        centers, wh = rng.uniform(0, 640, (n, 2)), rng.uniform(5, 150, (n, 2))
+        boxes = np.concatenate((centers - wh / 2, centers + wh / 2), axis=1).astype(np.float32)
+        scores = rng.uniform(0, 1, n).astype(np.float32)
+        class_ids = rng.integers(0, 3, n)
+        for threshold in (0.3, 0.5, 0.7):
+            np.testing.assert_array_equal(nms_boxes(boxes, scores, class_ids, threshold),
+                                          greedy_class_nms(boxes, scores, class_ids, threshold))
+
+
+@pytest.mark.parametrize('objects', [1, 5, 15])
+def test_nms_matches_greedy_reference_on_clustered_candidates(objects):
+    out = synthetic_outputs(640, num_objects=objects, seed=objects)[0]
+    out = out[out[:, 4] > CONF_THRESHOLD]
+    class_ids = np.argmax(out[:, 5:], axis=1)
+    scores = out[np.arange(len(out)), 5 + class_ids] * out[:, 4]
+    boxes = np.concatenate((out[:, :2] - out[:, 2:4] / 2, out[:, :2] + out[:, 2:4] / 2), axis=1)
+    keep = nms_boxes(boxes, scores, class_ids, 0.5)
+    np.testing.assert_array_equal(keep, greedy_class_nms(boxes, scores, class_ids, 0.5))
+    assert len(keep) >= objects
+
+
+def test_nms_never_suppresses_across_classes():
+    boxes = np.array([[0, 0, 100, 100], [0, 0, 100, 100]], np.float32)
+    scores = np.array([0.9, 0.8], np.float32)
+    assert list(nms_boxes(boxes, scores, np.array([0, 1]), 0.5)) == [0, 1]
+    assert list(nms_boxes(boxes, scores, np.array([2, 2]), 0.5)) == [0]
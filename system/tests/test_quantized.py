@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from fake_npu import FakeRKNNLite, synthetic_outputs, synthetic_raw_heads
+from quantized import (QuantParams, dense_candidates, dequantize, quantize, quantize_threshold,
+                       supports_raw_outputs)
+from vision_module import CONF_THRESHOLD, postprocess
+from yolo_heads import HeadDecoder
+
+ALL_INT8 = np.arange(-128, 128)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_integer_threshold_matches_float_comparison(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        qp = QuantParams(zero_point=int(rng.integers(-128, 128)), scale=float(rng.uniform(1e-3, 0.5)))
+        value = float(rng.uniform(-128, 128) * qp.scale)
+        expected = (ALL_INT8 - qp.zero_point) * qp.scale > value
+        np.testing.assert_array_equal(ALL_INT8 > quantize_threshold(value, qp), expected)
+
+
+def test_dense_candidates_match_float_thresholding():
+    out = synthetic_outputs(640, num_objects=5, seed=2)
+    qp = QuantParams(zero_point=-128, scale=640 / 255)
+    q = quantize(out, qp)
+    rows = dequantize(q, qp)[0]
+    expected = rows[rows[:, 4] > CONF_THRESHOLD]
+    np.testing.assert_array_equal(dense_candidates(q, CONF_THRESHOLD, qp), expected)
+
+
+def test_int8_raw_heads_match_dequantized_float_heads():
+    heads = synthetic_raw_heads(640, num_objects=6, seed=5)
+    quant = [QuantParams(zero_point=int(z), scale=float(np.abs(h).max() / 127)) for h, z in zip(heads, (-3, 0, 7))]
+    q_heads = [quantize(h, qp) for h, qp in zip(heads, quant)]
+    float_heads = [dequantize(q, qp) for q, qp in zip(q_heads, quant)]
+    decoder = HeadDecoder(tuple(tuple(h.shape[1:]) for h in heads))
+    for conf_threshold in (CONF_THRESHOLD, 0.25):
+        predictions, rows = decoder.decode(q_heads, conf_threshold, quant)
+        expected, expected_rows = decoder.decode(float_heads, conf_threshold)
+        np.testing.assert_array_equal(rows, expected_rows)
+        np.testing.assert_allclose(predictions, expected, rtol=1e-6)
+        # 量化域中的整数阈值选中的格子, 正好是完整解码后 objectness 超过阈值的格子
+        dense = decoder.decode_dense(q_heads, quant)[0]
+        assert np.all(dense[rows, 4] > conf_threshold)
+        assert np.count_nonzero(dense[:, 4] > conf_threshold) == len(rows)
+
+
+def test_quantized_postprocess_matches_float_path():
+    out = synthetic_outputs(640, num_objects=5, seed=8)
+    qp = QuantParams(zero_point=-128, scale=640 / 255)
+    q = quantize(out, qp)
+    for target_class in (None, 2):
+        result = postprocess([q], 0.5, (0.0, 80.0), target_class, quant=[qp])
+        expected = postprocess([dequantize(q, qp)], 0.5, (0.0, 80.0), target_class)
+        for a, b in zip(result, expected):
+            np.testing.assert_array_equal(a, b)
+    with pytest.raises(ValueError):
+        postprocess([q], 0.5, (0.0, 80.0))
+
+
+def test_fake_runtime_returns_raw_outputs():
+    qp = QuantParams(zero_point=-128, scale=640 / 255)
+    runtime = FakeRKNNLite(latency=0, outputs=[synthetic_outputs(320, seed=1)], output_quant=[qp])
+    assert supports_raw_outputs(runtime)
+    assert not supports_raw_outputs(type('Legacy', (), {'inference': lambda self, inputs: None})())
+    img = np.zeros((1, 320, 320, 3), np.uint8)
+    raw = runtime.inference([img], want_float=False)[0]
+    assert raw.dtype == np.int8
+    np.testing.assert_array_equal(runtime.inference([img])[0], dequantize(raw, qp))
@@ -0,0 +1,134 @@
+import threading
+import cv2
+import numpy as np
+import pytest
+import vision_module
+from fake_npu import FakeRKNNLite, synthetic_outputs
+from vision_module import CLASSES, ObjectDetector, postprocess
+
+OUTPUTS = [synthetic_outputs(640, num_objects=3, seed=3)]
+PRESENT = sorted({CLASSES[c] for c in postprocess(OUTPUTS, 1.0, (0.0, 0.0))[2]})
+ABSENT = next(c for c in CLASSES if c not in PRESENT)
+
+
+class RecordedRKNNLite(FakeRKNNLite):
+    def __init__(self, verbose=False):
+        super().__init__(verbose=verbose, latency=0.001, outputs=OUTPUTS)
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    for i in range(30):
+        cv2.imwrite(str(tmp_path / f'{i:03d}.png'), rng.integers(0, 255, (640, 640, 3), dtype=np.uint8))
+    return tmp_path
+
+
+@pytest.fixture
+def make_detector(image_dir):
+    detectors = []
+
+    def make(**kwargs):
+        kwargs.setdefault('headless', True)
+        detector = ObjectDetector('model.rknn', str(image_dir), runtime_cls=RecordedRKNNLite, **kwargs)
+        detectors.append(detector)
+        return detector
+    yield make
+    for detector in detectors:
+        detector.release()
+
+
+@pytest.fixture
+def no_gui(monkeypatch):
+    """imshow / waitKey 不可用 (opencv-headless); key 为 waitKey 返回的按键"""
+    state = {'key': -1}
+    monkeypatch.setattr(vision_module.cv2, 'imshow', lambda name, img: None)
+    monkeypatch.setattr(vision_module.cv2, 'waitKey', lambda delay=0: state['key'])
+    monkeypatch.setattr(vision_module.cv2, 'destroyWindow', lambda name: None)
+    monkeypatch.setattr(vision_module.cv2, 'destroyAllWindows', lambda: None)
+    return state
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_headless_search_confirms_present_target(make_detector, pipelined):
+    result = make_detector(pipelined=pipelined).search_for_object(PRESENT[0])
+    assert result.found and result.reason == 'confirmed'
+    assert result.detections and all(d.label == PRESENT[0] for d in result.detections)
+
+
+def test_headless_search_cancel_and_timeout(make_detector):
+    detector = make_detector()
+    event = threading.Event()
+    event.set()
+    assert detector.search_for_object(ABSENT, cancel_event=event).reason == 'cancelled'
+    assert detector.search_for_object(ABSENT, timeout=0).reason == 'timeout'
+
+
+def test_live_search_keeps_result_frame_clean(no_gui, make_detector, image_dir):
+    detector = make_detector(headless=False)
+    no_gui['key'] = ord('q')
+    found, frame = detector.search_for_object_live(PRESENT[0])
+    assert not found
+    # 取消时返回原始帧 + 取消提示, 不包含检测框: 第一帧的检测框位置上的像素没有被改动
+    original = cv2.imread(str(image_dir / '000.png'))
+    boxes = postprocess(OUTPUTS, 1.0, (0.0, 0.0))[0]
+    x, y, w, h = boxes[0].astype(int)
+    np.testing.assert_array_equal(frame[y + h // 2, x], original[y + h // 2, x])
+    np.testing.assert_array_equal(frame[60:, :], original[60:, :])
+
+    no_gui['key'] = -1
+    found, frame = detector.search_for_object_live(PRESENT[0])
+    assert found and not np.array_equal(frame, original)  # 成功时返回带检测框的画面
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    frame = np.random.default_rng(1).integers(0, 255, (640, 640, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 3)  # 有纹理, 光流跟踪器可以跟住
+    for i in range(30):
+        cv2.imwrite(str(tmp_path / f'{i:03d}.png'), frame)
+    return tmp_path
+
+
+def test_motion_gate_reuse_is_not_confirmation_evidence(static_dir):
+    from motion_gate import MotionGate
+    gate = MotionGate(max_skip=100)
+    detector = ObjectDetector('model.rknn', str(static_dir), runtime_cls=RecordedRKNNLite, headless=True,
+                              motion_gate=gate)
+    try:
+        result = detector.search_for_object(PRESENT[0])
+    finally:
+        detector.release()
+    # 画面不变, 只推理了一次; 一次检测不能靠复用的结果凑够 5 帧
+    assert not result.found and result.reason == 'camera_error'
+    assert result.frames == 30 and gate.frames_skipped == 29
+
+
+@pytest.mark.parametrize('track_interval', [0, 3, 10])
+def test_tracking_does_not_delay_confirmation(static_dir, track_interval):
+    detector = ObjectDetector('model.rknn', str(static_dir), runtime_cls=RecordedRKNNLite, headless=True,
+                              track_interval=track_interval, confirmation='evidence')
+    try:
+        result = detector.search_for_object(PRESENT[0])
+        tracked = detector.last_stats.count.get('track', 0)
+    finally:
+        detector.release()
+    # 跟踪器的框不是确认证据, 确认之前每帧都检测: 和不跟踪时一样快确认
+    assert result.found and result.frames <= 5
+    assert tracked == 0
+
+
+def test_tracking_starts_after_confirmation(static_dir):
+    from confirmation import create_confirmer
+    detector = ObjectDetector('model.rknn', str(static_dir), runtime_cls=RecordedRKNNLite, headless=True,
+                              track_interval=10)
+    try:
+        items = list(detector.frames(PRESENT[0], confirmer=create_confirmer('evidence')))
+    finally:
+        detector.release()
+    confirmed_at = next(i for i, item in enumerate(items) if item.confirmed)
+    tracked = [i for i, item in enumerate(items) if item.tracked]
+    assert not any(item.tracked for item in items[:confirmed_at + 1])
+    # 确认之后跟踪器接手, 每 10 帧才检测一次
+    assert tracked and tracked[0] == confirmed_at + 1 and len(tracked) >= 20
+    assert all(item.class_ids.tolist() == [CLASSES.index(PRESENT[0])] for item in items if item.tracked)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from fake_npu import synthetic_raw_heads
+from quantized import QuantParams, quantize
+from vision_module import CONF_THRESHOLD, postprocess
+from yolo_heads import DEFAULT_ANCHORS, STRIDES, HeadDecoder, decode_heads
+
+
+def detect_reference(heads, anchors=DEFAULT_ANCHORS, strides=STRIDES):
+    """按 YOLOv5 Detect.forward 的公式逐层解码, 得到 [1, N, 5 + nc]"""
+    rows = []
+    for x, level_anchors, stride in zip(heads, anchors, strides):
+        _, channels, ny, nx = x.shape
+        na = len(level_anchors) // 2
+        y = 1 / (1 + np.exp(-x.astype(np.float64).reshape(na, channels // na, ny, nx).transpose(0, 2, 3, 1)))
+        yv, xv = np.meshgrid(np.arange(ny), np.arange(nx), indexing='ij')
+        grid = np.stack((xv, yv), axis=-1) - 0.5
+        anchor_grid = np.asarray(level_anchors, dtype=np.float64).reshape(na, 1, 1, 2)
+        y[..., :2] = (y[..., :2] * 2 + grid) * stride
+        y[..., 2:4] = (y[..., 2:4] * 2) ** 2 * anchor_grid
+        rows.append(y.reshape(-1, channels // na))
+    return np.concatenate(rows)[None]
+
+
+def decoder_for(heads):
+    return HeadDecoder(tuple(tuple(h.shape[1:]) for h in heads))
+
+
+@pytest.mark.parametrize('img_size, objects', [(640, 3), (320, 8)])
+def test_dense_decode_matches_detect(img_size, objects):
+    heads = synthetic_raw_heads(img_size, num_objects=objects, seed=objects)
+    expected = detect_reference(heads)
+    dense = decoder_for(heads).decode_dense(heads)
+    assert dense.shape == expected.shape
+    np.testing.assert_allclose(dense, expected, rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize('conf_threshold', [CONF_THRESHOLD, 0.25, 0.7])
+def test_sparse_decode_returns_the_detect_rows_above_threshold(conf_threshold):
+    heads = synthetic_raw_heads(640, num_objects=6, seed=11)
+    expected = detect_reference(heads)[0]
+    predictions, rows = decoder_for(heads).decode(heads, conf_threshold)
+    np.testing.assert_array_equal(rows, np.flatnonzero(expected[:, 4] > conf_threshold))
+    np.testing.assert_allclose(predictions, expected[rows], rtol=1e-5, atol=1e-3)
+    np.testing.assert_allclose(decode_heads(heads, conf_threshold), predictions)
+
+
+def test_postprocess_raw_heads_matches_dense_output():
+    heads = synthetic_raw_heads(640, num_objects=5, seed=4)
+    dense = detect_reference(heads).astype(np.float32)
+    for target_class in (None, 3):
+        boxes, scores, class_ids = postprocess(heads, 0.5, (0.0, 80.0), target_class)
+        expected = postprocess([dense], 0.5, (0.0, 80.0), target_class)
+        np.testing.assert_allclose(boxes, expected[0], rtol=1e-4, atol=1e-2)
+        np.testing.assert_allclose(scores, expected[1], rtol=1e-5)
+        np.testing.assert_array_equal(class_ids, expected[2])
+
+
+def test_int8_heads_without_quant_params_raise():
+    heads = synthetic_raw_heads(320, seed=0)
+    qp = QuantParams(zero_point=-10, scale=0.08)
+    q_heads = [quantize(h, qp) for h in heads]
+    decoder = decoder_for(q_heads)
+    with pytest.raises(ValueError, match='zero_point, scale'):
+        decoder.decode(q_heads, CONF_THRESHOLD)
+    with pytest.raises(ValueError, match='zero_point, scale'):
+        decoder.decode_dense(q_heads)
+    with pytest.raises(ValueError, match='zero_point, scale'):
+        postprocess(q_heads, 1.0, (0.0, 0.0))
@@ -1,14 +1,28 @@
 # vision_module.py (Corrected Version)
 
 import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
 import cv2
 import numpy as np
-from rknnlite.api import RKNNLite
+from pipeline import FramePipeline, StageStats
+from backends import create_backend
+from camera import LatestFrameGrabber, open_capture
+from box_tracker import BoxTracker
+from confirmation import create_confirmer
+from model_set import ModelSet, load_model_info
+from motion_gate import MotionGate
+from yolo_heads import decode_heads, is_raw_heads
+from quantized import dense_candidates, is_quantized, output_params
 
 # --- 全局配置 (保持不变) ---
 IMG_SIZE = 640
 CONF_THRESHOLD = 0.45
 NMS_THRESHOLD = 0.5
+MAX_CANDIDATES = 1000  # NMS 前最多保留的候选框数 (按目标置信度取 top-k)
+TRACK_MIN_CONFIDENCE = 0.5  # 跟踪置信度低于该值时立即重新运行检测
 CLASSES = ('wrench', 'hammer', 'file', 'tape_measure', 'multimeter',
            'pliers', 'screwdrivers', 'safety_goggles', 'feeler_gauge', 'vernier_caliper')
 
@@ -29,35 +43,105 @@ def letterbox(im, new_shape=(640, 640), color=(114, 114, 114)):
     im = cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
     return im, r, (dw, dh)
 
-def postprocess(outputs, ratio, pad):
-    predictions = np.squeeze(outputs[0])
-    obj_conf_mask = predictions[:, 4] > CONF_THRESHOLD
-    predictions = predictions[obj_conf_mask]
-    if not predictions.shape[0]: return [], [], []
-    class_scores = predictions[:, 5:]
-    class_ids = np.argmax(class_scores, axis=1)
-    scores = np.max(class_scores, axis=1) * predictions[:, 4]
+class Letterbox:
+    """
+    固定输入分辨率的 letterbox: 缩放比例和填充只在构造时计算一次,
+    并持有常驻的 [1, H, W, 3] uint8 输入缓冲区 (NHWC, 可直接送入 inference)。
+    每帧直接 resize 到缓冲区的内部区域 (dst=), 再原地做 BGR->RGB, 稳态下不分配新内存。
+    num_buffers > 1 时轮流使用多个缓冲区, 供流水线中同时在途的多帧使用。
+    """
+    def __init__(self, src_shape, new_shape=(640, 640), color=(114, 114, 114), num_buffers=1):
+        if isinstance(new_shape, int):
+            new_shape = (new_shape, new_shape)
+        self.src_shape = tuple(src_shape[:2])
+        self.new_shape = tuple(new_shape)
+        r = min(new_shape[0] / self.src_shape[0], new_shape[1] / self.src_shape[1])
+        new_unpad = int(round(self.src_shape[1] * r)), int(round(self.src_shape[0] * r))
+        dw = (new_shape[1] - new_unpad[0]) / 2
+        dh = (new_shape[0] - new_unpad[1]) / 2
+        top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+        self.ratio = r
+        self.pad = (dw, dh)
+        self.new_unpad = new_unpad
+        self.needs_resize = self.src_shape[::-1] != new_unpad
+        # color 与 letterbox() 一致, 是 RGB 图像上的填充色
+        self.buffers = [np.full((1, new_shape[0], new_shape[1], 3), color, dtype=np.uint8)
+                        for _ in range(num_buffers)]
+        self._inner = [buf[0, top:top + new_unpad[1], left:left + new_unpad[0]] for buf in self.buffers]
+        self._index = 0
+
+    def __call__(self, frame):
+        """frame 为 BGR 原图, 返回 (input [1, H, W, 3] RGB, ratio, pad)"""
+        i = self._index
+        self._index = (i + 1) % len(self.buffers)
+        inner = self._inner[i]
+        if self.needs_resize:
+            cv2.resize(frame, self.new_unpad, dst=inner, interpolation=cv2.INTER_LINEAR)
+            cv2.cvtColor(inner, cv2.COLOR_BGR2RGB, dst=inner)
+        else:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=inner)  # 拷贝和通道交换一次完成
+        return self.buffers[i], self.ratio, self.pad
+
+def nms_boxes(boxes, scores, class_ids, iou_threshold):
+    """
+    按类别 NMS, boxes 为 [N, 4] 的 (x1, y1, x2, y2), 返回保留框的下标 (按分数从高到低)。
+    不同类别的框先平移到互不重叠的区域, 这样一次 cv2.dnn.NMSBoxes 只会在同类框之间抑制。
+    (NumPy 写的贪心循环每保留一个框都要做一轮向量运算, 实测在几十到上千个候选时都比 NMSBoxes 加上 tolist 慢)
+    """
+    if not len(scores):
+        return np.zeros(0, dtype=np.intp)
+    offsets = class_ids.astype(boxes.dtype)[:, None] * (boxes.max() - boxes.min() + 1)
+    xywh = np.concatenate((boxes[:, :2] + offsets, boxes[:, 2:] - boxes[:, :2]), axis=1)
+    keep = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), 0.0, iou_threshold)
+    return np.asarray(keep, dtype=np.intp).reshape(-1)
+
+def postprocess(outputs, ratio, pad, target_class=None, anchors=None, quant=None):
+    """
+    target_class: 只关心单个类别时传入类别下标, 只计算该类别一列的分数, 只对该类别的候选做阈值和 NMS,
+                  其他类别的框不解码 (返回的 class_ids 全部为 target_class)。
+                  和 YOLOv5 的 multi_label 一样按该类别自身的分数判断, 不要求它是这一行的最高分类别
+    outputs 为三个检测层的原始输出 (export.py --raw-heads) 时, 先由 yolo_heads 只解码 objectness 超过阈值的格子,
+    anchors 为模型元数据中的 anchor (None 时使用 YOLOv5 默认值)
+    quant: INT8 模型每个输出的 (zero_point, scale); 输出为 int8 时在量化域中按 objectness 筛选, 只反量化通过的行
+    """
+    if is_raw_heads(outputs):
+        predictions = decode_heads(outputs, CONF_THRESHOLD, anchors, quant)
+    elif is_quantized(outputs[0]):
+        predictions = dense_candidates(outputs[0], CONF_THRESHOLD, output_params(outputs, 0, quant))
+    else:
+        predictions = np.squeeze(outputs[0])
+    # 1. 按目标置信度预筛选, 候选过多时用 argpartition 只保留 top-k, 只解码这些行
+    objectness = predictions[:, 4]
+    candidates = np.flatnonzero(objectness > CONF_THRESHOLD)
+    if candidates.size > MAX_CANDIDATES:
+        top = np.argpartition(objectness[candidates], -MAX_CANDIDATES)[-MAX_CANDIDATES:]
+        candidates = candidates[top]
+    if not candidates.size: return [], [], []
+    if target_class is None:
+        predictions = predictions[candidates]
+        class_ids = np.argmax(predictions[:, 5:], axis=1)
+        scores = predictions[np.arange(len(class_ids)), 5 + class_ids] * predictions[:, 4]
+    else:
+        scores = predictions[candidates, 5 + target_class] * objectness[candidates]
+        predictions = predictions[candidates, :4]
+        class_ids = np.full(len(scores), target_class)
     score_mask = scores > CONF_THRESHOLD
+    if not score_mask.any(): return [], [], []
     predictions = predictions[score_mask]
     class_ids = class_ids[score_mask]
     scores = scores[score_mask]
-    if not predictions.shape[0]: return [], [], []
-    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
-    x1 = cx - w / 2; y1 = cy - h / 2
-    boxes = np.column_stack((x1, y1, w, h))
-    indices = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), CONF_THRESHOLD, NMS_THRESHOLD)
-    if len(indices) == 0: return [], [], []
-    indices = indices.flatten()
-    final_boxes = boxes[indices]
-    final_scores = scores[indices]
-    final_class_ids = class_ids[indices]
-    final_boxes[:, 0] = (final_boxes[:, 0] - pad[0]) / ratio
-    final_boxes[:, 1] = (final_boxes[:, 1] - pad[1]) / ratio
-    final_boxes[:, 2] /= ratio
-    final_boxes[:, 3] /= ratio
-    final_boxes[:, 0] = np.clip(final_boxes[:, 0], 0, None)
-    final_boxes[:, 1] = np.clip(final_boxes[:, 1], 0, None)
-    return final_boxes, final_scores, final_class_ids
+    # 2. (cx, cy, w, h) -> (x1, y1, x2, y2), 按类别 NMS
+    half_wh = predictions[:, 2:4] / 2
+    boxes = np.concatenate((predictions[:, :2] - half_wh, predictions[:, :2] + half_wh), axis=1)
+    keep = nms_boxes(boxes, scores, class_ids, NMS_THRESHOLD)
+    boxes = boxes[keep]
+    # 3. 映射回原图坐标, 输出 (x, y, w, h)
+    final_boxes = np.empty_like(boxes)
+    final_boxes[:, 0] = np.clip((boxes[:, 0] - pad[0]) / ratio, 0, None)
+    final_boxes[:, 1] = np.clip((boxes[:, 1] - pad[1]) / ratio, 0, None)
+    final_boxes[:, 2] = (boxes[:, 2] - boxes[:, 0]) / ratio
+    final_boxes[:, 3] = (boxes[:, 3] - boxes[:, 1]) / ratio
+    return final_boxes, scores[keep], class_ids[keep]
 
 def draw_results(image, boxes, scores, class_ids, CLASSES):
     for box, score, class_id in zip(boxes, scores, class_ids):
@@ -68,96 +152,498 @@ def draw_results(image, boxes, scores, class_ids, CLASSES):
     return image
 
 
+# 结构化的搜索结果 (无界面模式下的返回值)
+Detection = namedtuple('Detection', ['label', 'score', 'box'])  # box 为原图上的 (x, y, w, h)
+SearchResult = namedtuple('SearchResult', [
+    'found',       # 是否确认找到目标
+    'target',      # 目标类别名
+    'reason',      # 'confirmed' / 'cancelled' / 'timeout' / 'camera_error'
+    'detections',  # 最后一帧的 [Detection, ...]
+    'frame',       # 最后一帧 (BGR)
+    'frames',      # 本次搜索处理的帧数
+    'elapsed_s',   # 本次搜索耗时 (秒)
+    'decision_s',  # 确认时: 从第一次看到目标到确认所用的时间 (秒), 否则为 None
+])
+
+
+class FrameItem:
+    """流水线中的一帧, 各级依次填充自己的结果"""
+    __slots__ = ('frame', 'capture_time', 'img_input', 'ratio', 'pad', 'outputs',
+                 'boxes', 'scores', 'class_ids', 'latency', 'tracked', 'model', 'reused', 'confirmed')
+
+    def __init__(self, frame, capture_time):
+        self.frame = frame
+        self.capture_time = capture_time  # time.perf_counter() 时间
+        self.img_input = None
+        self.ratio = 1.0
+        self.pad = (0.0, 0.0)
+        self.outputs = None
+        self.boxes, self.scores, self.class_ids = [], [], []
+        self.latency = None
+        self.tracked = False  # True 表示本帧结果来自 CPU 跟踪器, 没有运行检测
+        self.model = 0  # 本帧使用的模型在 ModelSet 中的下标
+        self.reused = False  # True 表示画面没有变化, 复用了上一次推理的检测结果
+        self.confirmed = False  # ObjectDetector.frames 给出确认策略时, 本帧之后目标是否已确认
+
+
 class ObjectDetector:
-    def __init__(self, model_path, camera_index):
+    def __init__(self, model_path, camera_index, pipelined=False, runtime_cls=None, npu_pool=False,
+                 latest_frame=False, backend='rknn', num_threads=4, headless=False,
+                 track_interval=0, tracker='flow', confirmation='consecutive', confirmation_args=None,
+                 switch_policy=None, motion_gate=False, capture_args=None):
+        """
+        camera_index: 摄像头编号 / '/dev/videoN' / GStreamer pipeline 字符串 / 视频文件 / 图片目录 (见 camera.open_capture)
+        model_path: 模型路径, 或不同输入尺寸的多个模型路径的列表 (见 model_set.py), 输入尺寸和类别
+                    从模型旁的 .json 元数据读取; 多个模型时扫描阶段用最小的, 看到目标后切到最大的确认
+        pipelined: 为 True 时 search_for_object_live 使用多线程流水线 (采集/预处理/推理/后处理并行)
+        runtime_cls: rknn 后端使用的运行时类, 默认 RKNNLite; 开发机上可传入 fake_npu.FakeRKNNLite
+        npu_pool: 为 True 时在 3 个 NPU 核心上各建一个上下文, 轮询分发帧 (见 npu_pool.RKNNPool)
+        latest_frame: 为 True 时用后台线程持续读取摄像头, 每次只处理最新一帧 (见 camera.LatestFrameGrabber)
+        backend: 'rknn' / 'onnx' / 'opencv' / 'fake' (见 backends.py), onnx 和 opencv 的 model_path 为 .onnx
+        num_threads: onnx / opencv 后端的 CPU 线程数
+        headless: 无界面模式, 不创建任何窗口 (搜索请使用 search_for_object)
+        track_interval: 大于 1 时, 检测到目标后交给 CPU 跟踪器, 每 track_interval 帧才重新运行一次检测
+                        (跟踪置信度下降时提前检测), 只在串行模式下生效; 搜索时要等目标确认之后才开始跟踪
+        tracker: 'flow' (LK 光流) / 'kcf' / 'mosse' (见 box_tracker.py)
+        confirmation: 目标确认策略 'consecutive' (连续 5 帧) / 'evidence' (时间窗口内按分数和位置一致性累积证据),
+                      confirmation_args 为传给该策略的参数字典 (见 confirmation.py)
+        switch_policy: 多个模型时的切换策略 (model_set.SwitchPolicy), 可以按帧延迟预算和小车速度降档
+        motion_gate: True 或 motion_gate.MotionGate 实例时, 画面相对上一次推理没有变化的帧不推理,
+                     直接复用上一次的检测结果 (小车停下时节省 NPU)
+        capture_args: 传给 camera.open_capture 的参数, 如 {'fourcc': 'MJPG', 'auto_mode': True}
+        """
         print("--- Initializing Vision Module (Model & Camera) ---")
-        self.rknn_lite = RKNNLite(verbose=False)
-        print(f'--> Loading RKNN model: {model_path}')
-        if self.rknn_lite.load_rknn(model_path) != 0: exit(f"Failed to load RKNN model: {model_path}")
-        print('--> Init runtime environment')
-        if self.rknn_lite.init_runtime(core_mask=RKNNLite.NPU_CORE_0_1_2) != 0: exit("Failed to init RKNN runtime")
-        self.cap = cv2.VideoCapture(camera_index)
+        def load(path):
+            # 元数据中有输出的量化参数时, 请求 int8 原始输出, 在后处理中只反量化通过阈值的行
+            want_float = load_model_info(path).quant is None
+            return create_backend(backend, path, num_threads=num_threads, runtime_cls=runtime_cls, npu_pool=npu_pool,
+                                  want_float=want_float)
+        try:
+            self.model_set = ModelSet(model_path, load, policy=switch_policy,
+                                      default_size=IMG_SIZE, default_classes=CLASSES)
+        except RuntimeError as e:
+            exit(str(e))
+        self.backend = self.model_set.current.backend
+        self.backend_name = backend
+        self.npu_pool = npu_pool and backend == 'rknn'
+        largest = self.model_set[len(self.model_set) - 1].info.img_size
+        self.cap = open_capture(camera_index, model_size=(largest, largest), **(capture_args or {}))
         if not self.cap.isOpened():
             print(f"Error: Could not open camera {camera_index}")
             exit(-1)
-        self.IMG_SIZE = IMG_SIZE
-        self.CLASSES = CLASSES
+        self.latest_frame = latest_frame
+        if latest_frame:
+            self.cap = LatestFrameGrabber(self.cap).start()
+        self.IMG_SIZE = self.model_set.current.info.img_size
+        self.CLASSES = self.model_set.classes
+        self.speed = None  # 小车当前速度, 由 set_speed 更新, 供模型切换策略使用
+        self.pipelined = pipelined
+        self.headless = headless
+        self.last_stats = None  # 最近一次搜索的分级耗时/占用率统计
+        self.track_interval = track_interval
+        self.tracker_method = tracker
+        self.confirmer = create_confirmer(confirmation, **(confirmation_args or {}))
+        if track_interval > 1 and pipelined:
+            print("--> Warning: tracker-assisted frame skipping only applies in sequential mode, ignored")
+        self._letterboxes = {}  # (摄像头分辨率, 模型输入尺寸) -> Letterbox
+        self._num_input_buffers = 1
+        self._decode_class = None  # 不为 None 时后处理只解码这一类 (无界面搜索时)
+        self.motion_gate = MotionGate() if motion_gate is True else (motion_gate or None)
+        self._gate_model = None  # 参考帧推理时使用的模型
+        self._last_detections = ([], [], [])  # 最近一次真正推理的结果, 供被门控跳过的帧复用
+        self.ready = threading.Event()  # warm_up() 完成后 set
+        self.warmup_timings = None
         print("--- Vision Module Initialized Successfully ---")
 
-    def search_for_object_live(self, target_label):
+    def _pipeline_queue_size(self):
+        return len(self.backend) if self.npu_pool else 2
+
+    def _set_input_buffers(self, pipelined):
+        """按运行模式设置每个 Letterbox 的输入缓冲区个数, 个数变化时才重新创建"""
+        if pipelined:
+            queue_size = self._pipeline_queue_size()
+            # 输入缓冲区从预处理一直被占用到推理完成: 预处理中 1 帧 + 队列中 queue_size 帧 + 推理中 1 帧,
+            # 使用上下文池时还要加上已提交、尚未被后处理取走的 queue_size + 1 帧
+            num = queue_size + 2 + (queue_size + 1 if self.npu_pool else 0)
+        else:
+            num = 1
+        if num != self._num_input_buffers:
+            self._num_input_buffers = num
+            self._letterboxes = {}
+
+    def warm_up(self, num_inferences=3, max_prime_frames=60, stable_frames=5, tolerance=0.25):
         """
-        *** 【已修正的核心功能】 ***
+        预热: 第一次 inference 和第一次读摄像头都比稳态慢很多, 在收到第一条指令之前把这些开销付掉。
+          1. 读摄像头直到最近 stable_frames 个帧间隔都在中位数的 ±tolerance 以内 (最多 max_prime_frames 帧)
+          2. 按摄像头分辨率为每个模型预先创建 letterbox 缓冲区
+          3. 每个模型 (上下文池的每个核心) 用真实画面推理 num_inferences 次, 并跑一遍后处理
+        完成后 set self.ready, 各步耗时记录在 self.warmup_timings 中并返回。
+        """
+        print("--- Warming up vision module ---")
+        t_start = time.perf_counter()
+        timings = {}
+        # 1. 摄像头
+        frame, stamps = None, []
+        for _ in range(max_prime_frames):
+            ret, new_frame = self.cap.read()
+            if not ret:
+                break
+            frame = new_frame
+            stamps.append(time.perf_counter())
+            intervals = np.diff(stamps[-(stable_frames + 1):])
+            if len(intervals) == stable_frames and \
+                    np.all(np.abs(intervals - np.median(intervals)) <= tolerance * np.median(intervals)):
+                break
+        if frame is None:
+            print("Error: Failed to capture frame from camera during warm-up.")
+            return None
+        timings['camera_first_frame_ms'] = (stamps[0] - t_start) * 1000
+        timings['camera_prime_frames'] = len(stamps)
+        timings['camera_interval_ms'] = float(np.median(np.diff(stamps))) * 1000 if len(stamps) > 1 else None
+        # 2 + 3. 缓冲区和推理
+        self._set_input_buffers(self.pipelined)
+        timings['inference_ms'] = {}
+        for index, entry in enumerate(self.model_set):
+            size = entry.info.img_size
+            letterbox = self._letterboxes.get((frame.shape[:2], size))
+            if letterbox is None:
+                letterbox = self._letterboxes[(frame.shape[:2], size)] = Letterbox(
+                    frame.shape, new_shape=(size, size), num_buffers=self._num_input_buffers)
+            img_input, ratio, pad = letterbox(frame)
+            runs = num_inferences * (len(entry.backend) if self.npu_pool else 1)  # 每个核心的上下文都要预热
+            times = []
+            for _ in range(max(runs, 1)):
+                t0 = time.perf_counter()
+                if self.npu_pool:
+                    futures = [entry.backend.submit(inputs=[img_input]) for _ in range(len(entry.backend))]
+                    outputs = [f.result() for f in futures][-1]
+                else:
+                    outputs = entry.backend.inference(inputs=[img_input])
+                times.append((time.perf_counter() - t0) * 1000)
+            postprocess(outputs, ratio, pad, anchors=entry.info.anchors, quant=entry.info.quant)
+            timings['inference_ms'][size] = {'first': times[0], 'steady': float(np.median(times[1:] or times))}
+        timings['total_ms'] = (time.perf_counter() - t_start) * 1000
+        self.warmup_timings = timings
+        self.ready.set()
+        inference = ', '.join(f"{size}: first {t['first']:.1f}ms -> {t['steady']:.1f}ms"
+                              for size, t in timings['inference_ms'].items())
+        interval = timings['camera_interval_ms']
+        print(f"--- Warm-up done in {timings['total_ms']:.0f}ms | camera: first frame "
+              f"{timings['camera_first_frame_ms']:.0f}ms, {timings['camera_prime_frames']} frames to stabilise"
+              f"{f' at {interval:.1f}ms' if interval else ''} | inference {inference} ---")
+        return timings
+
+    def set_speed(self, speed):
+        """更新小车速度 (单位与 SwitchPolicy.fast_speed 一致), 速度快时切换到小尺寸模型"""
+        self.speed = speed
+
+    def _select_model(self, phase, latency=None):
+        """按搜索阶段 / 帧延迟 / 速度切换当前模型, 之后预处理的帧都按新模型的输入尺寸 letterbox"""
+        if len(self.model_set) < 2:
+            return
+        index = self.model_set.update(phase=phase, latency=latency, speed=self.speed)
+        self.backend = self.model_set[index].backend
+        self.IMG_SIZE = self.model_set[index].info.img_size
+
+    # --- 流水线各级 ---
+    def _capture(self):
+        if self.latest_frame:
+            ret, frame, capture_time, _ = self.cap.read_latest()
+        else:
+            ret, frame = self.cap.read()
+            capture_time = time.perf_counter()
+        if not ret:
+            print("Error: Failed to capture frame from camera.")
+            return None
+        return FrameItem(frame, capture_time)
+
+    def _preprocess(self, item):
+        frame = item.frame
+        item.model = self.model_set.active
+        if self.motion_gate is not None:
+            # 切换模型后强制推理一次, 这样复用的结果总是来自当前模型
+            if not self.motion_gate.should_infer(frame, force=item.model != self._gate_model):
+                item.reused = True
+                return item
+            self._gate_model = item.model
+        img_size = self.model_set[item.model].info.img_size
+        key = (frame.shape[:2], img_size)
+        letterbox = self._letterboxes.get(key)
+        if letterbox is None:
+            # 每种摄像头分辨率 / 模型输入尺寸只创建一次, 之后每帧复用缓冲区
+            letterbox = self._letterboxes[key] = Letterbox(frame.shape, new_shape=(img_size, img_size),
+                                                           num_buffers=self._num_input_buffers)
+        item.img_input, item.ratio, item.pad = letterbox(frame)
+        return item
+
+    def _infer(self, item):
+        if item.reused:
+            return item
+        item.outputs = self.model_set[item.model].backend.inference(inputs=[item.img_input])
+        return item
+
+    def _submit(self, item):
+        # 流水线 + 上下文池: 推理级只负责提交, 多帧同时在不同核心上推理, 由后处理级按顺序等待结果
+        if item.reused:
+            return item
+        item.outputs = self.model_set[item.model].backend.submit(inputs=[item.img_input])
+        return item
+
+    def _postprocess(self, item):
+        if isinstance(item.outputs, Future):
+            item.outputs = item.outputs.result()
+        if item.reused:
+            # 帧按采集顺序到达后处理, 被跳过的帧之前的那一帧一定已经处理完
+            item.boxes, item.scores, item.class_ids = self._last_detections
+        elif item.outputs:
+            info = self.model_set[item.model].info
+            item.boxes, item.scores, item.class_ids = postprocess(
+                item.outputs, item.ratio, item.pad, target_class=self._decode_class,
+                anchors=info.anchors, quant=info.quant)
+            self._last_detections = (item.boxes, item.scores, item.class_ids)
+        else:
+            self._last_detections = ([], [], [])
+        item.latency = time.perf_counter() - item.capture_time  # 从采集到检测结果可用的延迟
+        self.last_stats.add_latency(item.latency)
+        return item
+
+    def _start_tracker(self, item, target_id):
+        """用本帧检测到的分数最高的目标框初始化跟踪器, 返回 (tracker, score), 本帧没有目标时返回 (None, 0)"""
+        hits = [i for i, cid in enumerate(item.class_ids) if cid == target_id]
+        if not hits:
+            return None, 0.0
+        best = max(hits, key=lambda i: item.scores[i])
+        tracker = BoxTracker(self.tracker_method)
+        if not tracker.init(item.frame, item.boxes[best]):
+            return None, 0.0
+        return tracker, float(item.scores[best])
+
+    def _sequential_frames(self, target_id=None, track_ready=None):
+        """
+        逐帧串行执行各级, 产出处理完的 FrameItem。
+        开启跟踪 (track_interval > 1 且给出 target_id) 时, 检测到目标后的帧由 CPU 跟踪器给出目标框,
+        每 track_interval 帧或跟踪置信度低于 TRACK_MIN_CONFIDENCE 时才重新运行检测。
+        track_ready: 返回 False 时不启动跟踪 (调用者处理完每一帧后检查, 见 frames)
+        """
+        tracking = self.track_interval > 1 and target_id is not None
+        stats = StageStats(['capture', 'preprocess', 'inference', 'postprocess'] + (['track'] if tracking else []))
+        self.last_stats = stats
+        self._set_input_buffers(pipelined=False)
+        tracker, track_score, since_detect = None, 0.0, 0
+        try:
+            while True:
+                t0 = time.perf_counter()
+                item = self._capture()
+                t1 = time.perf_counter()
+                stats.add('capture', t1 - t0)
+                if item is None:
+                    break
+                if tracker is not None and since_detect < self.track_interval:
+                    ok, box, confidence = tracker.update(item.frame)
+                    if ok and confidence >= TRACK_MIN_CONFIDENCE:
+                        item.boxes = np.array([box], dtype=np.float32)
+                        item.scores = np.array([track_score * confidence], dtype=np.float32)
+                        item.class_ids = np.array([target_id])
+                        item.tracked = True
+                        item.latency = time.perf_counter() - item.capture_time
+                        stats.add_latency(item.latency)
+                        stats.add('track', time.perf_counter() - t1)
+                        since_detect += 1
+                        stats.frame_done()
+                        yield item
+                        continue
+                    tracker = None  # 跟丢或置信度下降, 本帧重新检测
+                    t1 = time.perf_counter()
+                item = self._preprocess(item)
+                t2 = time.perf_counter()
+                stats.add('preprocess', t2 - t1)
+                item = self._infer(item)
+                t3 = time.perf_counter()
+                stats.add('inference', t3 - t2)
+                item = self._postprocess(item)
+                stats.add('postprocess', time.perf_counter() - t3)
+                stats.frame_done()
+                yield item
+                if tracking and (track_ready is None or track_ready()):
+                    tracker, track_score = self._start_tracker(item, target_id)
+                    since_detect = 1
+        finally:
+            stats.finish()
+
+    def _pipelined_frames(self):
+        """各级在独立线程中并行执行, 产出顺序与采集顺序一致"""
+        queue_size = self._pipeline_queue_size()
+        self._set_input_buffers(pipelined=True)
+        pipeline = FramePipeline(self._capture, [
+            ('preprocess', self._preprocess),
+            ('inference', self._submit if self.npu_pool else self._infer),
+            ('postprocess', self._postprocess),
+        ], queue_size=queue_size)
+        self.last_stats = pipeline.stats
+        pipeline.start()
+        try:
+            for item in pipeline:
+                yield item
+        finally:
+            pipeline.stop()
+
+    def frames(self, target_label=None, decode_all=False, confirmer=None):
+        """
+        逐帧产出检测结果 (FrameItem), 直到摄像头没有新的画面或生成器被关闭。
+        搜索 (search_for_object / search_for_object_live) 和 async_detector.AsyncDetector.frames 都使用它:
+          开始时重置运动门控并切到扫描阶段的模型, 每帧被处理完后按阶段和帧延迟选择下一帧的模型
+          target_label: 目标类别名; 串行模式下启用跟踪 (track_interval), decode_all 为 False 时后处理只解码该类别
+          confirmer: 确认策略 (confirmation.py), 给出时先 reset, 每帧用真正的检测结果更新, 结果记在 item.confirmed,
+                     还没看到目标时用小模型扫描, 看到后切到大模型确认; 不给出时按最近一次检测中是否有目标选择。
+                     跟踪器给出的框不作为确认证据 (它只是在跟随一次检测), 所以目标确认之前不启动跟踪,
+                     每帧都运行检测; 确认之后才用跟踪器跳过检测
+        所有状态只在迭代生成器的线程中修改, 生成器要在同一个线程中关闭 (close)。
+        """
+        target_id = self.CLASSES.index(target_label) if target_label in self.CLASSES else None
+        if confirmer is not None:
+            confirmer.reset()
+        # 看到过目标 (确认阶段) 吗; 不给出目标类别也不给出确认策略时一直用最大的模型
+        seen = confirmer is None and target_id is None
+        self._decode_class = None if decode_all else target_id
+        self._select_model('confirm' if seen else 'scan')
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+            self._gate_model = None
+            self._last_detections = ([], [], [])
+        confirmed = confirmer is None
+        frames = self._pipelined_frames() if self.pipelined else \
+            self._sequential_frames(target_id, track_ready=lambda: confirmed)
+        try:
+            for item in frames:
+                # 复用上一次推理 / 跟踪器给出的结果不是新的检测, 不作为确认证据;
+                # 否则一次推理 (哪怕是误检) 会在静止的画面上和自己匹配多帧而被确认
+                if not (item.reused or item.tracked):
+                    hits = np.asarray(item.class_ids) == target_id if target_id is not None else None
+                    if confirmer is not None:
+                        if hits is not None and hits.any():
+                            item.confirmed = confirmer.update(item.boxes[hits], item.scores[hits], item.capture_time)
+                        else:
+                            item.confirmed = confirmer.update((), (), item.capture_time)
+                        seen = confirmer.first_seen is not None
+                        confirmed = confirmed or item.confirmed
+                    elif hits is not None:
+                        seen = bool(hits.any())
+                yield item
+                # 调用者处理完这一帧后再选择下一帧的模型: 还没看到目标时用小模型扫描, 看到目标后切到大模型确认
+                self._select_model('confirm' if seen else 'scan', item.latency)
+        finally:
+            frames.close()  # 停止流水线线程
+            self._decode_class = None
+
+    def _search_loop(self, target_label, show, cancel_event=None, timeout=None):
+        """
+        搜索主循环, 返回 (SearchResult, 最后显示的带叠加信息的画面)。
+        show 为 False 时 (无界面模式) 不绘制任何叠加信息、不创建窗口、不调用 waitKey, 只能通过
+        cancel_event / timeout 取消, 第二个返回值为 None; 为 True 时和原来一样显示实时窗口, 按 'q' 取消。
+        叠加信息画在副本上, SearchResult.frame 总是原始画面。
         """
-        print(f"\nLive searching for '{target_label}'... Press 'q' to cancel.")
         live_window_name = "Live Search - Looking for " + target_label
         
-        found_counter = 0
-        CONFIRMATION_THRESHOLD = 5  # 连续检测到5帧才算成功，防止抖动
+        confirmer = self.confirmer
         
-        final_result_frame = None
-        was_successful = False
-        was_cancelled = False
+        reason = 'camera_error'  # 如果循环因其他原因退出 (如摄像头断开)
+        last_item, display_frame = None, None
+        num_frames = 0
+        start_time = time.perf_counter()
 
-        while True:
-            # 1. 捕获帧
-            ret, frame = self.cap.read()
-            if not ret:
-                print("Error: Failed to capture frame from camera.")
-                break
+        # 1+2+3. 采集、推理、后处理 (串行或流水线), 并更新确认状态
+        # 不显示叠加画面时, 其他类别的框没有用处, 后处理只解码目标类别
+        frames = self.frames(target_label, decode_all=show, confirmer=confirmer)
+        for item in frames:
+            last_item = item
+            num_frames += 1
 
-            # 2. 推理
-            img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img_processed, ratio, pad = letterbox(img_rgb, new_shape=(self.IMG_SIZE, self.IMG_SIZE))
-            outputs = self.rknn_lite.inference(inputs=[np.expand_dims(img_processed, axis=0)])
-            
-            # 3. 后处理和状态更新
-            display_frame = frame.copy()
-            target_this_frame = False
-            
-            if outputs:
-                boxes, scores, class_ids = postprocess(outputs, ratio, pad)
-                display_frame = draw_results(display_frame, boxes, scores, class_ids, self.CLASSES)
-                if target_label in [self.CLASSES[cid] for cid in class_ids]:
-                    target_this_frame = True
-            
-            if target_this_frame:
-                found_counter += 1
-            else:
-                found_counter = 0 # 如果断了，就重置计数器
-
-            # 4. 在实时画面上绘制状态信息
-            if found_counter > 0:
-                progress_text = f"Confirming: {found_counter}/{CONFIRMATION_THRESHOLD}"
-                cv2.putText(display_frame, progress_text, (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
-
-            # 5. 显示实时窗口 (这是每帧都必须做的)
-            cv2.imshow(live_window_name, display_frame)
-
-            # 6. 等待并处理按键 (这是让GUI刷新的关键!)
-            key = cv2.waitKey(1) & 0xFF
+            key = -1
+            if show:
+                # 4. 在实时画面的副本上绘制检测框和状态信息 (原始画面作为结果返回)
+                display_frame = draw_results(item.frame.copy(), item.boxes, item.scores, item.class_ids, self.CLASSES)
+                progress_text = confirmer.progress_text()
+                if progress_text:
+                    cv2.putText(display_frame, progress_text, (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 0), 2)
+
+                # 5. 显示实时窗口 (这是每帧都必须做的)
+                cv2.imshow(live_window_name, display_frame)
+
+                # 6. 等待并处理按键 (这是让GUI刷新的关键!)
+                key = cv2.waitKey(1) & 0xFF
 
             # 7. 在所有绘制和显示操作之后，再检查退出条件
-            if found_counter >= CONFIRMATION_THRESHOLD:
-                print(f"==> Target '{target_label}' CONFIRMED!")
-                was_successful = True
-                final_result_frame = display_frame # 保存这一帧作为最终结果
+            if item.confirmed:
+                print(f"==> Target '{target_label}' CONFIRMED! ({num_frames} frames, "
+                      f"{confirmer.decision_s:.2f}s from first sighting)")
+                reason = 'confirmed'
                 break # 退出循环
 
-            if key == ord('q'):
-                print("Search cancelled by user.")
-                was_cancelled = True
-                final_result_frame = frame # 保存原始帧用于显示取消信息
+            if key == ord('q') or (cancel_event is not None and cancel_event.is_set()):
+                print("Search cancelled.")
+                reason = 'cancelled'
                 break # 退出循环
 
-        # --- 循环结束后的清理和返回逻辑 ---
-        cv2.destroyWindow(live_window_name)
+            if timeout is not None and time.perf_counter() - start_time > timeout:
+                print(f"Search for '{target_label}' timed out after {timeout}s.")
+                reason = 'timeout'
+                break
+        frames.close()  # 停止流水线线程
+        if self.last_stats is not None:
+            print(f"[Vision stats] {'pipelined' if self.pipelined else 'sequential'}: {self.last_stats.summary()}")
+            if 'track' in self.last_stats.count:
+                tracked, detected = self.last_stats.count['track'], self.last_stats.count['inference']
+                print(f"[Vision stats] tracked/detected frames: {tracked}/{detected}"
+                      f" ({tracked / max(tracked + detected, 1) * 100:.0f}% of frames skipped the NPU)")
+        if self.motion_gate is not None:
+            print(f"[Vision stats] {self.motion_gate.summary()}")
+        if len(self.model_set) > 1:
+            sizes = [entry.info.img_size for entry in self.model_set]
+            print(f"[Vision stats] models {sizes}: {self.model_set.switches} switches so far, active {self.IMG_SIZE}")
+        if self.latest_frame:
+            print(f"[Vision stats] camera frames grabbed: {self.cap.frames_grabbed}, dropped: {self.cap.frames_dropped}")
+        if show:
+            cv2.destroyWindow(live_window_name)
+
+        detections = []
+        if last_item is not None:
+            detections = [Detection(self.CLASSES[cid], float(score), tuple(float(v) for v in box))
+                          for box, score, cid in zip(last_item.boxes, last_item.scores, last_item.class_ids)]
+        result = SearchResult(
+            found=reason == 'confirmed', target=target_label, reason=reason,
+            detections=detections, frame=last_item.frame if last_item is not None else None,
+            frames=num_frames, elapsed_s=time.perf_counter() - start_time,
+            decision_s=confirmer.decision_s if reason == 'confirmed' else None,
+        )
+        return result, display_frame
+
+    def search_for_object(self, target_label, cancel_event=None, timeout=None):
+        """
+        无界面搜索: 不绘制、不创建窗口, 以纯推理速度运行。
+        cancel_event: threading.Event, 被 set 后在下一帧结束搜索
+        timeout: 最长搜索时间 (秒), None 表示不限
+        只解码目标类别 (postprocess 的 target_class), 所以返回的 SearchResult 中 detections 只包含
+        最后一帧的目标检测结果, frame 为最后一帧原图 (无叠加)
+        """
+        print(f"\nSearching for '{target_label}' (headless)...")
+        return self._search_loop(target_label, show=False, cancel_event=cancel_event, timeout=timeout)[0]
 
-        if was_successful:
+    def search_for_object_live(self, target_label, cancel_event=None):
+        """
+        *** 【已修正的核心功能】 ***
+        带实时窗口的搜索, 返回 (是否找到, 结果帧)。
+        """
+        print(f"\nLive searching for '{target_label}'... Press 'q' to cancel.")
+        result, display_frame = self._search_loop(target_label, show=True, cancel_event=cancel_event)
+
+        # --- 循环结束后的返回逻辑 ---
+        if result.reason == 'confirmed':
             status_text = f"SUCCESS: Found {target_label}"
-            cv2.putText(final_result_frame, status_text, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            return True, final_result_frame
+            cv2.putText(display_frame, status_text, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            return True, display_frame  # 保存这一帧 (带检测框) 作为最终结果
         
-        if was_cancelled:
+        if result.reason == 'cancelled':
+            final_result_frame = result.frame.copy()  # 原始帧用于显示取消信息
             status_text = f"CANCELLED: Search for {target_label} was cancelled."
             cv2.putText(final_result_frame, status_text, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
             return False, final_result_frame
@@ -165,12 +651,12 @@ class ObjectDetector:
         # 如果循环因其他原因退出 (如摄像头断开)
         return False, None
 
-
     def release(self):
         """释放所有资源"""
         print("--- Releasing vision resources... ---")
         if self.cap and self.cap.isOpened():
             self.cap.release()
-        self.rknn_lite.release()
-        cv2.destroyAllWindows()
+        self.model_set.release()
+        if not self.headless:
+            cv2.destroyAllWindows()
         print("Vision resources released.")
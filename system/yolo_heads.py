@@ -0,0 +1,95 @@
+# yolo_heads.py
+# 拆分检测头的主机端解码。export.py --raw-heads 导出的模型不在 NPU 上做 sigmoid / 网格 / anchor 计算,
+# 直接输出三个检测层卷积的原始结果 [1, na * (5 + nc), ny, nx] (stride 8 / 16 / 32)。
+# 解码时先只读 objectness 通道 (每个 anchor 一块连续内存), 在 logit 上和阈值比较 (sigmoid 单调, 阈值的 logit
+# 只算一次), 只对通过的格子做 sigmoid 和网格 / anchor 计算; 网格和 anchor 表按输出形状缓存。
+# 得到的行与 YOLOv5 Detect 输出 [1, N, 5 + nc] 中 objectness 超过阈值的行相同, 顺序也相同 (层, anchor, y, x)。
+# INT8 模型的 int8 输出 (见 quantized.py) 直接在量化域里和整数化的 logit 阈值比较, 只反量化通过的格子。
+
+from functools import lru_cache
+import numpy as np
+from quantized import dequantize, output_params, quantize_threshold
+
+STRIDES = (8, 16, 32)  # P3 / P4 / P5
+DEFAULT_ANCHORS = ((10, 13, 16, 30, 33, 23),  # yolov5s 默认 anchor (像素), 每层 3 个 (w, h)
+                   (30, 61, 62, 45, 59, 119),
+                   (116, 90, 156, 198, 373, 326))
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _logit(p):
+    return float(np.log(p / (1.0 - p)))
+
+
+class HeadDecoder:
+    def __init__(self, shapes, anchors=DEFAULT_ANCHORS, strides=STRIDES):
+        """shapes: 每层输出的 (C, ny, nx); anchors: 每层 [w0, h0, w1, h1, ...] (像素)"""
+        self.na = len(anchors[0]) // 2
+        self.no = shapes[0][0] // self.na
+        self.levels = []
+        base = 0
+        for (channels, ny, nx), level_anchors, stride in zip(shapes, anchors, strides):
+            yv, xv = np.mgrid[0:ny, 0:nx]
+            # Detect: xy = (sigmoid * 2 + grid - 0.5) * stride, 这里预先算好 (grid - 0.5) * stride
+            grid = ((np.stack((xv.ravel(), yv.ravel()), axis=1) - 0.5) * stride).astype(np.float32)
+            # Detect: wh = (sigmoid * 2) ** 2 * anchor = sigmoid ** 2 * (4 * anchor)
+            anchor_wh = (np.asarray(level_anchors, dtype=np.float32).reshape(self.na, 2) * 4)
+            self.levels.append((ny * nx, float(stride), grid, anchor_wh, base))
+            base += self.na * ny * nx
+        self.num_rows = base  # 对应 Detect 输出的 N (640 输入时为 25200)
+
+    def decode(self, outputs, conf_threshold, quant=None):
+        """
+        返回 (predictions [K, 5 + nc] float32, rows [K]: 在 Detect 输出中的行号), 只含 objectness > conf_threshold 的行。
+        quant: 每个输出的 quantized.QuantParams, 输出为 int8 时使用 (没有时抛出 ValueError)
+        """
+        threshold = _logit(conf_threshold)
+        parts, rows = [], []
+        for i, (out, (cells, stride, grid, anchor_wh, base)) in enumerate(zip(outputs, self.levels)):
+            x = out.reshape(self.na, self.no, cells)  # 连续的 NCHW 输出, reshape 不拷贝
+            qp = output_params(outputs, i, quant)
+            level_threshold = threshold if qp is None else quantize_threshold(threshold, qp)
+            a_idx, cell = np.nonzero(x[:, 4, :] > level_threshold)
+            if not a_idx.size:
+                continue
+            v = x[a_idx, :, cell]  # 只取出通过的 K 行 [K, no]
+            v = _sigmoid(v.astype(np.float32) if qp is None else dequantize(v, qp))
+            v[:, :2] = v[:, :2] * (2 * stride) + grid[cell]
+            v[:, 2:4] = v[:, 2:4] ** 2 * anchor_wh[a_idx]
+            parts.append(v)
+            rows.append(base + a_idx * cells + cell)
+        if not parts:
+            return np.zeros((0, self.no), np.float32), np.zeros(0, np.intp)
+        return np.concatenate(parts), np.concatenate(rows)
+
+    def decode_dense(self, outputs, quant=None):
+        """完整解码所有格子, 与 Detect 的 [1, N, 5 + nc] 输出相同 (验证和基准测试用)"""
+        parts = []
+        for i, (out, (cells, stride, grid, anchor_wh, base)) in enumerate(zip(outputs, self.levels)):
+            qp = output_params(outputs, i, quant)
+            if qp is not None:
+                out = dequantize(out, qp)
+            v = _sigmoid(out.reshape(self.na, self.no, cells).transpose(0, 2, 1).astype(np.float32))
+            v[..., :2] = v[..., :2] * (2 * stride) + grid
+            v[..., 2:4] = v[..., 2:4] ** 2 * anchor_wh[:, None, :]
+            parts.append(v.reshape(-1, self.no))
+        return np.concatenate(parts)[None]
+
+
+@lru_cache(maxsize=8)
+def get_decoder(shapes, anchors=None):
+    """按输出形状 (和 anchor) 缓存的 HeadDecoder, 网格和 anchor 表只在第一次用到时计算"""
+    return HeadDecoder(shapes, anchors or DEFAULT_ANCHORS)
+
+
+def is_raw_heads(outputs):
+    return len(outputs) == len(STRIDES) and all(o.ndim == 4 for o in outputs)
+
+
+def decode_heads(outputs, conf_threshold, anchors=None, quant=None):
+    """outputs: 三个检测层的原始输出 (float 或 int8); 返回 objectness 超过阈值的已解码行 [K, 5 + nc]"""
+    shapes = tuple(tuple(o.shape[1:]) for o in outputs)
+    return get_decoder(shapes, anchors).decode(outputs, conf_threshold, quant)[0]
@@ -0,0 +1,214 @@
+# analyze.py
+# 量化/转换精度分析: 用 rknn-toolkit2 的 accuracy_analysis 在 x86 模拟器上对若干张 val 图片逐层比较
+# 量化模型和浮点 (ONNX) 参考的输出, 统计每层的余弦相似度, 标出应该保留高精度 (float16) 的层,
+# 并给出混合量化 (hybrid_quantization_step1/2) 的 custom_quantize_layers 建议。结果写成 JSON 报告。
+#
+#   python analyze.py best.onnx rk3588 --num_images 8 --focus_class feeler_gauge --report analysis.json
+#
+# entire: 从输入开始逐层累积的误差; single: 该层输入取参考值时单层自身的误差, 更能反映哪一层不适合量化。
+
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import cv2
+import numpy as np
+import sim_eval
+from convert import CLASSES, DATASET_PATH, build_rknn, make_calibration_list, onnx_head_anchors, onnx_input_size
+
+SINGLE_COS_THRESHOLD = 0.99  # 单层余弦相似度低于它的层建议保留 float16
+ENTIRE_DROP_THRESHOLD = 0.01  # 累积余弦相似度在某层下降超过它, 也建议保留 float16
+LAYER_LINE = re.compile(r'^\[(?P<op>[^\]]+)\]\s+(?P<name>\S+)\s+(?P<values>.*)$')
+FLOAT = re.compile(r'[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+
+def parse_error_analysis(path):
+    """
+    解析 accuracy_analysis 输出的 error_analysis.txt, 返回按层顺序的
+    [{'op', 'name', 'entire_cos', 'single_cos'}] (每行依次为 entire cos | euc, single cos | euc)
+    """
+    layers = []
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            m = LAYER_LINE.match(line.strip())
+            if not m:
+                continue
+            values = [float(v) for v in FLOAT.findall(m.group('values'))]
+            if len(values) < 4:
+                continue
+            layers.append({'op': m.group('op'), 'name': m.group('name'),
+                           'entire_cos': values[0], 'single_cos': values[2]})
+    return layers
+
+
+def select_images(num_images, focus_class=None, seed=0):
+    """从 val 集取 num_images 张图片; 指定 focus_class 时优先取包含该类别的图片"""
+    paths = sim_eval.list_images('val')
+    if focus_class is not None:
+        focus_id = CLASSES.index(focus_class)
+        with_focus = []
+        for p in paths:
+            cls, _ = sim_eval.load_labels(sim_eval.label_path_for(p), 1, 1)
+            if focus_id in cls:
+                with_focus.append(p)
+        paths = with_focus + [p for p in paths if p not in with_focus]
+    else:
+        paths = list(paths)
+        np.random.default_rng(seed).shuffle(paths)
+    return paths[:num_images]
+
+
+def letterboxed_inputs(image_paths, img_size, tmp_dir):
+    """accuracy_analysis 不做 letterbox, 先把图片处理成和推理时相同的 [1, H, W, 3] RGB 输入并存成 .npy"""
+    inputs = []
+    for i, path in enumerate(image_paths):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        inp, _, _ = sim_eval.letterbox(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), img_size)
+        npy_path = os.path.join(tmp_dir, f'{i:04d}.npy')
+        np.save(npy_path, np.expand_dims(inp, 0))
+        inputs.append(npy_path)
+    return inputs
+
+
+def aggregate_layers(runs):
+    """多张图片的逐层结果合并: 每层取最差 (最小) 和平均的余弦相似度"""
+    merged = {}
+    for layers in runs:
+        for idx, layer in enumerate(layers):
+            m = merged.setdefault(layer['name'], {'index': idx, 'op': layer['op'], 'entire': [], 'single': []})
+            m['entire'].append(layer['entire_cos'])
+            m['single'].append(layer['single_cos'])
+    result = []
+    for name, m in sorted(merged.items(), key=lambda kv: kv[1]['index']):
+        result.append({'name': name, 'op': m['op'],
+                       'entire_cos_min': min(m['entire']), 'entire_cos_mean': float(np.mean(m['entire'])),
+                       'single_cos_min': min(m['single']), 'single_cos_mean': float(np.mean(m['single']))})
+    return result
+
+
+def flag_layers(layers, single_threshold=SINGLE_COS_THRESHOLD, drop_threshold=ENTIRE_DROP_THRESHOLD):
+    """标出单层误差大或使累积误差明显变大的层, 按单层余弦相似度从差到好排序"""
+    flagged, prev_entire = [], 1.0
+    for layer in layers:
+        drop = prev_entire - layer['entire_cos_min']
+        reasons = []
+        if layer['single_cos_min'] < single_threshold:
+            reasons.append(f"single cos {layer['single_cos_min']:.4f} < {single_threshold}")
+        if drop > drop_threshold:
+            reasons.append(f'entire cos drops {drop:.4f}')
+        if reasons:
+            flagged.append(dict(layer, entire_drop=drop, reasons=reasons))
+        prev_entire = layer['entire_cos_min']
+    return sorted(flagged, key=lambda l: l['single_cos_min'])
+
+
+def onnx_reference_ap(model_path, image_paths, img_size, anchors=None):
+    """用 onnxruntime 跑浮点参考模型, 得到同一批图片上的每类 AP (没有 onnxruntime 时返回 None)"""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return None
+    session = ort.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+    name = session.get_inputs()[0].name
+    infer = lambda img: session.run(None, {name: img.transpose(0, 3, 1, 2).astype(np.float32) / 255.0})
+    return sim_eval.evaluate(infer, image_paths, img_size=img_size, anchors=anchors)
+
+
+def parse_arg():
+    parser = argparse.ArgumentParser(description='Per-layer accuracy analysis of an RKNN conversion')
+    parser.add_argument('model_path', help='ONNX model path')
+    parser.add_argument('platform', help='Target platform, e.g. rk3588')
+    parser.add_argument('--quant', choices=('fp16', 'int8'), default='int8')
+    parser.add_argument('--no_output_optimize', action='store_true')
+    parser.add_argument('--dataset', default=None, help='Calibration list (sampled from the train set by default)')
+    parser.add_argument('--calib_per_class', '--calib-per-class', type=int, default=10,
+                        help='Calibration images per class (same default as convert.py)')
+    parser.add_argument('--img_size', '--img-size', type=int, default=None,
+                        help='Model input size; read from the ONNX input shape by default')
+    parser.add_argument('--num_images', type=int, default=8, help='Val images to analyse')
+    parser.add_argument('--focus_class', choices=CLASSES, default=None,
+                        help='Prefer val images containing this class, e.g. feeler_gauge')
+    parser.add_argument('--single_threshold', type=float, default=SINGLE_COS_THRESHOLD)
+    parser.add_argument('--drop_threshold', type=float, default=ENTIRE_DROP_THRESHOLD)
+    parser.add_argument('--max_suggestions', type=int, default=10)
+    parser.add_argument('--report', default='analysis.json')
+    parser.add_argument('--snapshot_dir', default='./snapshot', help='Where accuracy_analysis keeps its dumps')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arg()
+    img_size = args.img_size or onnx_input_size(args.model_path)
+    anchors = onnx_head_anchors(args.model_path)
+    anchors = None if anchors == 'default' else anchors
+    dataset = args.dataset
+    if args.quant == 'int8' and dataset is None:
+        # 和 convert.py 相同的校准集, 分析的就是实际发布的量化模型
+        dataset = DATASET_PATH
+        make_calibration_list(dataset, per_class=args.calib_per_class, img_size=img_size)
+    image_paths = select_images(args.num_images, args.focus_class)
+    try:
+        rknn = build_rknn(args.model_path, args.platform, quantize=args.quant == 'int8', dataset=dataset,
+                          output_optimize=not args.no_output_optimize, verbose=False)
+    except RuntimeError as e:
+        exit(str(e))
+
+    tmp_dir = tempfile.mkdtemp(prefix='rknn_analysis_')
+    runs = []
+    try:
+        for i, npy_path in enumerate(letterboxed_inputs(image_paths, img_size, tmp_dir)):
+            print(f'--> Accuracy analysis {i + 1}/{len(image_paths)}')
+            out_dir = os.path.join(args.snapshot_dir, f'{i:04d}')
+            if rknn.accuracy_analysis(inputs=[npy_path], output_dir=out_dir, target=None) != 0:
+                exit('Accuracy analysis failed')
+            runs.append(parse_error_analysis(os.path.join(out_dir, 'error_analysis.txt')))
+        # 同一个模型在模拟器上的检测精度, 和 ONNX 参考对比每个类别的 AP
+        if rknn.init_runtime(target=None) != 0:
+            exit('Failed to init RKNN runtime')
+        quant_eval = sim_eval.evaluate(lambda img: rknn.inference(inputs=[img], data_format='nhwc'),
+                                       image_paths, img_size=img_size, anchors=anchors)
+    finally:
+        rknn.release()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    ref_eval = onnx_reference_ap(args.model_path, image_paths, img_size, anchors)
+
+    layers = aggregate_layers(runs)
+    flagged = flag_layers(layers, args.single_threshold, args.drop_threshold)
+    suggestions = flagged[:args.max_suggestions]
+    report = {
+        'model': os.path.abspath(args.model_path),
+        'platform': args.platform,
+        'quant': args.quant,
+        'output_optimize': not args.no_output_optimize,
+        'img_size': img_size,
+        'images': [os.path.basename(p) for p in image_paths],
+        'thresholds': {'single_cos': args.single_threshold, 'entire_drop': args.drop_threshold},
+        'output_cos': layers[-1]['entire_cos_min'] if layers else None,
+        'layers': layers,
+        'flagged': flagged,
+        # hybrid_quantization_step1 生成的 .quantization.cfg 中, 把这些层加入 custom_quantize_layers
+        'hybrid_quantization': {'custom_quantize_layers': {l['name']: 'float16' for l in suggestions}},
+        'detection': {'quantized': quant_eval, 'onnx': ref_eval},
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print('\n' + '=' * 80)
+    print(f"{len(layers)} layers, {len(flagged)} flagged, output cos (worst image): {report['output_cos']}")
+    for l in suggestions:
+        print(f"  [{l['op']}] {l['name']:<48} single {l['single_cos_min']:.4f}  entire {l['entire_cos_min']:.4f}")
+    if ref_eval is not None:
+        print(f"mAP@0.5 on {quant_eval['images']} images: {args.quant} {quant_eval['map50']:.4f} | "
+              f"onnx {ref_eval['map50']:.4f}")
+        for cls, ap in ref_eval['ap50'].items():
+            q = quant_eval['ap50'].get(cls, 0.0)
+            print(f"  {cls:<16} {ap:.3f} -> {q:.3f} ({q - ap:+.3f})")
+    print('Hybrid quantization: run hybrid_quantization_step1, add to custom_quantize_layers in the .cfg:')
+    for name, dtype in report['hybrid_quantization']['custom_quantize_layers'].items():
+        print(f'    {name}: {dtype}')
+    print('=' * 80)
+    print(f'--> Report saved to {args.report}')
@@ -1,40 +1,185 @@
-import sys
+import argparse
+import json
+import os
+import time
 from rknn.api import RKNN
+import sim_eval
+# 不依赖 rknn 的部分在 sim_eval 中, convert_matrix.py 的主进程只导入 sim_eval
+from sim_eval import DATASET_PATH, make_calibration_list, onnx_head_anchors, onnx_input_size
 
-DATASET_PATH = '/home/elf/Desktop/yolov8_rknn/dataset.txt'
+CLASSES = ('wrench', 'hammer', 'file', 'tape_measure', 'multimeter',
+           'pliers', 'screwdrivers', 'safety_goggles', 'feeler_gauge', 'vernier_caliper')
 
-def parse_arg():
-    if len(sys.argv) < 3:
-        print("Usage: python3 {} onnx_model_path platform [output_rknn_path]".format(sys.argv[0]))
-        exit(1)
-    model_path = sys.argv[1]
-    platform = sys.argv[2]
-    output_path = sys.argv[3] if len(sys.argv) > 3 else 'yolov5.rknn'
-    return model_path, platform, output_path
+def output_quant_params(model_path, platform, dataset, quant_cfg=None):
+    """
+    INT8 模型每个输出的 [zero_point, scale] (按 ONNX 输出顺序), 写入元数据后检测程序会请求 int8 原始输出 (见 system/quantized.py)。
+    从 hybrid_quantization_step1 生成的 <模型名>.quantization.cfg 中读取; 没有给出 quant_cfg 时先运行 step1 生成它
+    (和 build 使用相同的配置和校准集)。读不到任一输出的参数时返回 None
+    """
+    import onnx
+    import yaml
+    if quant_cfg is None:
+        rknn = RKNN(verbose=False)
+        rknn.config(mean_values=[[0, 0, 0]], std_values=[[255, 255, 255]], target_platform=platform)
+        if rknn.load_onnx(model=model_path) != 0 or rknn.hybrid_quantization_step1(dataset=dataset) != 0:
+            rknn.release()
+            print('--> Failed to generate the quantization config, keeping float outputs')
+            return None
+        rknn.release()
+        quant_cfg = os.path.splitext(os.path.basename(model_path))[0] + '.quantization.cfg'
+    with open(quant_cfg, 'r', encoding='utf-8') as f:
+        params = (yaml.safe_load(f) or {}).get('quantize_parameters', {})
+    result = []
+    for name in (o.name for o in onnx.load(model_path).graph.output):
+        p = params.get(name)
+        if not p or 'zero_point' not in p or 'scale' not in p:
+            print(f'--> No quantization parameters for output {name} in {quant_cfg}, keeping float outputs')
+            return None
+        result.append([int(p['zero_point'][0]), float(p['scale'][0])])
+    return result
 
-if __name__ == '__main__':
-    model_path, platform, output_path = parse_arg()
-    rknn = RKNN(verbose=True)
+def save_metadata(output_path, img_size, anchors=None, output_quant=None):
+    """在 .rknn 旁写出同名 .json 元数据, vision_module 按它选择 letterbox 尺寸、类别、检测头的 anchor 和输出的量化参数 (见 system/model_set.py)"""
+    meta_path = os.path.splitext(output_path)[0] + '.json'
+    meta = {'img_size': img_size, 'classes': list(CLASSES)}
+    if anchors is not None and anchors != 'default':
+        meta['anchors'] = anchors
+    if output_quant is not None:
+        meta['output_quant'] = output_quant
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f'--> Metadata saved to {meta_path}')
+
+def build_rknn(model_path, platform, quantize=False, dataset=DATASET_PATH, output_optimize=True, verbose=True,
+               quantized_algorithm='normal'):
+    """加载 ONNX 并 build, 返回 RKNN 对象 (调用者负责 export / release), 失败时抛出 RuntimeError"""
+    rknn = RKNN(verbose=verbose)
     print('--> Config model')
     rknn.config(
         mean_values=[[0, 0, 0]],
         std_values=[[255, 255, 255]],
         target_platform=platform,
-        #quantized_dtype='w8a8',
-        output_optimize=True,
+        quantized_dtype='w8a8',
+        quantized_algorithm=quantized_algorithm,
+        output_optimize=output_optimize,
     )
     print('done')
     print('--> Loading model')
-    ret = rknn.load_onnx(model=model_path)
-    if ret != 0: rknn.release(); exit(ret)
+    if rknn.load_onnx(model=model_path) != 0:
+        rknn.release()
+        raise RuntimeError(f'Failed to load ONNX model: {model_path}')
     print('done')
-    print('--> Building model...')
-    ret = rknn.build(do_quantization=False)
-    if ret != 0: rknn.release(); exit(ret)
+    print(f"--> Building model ({'INT8' if quantize else 'FP16'})...")
+    if rknn.build(do_quantization=quantize, dataset=dataset if quantize else None) != 0:
+        rknn.release()
+        raise RuntimeError('Failed to build RKNN model')
     print('done')
+    return rknn
+
+def export_rknn(rknn, output_path, img_size, anchors=None, output_quant=None):
     print('--> Exporting rknn model...')
-    ret = rknn.export_rknn(output_path)
-    if ret != 0: rknn.release(); exit(ret)
+    if rknn.export_rknn(output_path) != 0:
+        raise RuntimeError(f'Failed to export RKNN model: {output_path}')
     print(f'--> RKNN model saved to {output_path}')
+    save_metadata(output_path, img_size, anchors, output_quant)
+
+def evaluate_rknn(rknn, img_size, limit=None, target=None, anchors=None):
+    """
+    在 x86 模拟器 (target=None) 或连接的板子上评估 val 集的 AP@0.5。
+    连接了板子时再用 eval_perf 测量 NPU 上的真实耗时; 模拟器上的耗时不能代表 NPU 速度。
+    """
+    if rknn.init_runtime(target=target, perf_debug=False) != 0:
+        raise RuntimeError('Failed to init RKNN runtime')
+    result = sim_eval.evaluate(lambda img: rknn.inference(inputs=[img], data_format='nhwc'),
+                               sim_eval.load_split('val', limit, img_size), img_size=img_size,
+                               anchors=None if anchors == 'default' else anchors)
+    if target is not None:
+        perf = rknn.eval_perf(is_print=False)
+        result['perf'] = perf if isinstance(perf, (dict, list)) else str(perf)
+    return result
+
+def print_quant_report(report):
+    """FP16 / INT8 对比: 模型大小、mAP@0.5 以及每个类别的 AP 变化"""
+    fp16, int8 = report.get('fp16'), report.get('int8')
+    print('\n' + '=' * 60)
+    for name, r in report.items():
+        if 'eval' in r:
+            print(f"{name.upper():>5}: {r['size_mb']:.1f} MB | mAP@0.5 {r['eval']['map50']:.4f} | "
+                  f"{r['eval']['latency_ms']:.0f} ms/img ({'device' if 'perf' in r['eval'] else 'simulator'})")
+        else:
+            print(f"{name.upper():>5}: {r['size_mb']:.1f} MB")
+    if fp16 and int8 and 'eval' in fp16 and 'eval' in int8:
+        print(f"INT8 - FP16 mAP@0.5: {int8['eval']['map50'] - fp16['eval']['map50']:+.4f}")
+        for cls, ap in fp16['eval']['ap50'].items():
+            delta = int8['eval']['ap50'].get(cls, 0.0) - ap
+            print(f"  {cls:<16} {ap:.3f} -> {int8['eval']['ap50'].get(cls, 0.0):.3f} ({delta:+.3f})")
+        if 'perf' in int8['eval']:
+            print(f"NPU speedup: {fp16['eval']['latency_ms'] / max(int8['eval']['latency_ms'], 1e-9):.2f}x "
+                  f"(measured on device)")
+        else:
+            print(f"Size ratio FP16/INT8: {fp16['size_mb'] / int8['size_mb']:.2f}x. "
+                  f"Pass --target rk3588 with a board connected to measure the NPU speedup.")
+    print('=' * 60)
+
+def parse_arg():
+    parser = argparse.ArgumentParser(description='Convert the YOLOv5 ONNX model to RKNN (FP16 and/or INT8)')
+    parser.add_argument('model_path', help='ONNX model path')
+    parser.add_argument('platform', help='Target platform, e.g. rk3588')
+    parser.add_argument('output_path', nargs='?', default='yolov5.rknn',
+                        help='Output .rknn path (with --quant both: <name>_fp16.rknn and <name>_int8.rknn)')
+    parser.add_argument('--quant', choices=('fp16', 'int8', 'both'), default='fp16')
+    parser.add_argument('--dataset', default=None,
+                        help='Existing calibration list; by default one is sampled from Dataset/images/train')
+    parser.add_argument('--calib_per_class', type=int, default=10, help='Calibration images per class')
+    parser.add_argument('--no_output_optimize', action='store_true')
+    parser.add_argument('--eval', action='store_true', help='Evaluate on Dataset/images/val in the simulator')
+    parser.add_argument('--eval_limit', type=int, default=None, help='Only evaluate the first N val images')
+    parser.add_argument('--target', default=None, help='Evaluate on a connected board (e.g. rk3588) instead')
+    parser.add_argument('--report', default=None, help='Write the FP16/INT8 report to this JSON file')
+    parser.add_argument('--output_quant', action='store_true',
+                        help='INT8: store output zero-point/scale in the metadata so the detector requests int8 outputs')
+    parser.add_argument('--quant_cfg', default=None,
+                        help='Existing .quantization.cfg (hybrid_quantization_step1) to read the output parameters from')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arg()
+    img_size = onnx_input_size(args.model_path)
+    anchors = onnx_head_anchors(args.model_path)
+    if anchors is not None:
+        print('--> Raw detection heads: sigmoid/grid/anchor decoding runs on the host (system/yolo_heads.py)')
+    variants = ['fp16', 'int8'] if args.quant == 'both' else [args.quant]
+    dataset = args.dataset
+    if 'int8' in variants and dataset is None:
+        dataset = DATASET_PATH
+        make_calibration_list(dataset, per_class=args.calib_per_class, img_size=img_size)
+    report = {}
+    for variant in variants:
+        stem, ext = os.path.splitext(args.output_path)
+        output_path = f'{stem}_{variant}{ext}' if len(variants) > 1 else args.output_path
+        t0 = time.perf_counter()
+        try:
+            rknn = build_rknn(args.model_path, args.platform, quantize=variant == 'int8', dataset=dataset,
+                              output_optimize=not args.no_output_optimize)
+        except RuntimeError as e:
+            exit(str(e))
+        try:
+            output_quant = None
+            if variant == 'int8' and (args.output_quant or args.quant_cfg):
+                output_quant = output_quant_params(args.model_path, args.platform, dataset, args.quant_cfg)
+            export_rknn(rknn, output_path, img_size, anchors, output_quant)
+            report[variant] = {'path': output_path, 'build_s': time.perf_counter() - t0,
+                               'size_mb': os.path.getsize(output_path) / 1e6}
+            if args.eval or args.target:
+                print(f'--> Evaluating {variant} on val...')
+                report[variant]['eval'] = evaluate_rknn(rknn, img_size, args.eval_limit, args.target, anchors)
+        except RuntimeError as e:
+            exit(str(e))
+        finally:
+            rknn.release()
+    print_quant_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'--> Report saved to {args.report}')
     print('done')
-    rknn.release()
@@ -0,0 +1,171 @@
+# convert_matrix.py
+# 批量转换: 按 (ONNX 模型/输入尺寸, 平台, FP16/INT8, output_optimize) 的组合矩阵并行构建 RKNN 模型。
+# 每个变体的输出缓存在 cache_dir/<hash>/ 下, hash 由 ONNX 文件内容、转换配置和 INT8 校准列表内容计算,
+# 都没有变化时直接复用上次的结果。最后写出 manifest.json, 记录每个模型的大小、构建耗时和模拟器上的延迟/精度。
+#
+#   python convert_matrix.py best_320.onnx best_640.onnx --platform rk3588 --quant fp16 int8 --output_optimize 1 0
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import sim_eval  # 不导入 rknn-toolkit2, rknn 只在构建变体的子进程中导入
+
+CACHE_DIR = './rknn_cache'
+CACHE_VERSION = 4  # 构建流程变化时加 1, 让旧缓存失效
+
+
+def file_sha256(path, h=None):
+    h = h or hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h
+
+
+def variant_key(variant):
+    """ONNX 内容 + 配置 (+ INT8 的校准列表和列表中每张图片的内容) 的 sha256"""
+    h = file_sha256(variant['onnx'])
+    config = {k: v for k, v in variant.items() if k not in ('onnx', 'dataset')}
+    h.update(json.dumps(dict(config, cache_version=CACHE_VERSION), sort_keys=True).encode())
+    if variant['quant'] == 'int8':
+        # 列表里只有路径, 图片被替换或重新打包后路径不变, 必须哈希图片本身
+        with open(variant['dataset'], 'r') as f:
+            paths = [line.strip() for line in f if line.strip()]
+        for path in paths:
+            h.update(path.encode() + b'\0')
+            if os.path.exists(path):
+                file_sha256(path, h)
+    return h.hexdigest()
+
+
+def variant_name(variant):
+    stem = os.path.splitext(os.path.basename(variant['onnx']))[0]
+    opt = 'opt' if variant['output_optimize'] else 'noopt'
+    return f"{stem}_{variant['platform']}_{variant['quant']}_{opt}"
+
+
+def build_variant(variant, out_dir, eval_limit):
+    """在子进程中构建一个变体并在模拟器上评估; 返回写入 manifest 的记录 (build.json)"""
+    import convert  # 子进程中才导入 rknn-toolkit2
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        t0 = time.perf_counter()
+        rknn = convert.build_rknn(variant['onnx'], variant['platform'], quantize=variant['quant'] == 'int8',
+                                  dataset=variant.get('dataset'), output_optimize=variant['output_optimize'],
+                                  verbose=False)
+        anchors = sim_eval.onnx_head_anchors(variant['onnx'])
+        try:
+            convert.export_rknn(rknn, os.path.join(tmp_dir, 'model.rknn'), variant['img_size'], anchors)
+            record = {'build_s': time.perf_counter() - t0,
+                      'size_mb': os.path.getsize(os.path.join(tmp_dir, 'model.rknn')) / 1e6}
+            if eval_limit:
+                result = convert.evaluate_rknn(rknn, variant['img_size'], eval_limit, anchors=anchors)
+                record.update(sim_latency_ms=result['latency_ms'], map50=result['map50'], eval_images=result['images'])
+        finally:
+            rknn.release()
+        with open(os.path.join(tmp_dir, 'build.json'), 'w', encoding='utf-8') as f:
+            json.dump(record, f, indent=2)
+        # 全部写完后再改名, 中途失败不会留下不完整的缓存
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.rename(tmp_dir, out_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)  # 构建失败时删掉半成品, 成功时它已经被改名
+    return record
+
+
+def calibration_path(cache_dir, img_size):
+    """每个输入尺寸一个校准列表: 有打包数据集时列表中是该尺寸的 letterbox 图像"""
+    return os.path.abspath(os.path.join(cache_dir, f'dataset_{img_size}.txt'))
+
+
+def make_variants(args):
+    variants = []
+    for onnx_path, platform, quant, optimize in itertools.product(args.onnx, args.platform, args.quant,
+                                                                  args.output_optimize):
+        variant = {'onnx': os.path.abspath(onnx_path), 'platform': platform, 'quant': quant,
+                   'output_optimize': bool(optimize), 'img_size': sim_eval.onnx_input_size(onnx_path)}
+        if quant == 'int8':
+            variant['dataset'] = (os.path.abspath(args.dataset) if args.dataset
+                                  else calibration_path(args.cache_dir, variant['img_size']))
+        variants.append(variant)
+    return variants
+
+
+def parse_arg():
+    parser = argparse.ArgumentParser(description='Build a matrix of RKNN variants in parallel, with caching')
+    parser.add_argument('onnx', nargs='+', help='ONNX models (one per input size, see export.py --imgsz)')
+    parser.add_argument('--platform', nargs='+', default=['rk3588'])
+    parser.add_argument('--quant', nargs='+', choices=('fp16', 'int8'), default=['fp16', 'int8'])
+    parser.add_argument('--output_optimize', nargs='+', type=int, choices=(0, 1), default=[1])
+    parser.add_argument('--cache_dir', default=CACHE_DIR)
+    parser.add_argument('--manifest', default=None, help='Default: <cache_dir>/manifest.json')
+    parser.add_argument('--dataset', default=None, help='Calibration list; sampled from the train set by default')
+    parser.add_argument('--calib_per_class', type=int, default=10)
+    parser.add_argument('--eval_limit', type=int, default=20, help='Val images per variant in the simulator (0: skip)')
+    parser.add_argument('--workers', type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)))
+    parser.add_argument('--force', action='store_true', help='Ignore the cache and rebuild everything')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arg()
+    os.makedirs(args.cache_dir, exist_ok=True)
+    variants = make_variants(args)
+    if args.dataset is None:
+        for img_size in sorted({v['img_size'] for v in variants if v['quant'] == 'int8'}):
+            sim_eval.make_calibration_list(calibration_path(args.cache_dir, img_size),
+                                           per_class=args.calib_per_class, img_size=img_size)
+
+    manifest, pending = [], {}
+    for variant in variants:
+        key = variant_key(variant)
+        out_dir = os.path.abspath(os.path.join(args.cache_dir, key[:16]))
+        entry = dict(variant, name=variant_name(variant), key=key, path=os.path.join(out_dir, 'model.rknn'))
+        manifest.append(entry)
+        build_info = os.path.join(out_dir, 'build.json')
+        if not args.force and os.path.exists(build_info):
+            with open(build_info, 'r', encoding='utf-8') as f:
+                entry.update(json.load(f), cached=True)
+            print(f"--> {entry['name']}: cached ({key[:16]})")
+        else:
+            pending.setdefault(key, ([], out_dir))[0].append(entry)  # 内容相同的 ONNX 只构建一次
+
+    if pending:
+        print(f'--> Building {len(pending)} variant(s) with {args.workers} worker(s)...')
+        # rknn-toolkit2 不是 fork 安全的, 子进程用 spawn 启动
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(build_variant, {k: v for k, v in entries[0].items()
+                                                   if k not in ('name', 'key', 'path')}, out_dir, args.eval_limit): key
+                       for key, (entries, out_dir) in pending.items()}
+            for future in as_completed(futures):
+                for entry in pending[futures[future]][0]:
+                    try:
+                        entry.update(future.result(), cached=False)
+                        print(f"--> {entry['name']}: built in {entry['build_s']:.1f}s, {entry['size_mb']:.1f} MB")
+                    except Exception as e:
+                        entry['error'] = str(e)
+                        print(f"--> {entry['name']}: FAILED ({e})")
+
+    manifest_path = args.manifest or os.path.join(args.cache_dir, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print('\n' + '=' * 90)
+    print(f"{'variant':<40} {'size MB':>8} {'build s':>8} {'sim ms':>8} {'mAP@0.5':>8}  cache")
+    for e in manifest:
+        if 'error' in e:
+            print(f"{e['name']:<40} {'error':>8}")
+            continue
+        sim = f"{e['sim_latency_ms']:8.0f}" if 'sim_latency_ms' in e else f"{'-':>8}"
+        map50 = f"{e['map50']:8.4f}" if 'map50' in e else f"{'-':>8}"
+        print(f"{e['name']:<40} {e['size_mb']:8.1f} {e['build_s']:8.1f} {sim} {map50}  {'hit' if e['cached'] else 'miss'}")
+    print('=' * 90)
+    print(f'--> Manifest saved to {manifest_path}')
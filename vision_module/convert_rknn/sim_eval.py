@@ -0,0 +1,317 @@
+# sim_eval.py
+# 转换后模型的精度评估 (convert.py / convert_matrix.py / analyze.py 共用):
+# 在 rknn-toolkit2 的 x86 模拟器 (或连接的板子) 上对 Dataset/images/val 推理, 用 YOLO 格式的标签计算 AP@0.5 / AP@0.5:0.95。
+# 精度的定义只在这里: 评估用的解码阈值和 NMS (decode_predictions)、与 YOLOv5 val.py 相同的一对一匹配 (match)
+# 和 101 点插值的 AP (compute_ap, 与 pycocotools 相同); system/evaluate_map.py 也使用它们, 各工具报告的 mAP 可以直接比较。
+# 运行过 vision_module/pack_dataset.py 时直接读取打包好的 letterbox 图像和标签, 不再逐张解码 JPEG。
+# 读取 ONNX 输入尺寸/anchor 和生成 INT8 校准列表也在这里: 它们不需要 rknn-toolkit2, convert_matrix.py 的主进程可以直接使用。
+
+import ast
+import glob
+import os
+import random
+import sys
+import time
+import cv2
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'system'))
+from pack_dataset import PackedDataset, letterbox, pack_dir  # 与打包数据集同一个 letterbox
+from yolo_heads import decode_heads, is_raw_heads  # 与板端检测程序共用一个拆分检测头解码器
+
+IMG_SIZE = 640
+EVAL_CONF_THRESHOLD = 0.001  # mAP 评估需要低分框, 才能得到完整的 PR 曲线
+EVAL_NMS_THRESHOLD = 0.6  # 与 YOLOv5 val.py 相同
+MAX_CANDIDATES = 1000  # NMS 前按 objectness 保留的候选数
+MAX_DET = 300  # 每张图片最多保留的检测框
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+CLASSES = ('wrench', 'hammer', 'file', 'tape_measure', 'multimeter',
+           'pliers', 'screwdrivers', 'safety_goggles', 'feeler_gauge', 'vernier_caliper')
+DATASET_PATH = './dataset.txt'  # INT8 量化校准图片列表, 由 make_calibration_list 生成
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Dataset')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def onnx_input_size(model_path):
+    """从 ONNX 模型的输入形状 [1, 3, H, W] 读出输入尺寸 (export.py --imgsz 320/416/640 导出不同尺寸)"""
+    import onnx
+    dims = onnx.load(model_path).graph.input[0].type.tensor_type.shape.dim
+    return dims[2].dim_value or 640
+
+
+def onnx_head_anchors(model_path):
+    """
+    export.py --raw-heads 导出的模型有三个输出 (各检测层的原始卷积结果), 返回 ONNX 元数据中的像素 anchor,
+    元数据中没有时返回 'default' (主机端使用 YOLOv5 默认 anchor); 普通的单输出模型返回 None
+    """
+    import onnx
+    model = onnx.load(model_path)
+    if len(model.graph.output) != 3:
+        return None
+    props = {p.key: p.value for p in model.metadata_props}
+    if 'anchors' not in props:
+        return 'default'
+    return tuple(tuple(level) for level in ast.literal_eval(props['anchors']))  # 可哈希, 作为解码器缓存的键
+
+
+def decode_predictions(predictions, ratio, pad, conf_threshold=EVAL_CONF_THRESHOLD):
+    """
+    已解码的候选行 [K, 5 + nc] (cx, cy, w, h, objectness, 类别概率) -> 原图上的 (x1, y1, x2, y2) 框、分数、类别。
+    所有评估工具共用这一份打分、按类别 NMS 和坐标映射, 只是取得候选行的方式不同
+    """
+    objectness = predictions[:, 4]
+    candidates = np.flatnonzero(objectness > conf_threshold)
+    if candidates.size > MAX_CANDIDATES:
+        candidates = candidates[np.argpartition(objectness[candidates], -MAX_CANDIDATES)[-MAX_CANDIDATES:]]
+    predictions = predictions[candidates]
+    class_ids = np.argmax(predictions[:, 5:], axis=1)
+    scores = predictions[np.arange(len(class_ids)), 5 + class_ids] * predictions[:, 4]
+    mask = scores > conf_threshold
+    predictions, class_ids, scores = predictions[mask], class_ids[mask], scores[mask]
+    if not len(scores):
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.intp)
+    half_wh = predictions[:, 2:4] / 2
+    boxes = np.concatenate((predictions[:, :2] - half_wh, predictions[:, :2] + half_wh), axis=1)
+    # 不同类别的框平移到互不重叠的区域, 一次 NMS 只在同类之间抑制
+    offsets = class_ids[:, None] * (boxes.max() - boxes.min() + 1)
+    xywh = np.concatenate((boxes[:, :2] + offsets, boxes[:, 2:] - boxes[:, :2]), axis=1)
+    keep = np.asarray(cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), 0.0, EVAL_NMS_THRESHOLD),
+                      dtype=np.intp).reshape(-1)[:MAX_DET]  # 按分数从高到低排列
+    boxes = boxes[keep]
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    return boxes, scores[keep], class_ids[keep]
+
+
+def decode(outputs, ratio, pad, conf_threshold=EVAL_CONF_THRESHOLD, anchors=None):
+    """[1, N, 5 + nc] 输出 (或三个原始检测层输出) -> 原图上的 (x1, y1, x2, y2) 框、分数、类别 (按类别 NMS)"""
+    if is_raw_heads(outputs):
+        predictions = decode_heads(outputs, conf_threshold, anchors)
+    else:
+        predictions = np.squeeze(outputs[0], axis=0)
+    return decode_predictions(predictions, ratio, pad, conf_threshold)
+
+
+def load_labels(label_path, width, height):
+    """读取 YOLO 格式标签, 返回 (类别 [M], 原图上的 (x1, y1, x2, y2) 框 [M, 4])"""
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            rows = [line.split() for line in f if line.strip()]
+    rows = [r for r in rows if len(r) == 5 and r[0].isdigit()]
+    return yolo_to_xyxy(np.array(rows, dtype=np.float32).reshape(-1, 5), width, height)
+
+
+def yolo_to_xyxy(data, width, height):
+    """[M, 5] 的 (class, cx, cy, w, h) 归一化标签 -> (类别 [M], 原图上的 (x1, y1, x2, y2) 框 [M, 4])"""
+    if not len(data):
+        return np.zeros(0, np.intp), np.zeros((0, 4), np.float32)
+    cx, cy, w, h = data[:, 1] * width, data[:, 2] * height, data[:, 3] * width, data[:, 4] * height
+    boxes = np.stack((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2), axis=1)
+    return data[:, 0].astype(np.intp), boxes
+
+
+def list_images(split='val', limit=None, dataset_dir=DATASET_DIR):
+    image_dir = os.path.join(dataset_dir, 'images', split)
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, '*')) if p.lower().endswith(IMAGE_EXTS))
+    return paths[:limit] if limit else paths
+
+
+def load_split(split='val', limit=None, img_size=IMG_SIZE, dataset_dir=DATASET_DIR):
+    """有对应输入尺寸的打包数据集时返回 PackedDataset, 否则返回图片路径列表 (evaluate 两者都接受)"""
+    if os.path.exists(os.path.join(pack_dir(split, img_size, dataset_dir), 'meta.json')):
+        return PackedDataset(pack_dir(split, img_size, dataset_dir)).head(limit)
+    return list_images(split, limit, dataset_dir)
+
+
+def load_sample(item, img_size=IMG_SIZE, packed=None):
+    """
+    一张图片的 (输入 [1, H, W, 3] uint8 RGB, ratio, pad, 真值类别, 原图上的真值框); 图片读不出来时返回 None。
+    item: 图片路径, 或 packed (PackedDataset) 中的下标
+    """
+    if packed is not None:
+        img, labels, info = packed[item]  # memmap 切片, 不拷贝
+        gt_cls, gt_boxes = yolo_to_xyxy(labels, info['width'], info['height'])
+        return img[None], float(info['ratio']), (float(info['pad_w']), float(info['pad_h'])), gt_cls, gt_boxes
+    img = cv2.imread(item)
+    if img is None:
+        return None
+    gt_cls, gt_boxes = load_labels(label_path_for(item), img.shape[1], img.shape[0])
+    inp, ratio, pad = letterbox(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), img_size)
+    return np.expand_dims(inp, 0), ratio, pad, gt_cls, gt_boxes
+
+
+def iter_samples(source, img_size=IMG_SIZE):
+    """逐张产出 load_sample 的结果; source 为图片路径列表或 PackedDataset"""
+    if isinstance(source, PackedDataset):
+        if source.img_size != img_size:
+            raise ValueError(f'Packed dataset is {source.img_size}px, the model expects {img_size}px')
+        for i in range(len(source)):
+            yield load_sample(i, img_size, source)
+        return
+    for path in source:
+        sample = load_sample(path, img_size)
+        if sample is not None:
+            yield sample
+
+
+def label_path_for(image_path):
+    """Dataset/images/<split>/x.jpg -> Dataset/labels/<split>/x.txt"""
+    image_dir, name = os.path.split(image_path)
+    split_dir, split = os.path.split(image_dir)
+    return os.path.join(os.path.dirname(split_dir), 'labels', split, os.path.splitext(name)[0] + '.txt')
+
+
+def box_iou(a, b):
+    """a [N, 4], b [M, 4] 的 (x1, y1, x2, y2) 框两两 IoU, 返回 [N, M]"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match(det_boxes, det_cls, gt_boxes, gt_cls, iou_thresholds=IOU_THRESHOLDS):
+    """
+    返回 correct [D, T]: 第 d 个检测框在第 t 个 IoU 阈值下是否与同类真值一对一匹配。
+    与 YOLOv5 val.py 相同: 每个阈值下一次性在 [真值, 检测] IoU 矩阵上按 IoU 从大到小配对
+    """
+    correct = np.zeros((len(det_boxes), len(iou_thresholds)), dtype=bool)
+    if not len(det_boxes) or not len(gt_boxes):
+        return correct
+    iou = box_iou(gt_boxes, det_boxes)
+    iou[gt_cls[:, None] != det_cls[None, :]] = 0.0
+    for t, threshold in enumerate(iou_thresholds):
+        gt_idx, det_idx = np.nonzero(iou >= threshold)
+        if not gt_idx.size:
+            continue
+        order = np.argsort(-iou[gt_idx, det_idx], kind='stable')  # IoU 大的配对优先
+        gt_idx, det_idx = gt_idx[order], det_idx[order]
+        _, first = np.unique(det_idx, return_index=True)  # 每个检测框只保留 IoU 最大的真值
+        gt_idx, det_idx = gt_idx[first], det_idx[first]
+        order = np.argsort(-iou[gt_idx, det_idx], kind='stable')
+        gt_idx, det_idx = gt_idx[order], det_idx[order]
+        _, first = np.unique(gt_idx, return_index=True)  # 每个真值只匹配一个检测框
+        correct[det_idx[first], t] = True
+    return correct
+
+
+def compute_ap(recall, precision):
+    """101 点插值的 AP (与 pycocotools 相同): 在 recall = 0, 0.01, ..., 1 处取 precision 包络的平均"""
+    envelope = np.concatenate((np.flip(np.maximum.accumulate(np.flip(precision))), [0.0]))
+    idx = np.searchsorted(recall, np.linspace(0, 1, 101), side='left')  # 达不到的 recall 落在末尾的 0 上
+    return float(envelope[idx].mean())
+
+
+def ap_per_class(correct, scores, pred_cls, target_cls, num_classes=len(CLASSES)):
+    """返回 (AP [nc, T], 每类真值数 [nc]); 没有真值的类别 AP 为 nan"""
+    order = np.argsort(-scores, kind='stable')
+    correct, pred_cls = correct[order], pred_cls[order]
+    num_gt = np.bincount(target_cls, minlength=num_classes)
+    ap = np.full((num_classes, correct.shape[1]), np.nan)
+    for c in range(num_classes):
+        if not num_gt[c]:
+            continue
+        hits = correct[pred_cls == c]
+        if not len(hits):
+            ap[c] = 0.0
+            continue
+        tp = np.cumsum(hits, axis=0)
+        fp = np.cumsum(~hits, axis=0)
+        recall = tp / num_gt[c]
+        precision = tp / (tp + fp)
+        ap[c] = [compute_ap(recall[:, t], precision[:, t]) for t in range(correct.shape[1])]
+    return ap, num_gt
+
+
+def summarize(stats, num_classes=len(CLASSES)):
+    """
+    stats: 逐张图片的 (match 的 correct, 分数, 检测类别, 真值类别)
+    返回 {'map50', 'map50_95', 'per_class': {类别名: {'ap50', 'ap50_95', 'labels'}}}, 没有标注的类别不计入 mAP
+    """
+    if stats:
+        correct, scores, pred_cls, target_cls = (np.concatenate(x) for x in zip(*stats))
+    else:
+        correct, scores = np.zeros((0, len(IOU_THRESHOLDS)), bool), np.zeros(0)
+        pred_cls = target_cls = np.zeros(0, np.intp)
+    ap, num_gt = ap_per_class(correct, scores, pred_cls, target_cls.astype(np.intp), num_classes)
+    valid = num_gt > 0
+    return {
+        'map50': float(np.mean(ap[valid, 0])) if valid.any() else 0.0,
+        'map50_95': float(np.mean(ap[valid].mean(axis=1))) if valid.any() else 0.0,
+        'per_class': {CLASSES[c] if c < len(CLASSES) else str(c):
+                      {'ap50': float(ap[c, 0]), 'ap50_95': float(ap[c].mean()), 'labels': int(num_gt[c])}
+                      for c in range(num_classes) if valid[c]},
+    }
+
+
+def evaluate(infer, image_paths, num_classes=len(CLASSES), img_size=IMG_SIZE, anchors=None):
+    """
+    infer(img) -> 模型输出列表, img 为 letterbox 后的 [1, H, W, 3] uint8 RGB
+    image_paths: 图片路径列表或 PackedDataset (见 load_split)
+    返回 summarize 的结果加上 {'ap50': {类别名: AP@0.5}, 'images', 'latency_ms'}
+    """
+    stats, times = [], []
+    for inp, ratio, pad, gt_cls, gt_boxes in iter_samples(image_paths, img_size):
+        t0 = time.perf_counter()
+        outputs = infer(inp)
+        times.append(time.perf_counter() - t0)
+        boxes, scores, class_ids = decode(outputs, ratio, pad, anchors=anchors)
+        stats.append((match(boxes, class_ids, gt_boxes, gt_cls), scores, class_ids, gt_cls))
+    result = summarize(stats, num_classes)
+    result.update(ap50={name: r['ap50'] for name, r in result['per_class'].items()}, images=len(times),
+                  latency_ms=float(np.mean(times) * 1000) if times else 0.0)
+    return result
+
+
+def make_calibration_list(out_path=DATASET_PATH, per_class=10, split='train', seed=0, img_size=None):
+    """
+    按类别分层抽样训练集图片, 写出 RKNN 量化用的校准列表 (每行一个图片路径)。
+    从样本最少的类别开始, 每个类别至少选 per_class 张包含它的图片 (一张图片同时计入它包含的所有类别),
+    这样 feeler_gauge 这类样本少的小工具也能参与量化范围的统计。返回选中的图片数。
+    有 img_size 对应的打包数据集 (vision_module/pack_dataset.py) 时从中读取标签, 并把选中的 letterbox 图像
+    存成 .npy 写入列表, 量化时看到的输入和推理时完全一致。
+    """
+    rng = random.Random(seed)
+    images_by_class = {c: [] for c in range(len(CLASSES))}
+    classes_of = {}
+    source = load_split(split, img_size=img_size) if img_size else list_images(split)
+    packed = isinstance(source, PackedDataset)
+    for path in (range(len(source)) if packed else source):
+        if packed:
+            ids = set(source.classes_of(path).tolist())
+        else:
+            label_path = label_path_for(path)
+            if not os.path.exists(label_path):
+                continue
+            with open(label_path, 'r') as f:
+                ids = {int(line.split()[0]) for line in f if line.strip() and line.split()[0].isdigit()}
+        classes_of[path] = ids
+        for c in ids:
+            if c in images_by_class:
+                images_by_class[c].append(path)
+    selected, counts = [], {c: 0 for c in images_by_class}
+    for c in sorted(images_by_class, key=lambda c: len(images_by_class[c])):
+        candidates = [p for p in images_by_class[c] if p not in selected]
+        rng.shuffle(candidates)
+        for path in candidates:
+            if counts[c] >= per_class:
+                break
+            selected.append(path)
+            for other in classes_of[path]:
+                if other in counts:
+                    counts[other] += 1
+    if packed:
+        npy_dir = os.path.splitext(out_path)[0] + '_npy'
+        os.makedirs(npy_dir, exist_ok=True)
+        paths = []
+        for i in selected:
+            paths.append(os.path.join(npy_dir, os.path.splitext(source.names[i])[0] + '.npy'))
+            np.save(paths[-1], source.images[i][None])
+        selected = paths
+    with open(out_path, 'w') as f:
+        f.writelines(os.path.abspath(p) + '\n' for p in selected)
+    print(f'--> Calibration list: {len(selected)} images -> {out_path} (per-class counts: '
+          + ', '.join(f'{CLASSES[c]}={n}' for c, n in counts.items()) + ')')
+    return len(selected)
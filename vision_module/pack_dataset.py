@@ -0,0 +1,211 @@
+# pack_dataset.py
+# 数据集打包: 把 Dataset/images/<split> 中的图片 letterbox 到模型输入尺寸后写入一个 uint8 的 np.memmap,
+# 所有标签合并成一个数组 (每张图片在其中的起止位置记录在 offsets 中), 另有每张图片原始尺寸、缩放比例和填充的索引。
+# 转换时的校准抽样 (convert_rknn/convert.py)、离线评估 (convert_rknn/sim_eval.py) 等读取时直接对 memmap 切片,
+# 不再每次重新解码 1000 多张 JPEG、逐个解析标签 .txt。
+# 再次运行时只重新处理新增或修改过的图片 (按文件大小和修改时间判断), 其余图片直接从旧的包中复制。
+#
+#   python pack_dataset.py --split train val --img_size 640
+#
+# 输出目录 Dataset/packed/<split>_<img_size>/:
+#   images.u8    [N, S, S, 3] uint8, letterbox 后的 RGB 图像 (与推理时送入模型的输入相同)
+#   labels.npy   [M, 5] float32, YOLO 格式 (class, cx, cy, w, h), 相对原图归一化
+#   offsets.npy  [N + 1] int64, 第 i 张图片的标签为 labels[offsets[i]:offsets[i + 1]]
+#   index.npy    [N] 结构化数组: 原图宽高、ratio、pad 以及图片 / 标签文件的大小和修改时间
+#   meta.json    图片尺寸、数量和按顺序的文件名
+
+import argparse
+import copy
+import glob
+import json
+import os
+import shutil
+import time
+import cv2
+import numpy as np
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Dataset')
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+PACK_VERSION = 1
+INDEX_DTYPE = np.dtype([
+    ('width', np.int32), ('height', np.int32),
+    ('ratio', np.float32), ('pad_w', np.float32), ('pad_h', np.float32),
+    ('image_size', np.int64), ('image_mtime', np.int64),
+    ('label_size', np.int64), ('label_mtime', np.int64),
+])
+
+
+def letterbox(im, new_shape=640, color=(114, 114, 114)):
+    shape = im.shape[:2]
+    r = min(new_shape / shape[0], new_shape / shape[1])
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = (new_shape - new_unpad[0]) / 2, (new_shape - new_unpad[1]) / 2
+    if shape[::-1] != new_unpad:
+        im = cv2.resize(im, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    im = cv2.copyMakeBorder(im, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return im, r, (dw, dh)
+
+
+def pack_dir(split, img_size, dataset_dir=DATASET_DIR):
+    return os.path.join(dataset_dir, 'packed', f'{split}_{img_size}')
+
+
+def _stat(path):
+    if not os.path.exists(path):
+        return 0, 0
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _read_labels(label_path):
+    """YOLO 格式标签 -> [K, 5] float32, 跳过 classes.txt 一类的非数字行"""
+    rows = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            rows = [line.split() for line in f if line.strip()]
+    rows = [r for r in rows if len(r) == 5 and r[0].isdigit()]
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+
+class PackedDataset:
+    """
+    只读访问打包好的数据集, 图片和标签都是 memmap 上的切片 (不拷贝):
+      ds = PackedDataset.open('train', 640)
+      img, labels, info = ds[i]   # img [S, S, 3] RGB, labels [K, 5], info 为 index 中的一行
+    """
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.img_size = self.meta['img_size']
+        self.names = self.meta['names']
+        self.image_dir = self.meta['image_dir']
+        n = len(self.names)
+        self.images = np.memmap(os.path.join(path, 'images.u8'), dtype=np.uint8, mode='r',
+                                shape=(n, self.img_size, self.img_size, 3)) if n else \
+            np.zeros((0, self.img_size, self.img_size, 3), np.uint8)
+        self.labels = np.load(os.path.join(path, 'labels.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.index = np.load(os.path.join(path, 'index.npy'))
+
+    @classmethod
+    def open(cls, split='val', img_size=640, dataset_dir=DATASET_DIR):
+        return cls(pack_dir(split, img_size, dataset_dir))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return self.images[i], self.labels[self.offsets[i]:self.offsets[i + 1]], self.index[i]
+
+    def head(self, n):
+        """只包含前 n 张图片的视图 (n 为 None 时返回自身)"""
+        if n is None:
+            return self
+        ds = copy.copy(self)
+        ds.names = self.names[:n]
+        ds.images = self.images[:n]
+        return ds
+
+    def image_path(self, i):
+        return os.path.join(self.image_dir, self.names[i])
+
+    def classes_of(self, i):
+        return self.labels[self.offsets[i]:self.offsets[i + 1], 0].astype(np.intp)
+
+
+def pack(split='val', img_size=640, dataset_dir=DATASET_DIR, force=False):
+    """打包 (或增量更新) 一个 split, 返回 (PackedDataset, 重新处理的图片数)"""
+    image_dir = os.path.join(dataset_dir, 'images', split)
+    label_dir = os.path.join(dataset_dir, 'labels', split)
+    names = sorted(os.path.basename(p) for p in glob.glob(os.path.join(image_dir, '*'))
+                   if p.lower().endswith(IMAGE_EXTS))
+    out_dir = pack_dir(split, img_size, dataset_dir)
+
+    old = None
+    if not force and os.path.exists(os.path.join(out_dir, 'meta.json')):
+        try:
+            old = PackedDataset(out_dir)
+            if old.meta.get('version') != PACK_VERSION or old.img_size != img_size:
+                old = None
+        except (OSError, ValueError, KeyError):
+            old = None
+    old_rows = {name: i for i, name in enumerate(old.names)} if old is not None else {}
+
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    n = len(names)
+    images = np.memmap(os.path.join(tmp_dir, 'images.u8'), dtype=np.uint8, mode='w+',
+                       shape=(max(n, 1), img_size, img_size, 3))
+    index = np.zeros(n, dtype=INDEX_DTYPE)
+    labels, kept, rebuilt = [], [], 0
+    for i, name in enumerate(names):
+        label_path = os.path.join(label_dir, os.path.splitext(name)[0] + '.txt')
+        image_stat, label_stat = _stat(os.path.join(image_dir, name)), _stat(label_path)
+        j = old_rows.get(name)
+        if j is not None and (old.index[j]['image_size'], old.index[j]['image_mtime']) == image_stat:
+            images[i] = old.images[j]
+            index[i] = old.index[j]
+            if (old.index[j]['label_size'], old.index[j]['label_mtime']) == label_stat:
+                labels.append(np.array(old.labels[old.offsets[j]:old.offsets[j + 1]]))
+            else:
+                labels.append(_read_labels(label_path))
+        else:
+            img = cv2.imread(os.path.join(image_dir, name))
+            if img is None:
+                print(f'--> Skipping unreadable image: {name}')
+                continue
+            inp, ratio, (dw, dh) = letterbox(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), img_size)
+            images[i] = inp
+            index[i] = (img.shape[1], img.shape[0], ratio, dw, dh, 0, 0, 0, 0)
+            labels.append(_read_labels(label_path))
+            rebuilt += 1
+        index['image_size'][i], index['image_mtime'][i] = image_stat
+        index['label_size'][i], index['label_mtime'][i] = label_stat
+        kept.append(i)
+    if len(kept) != n:  # 去掉读不出来的图片
+        for dst, src in enumerate(kept):
+            images[dst] = images[src]
+        names, index = [names[i] for i in kept], index[kept]
+    images.flush()
+    del images
+    if len(names) != n:
+        with open(os.path.join(tmp_dir, 'images.u8'), 'r+b') as f:
+            f.truncate(max(len(names), 1) * img_size * img_size * 3)
+    offsets = np.zeros(len(labels) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(l) for l in labels])
+    np.save(os.path.join(tmp_dir, 'labels.npy'),
+            np.concatenate(labels) if labels else np.zeros((0, 5), np.float32))
+    np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(tmp_dir, 'index.npy'), index)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': PACK_VERSION, 'split': split, 'img_size': img_size,
+                   'image_dir': os.path.abspath(image_dir), 'names': names}, f, ensure_ascii=False)
+    # 旧的包在新包写完之后才被替换, 读取中的旧 memmap 不受影响
+    del old
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.rename(tmp_dir, out_dir)
+    return PackedDataset(out_dir), rebuilt
+
+
+def parse_arg():
+    parser = argparse.ArgumentParser(description='Pack Dataset/images into letterboxed uint8 memmaps')
+    parser.add_argument('--split', nargs='+', default=['train', 'val'])
+    parser.add_argument('--img_size', type=int, nargs='+', default=[640], help='One pack per model input size')
+    parser.add_argument('--dataset_dir', default=DATASET_DIR)
+    parser.add_argument('--force', action='store_true', help='Re-decode every image')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arg()
+    for split in args.split:
+        for img_size in args.img_size:
+            t0 = time.perf_counter()
+            ds, rebuilt = pack(split, img_size, args.dataset_dir, force=args.force)
+            size_mb = ds.images.nbytes / 1e6
+            print(f'--> {split}_{img_size}: {len(ds)} images ({rebuilt} re-decoded), {len(ds.labels)} labels, '
+                  f'{size_mb:.0f} MB, {time.perf_counter() - t0:.1f}s -> {ds.path}')
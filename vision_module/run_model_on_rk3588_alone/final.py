@@ -1,17 +1,36 @@
 import os
 import cv2
 import numpy as np
-from rknnlite.api import RKNNLite
 import argparse
+import glob
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # --- 全局配置 ---
 IMG_SIZE = 640  # 模型输入尺寸
 CONF_THRESHOLD = 0.45  # 目标置信度阈值
 NMS_THRESHOLD = 0.5  # NMS阈值
+MAX_CANDIDATES = 1000  # NMS前最多保留的候选框数 (按目标置信度取top-k)
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTS = ('.mp4', '.avi', '.mkv', '.mov')
+SYSTEM_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'system')
 CLASSES = ('wrench', 'hammer', 'file', 'tape_measure', 'multimeter',
            'pliers', 'screwdrivers', 'safety_goggles', 'feeler_gauge', 'vernier_caliper')
 
 
+def model_img_size(model_path):
+    """读取模型旁的 .json 元数据 (convert.py 生成) 中的输入尺寸, 没有元数据时使用 IMG_SIZE"""
+    meta_path = os.path.splitext(model_path)[0] + '.json'
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return int(json.load(f).get('img_size', IMG_SIZE))
+    return IMG_SIZE
+
+
 def letterbox(im, new_shape=(640, 640), color=(114, 114, 114)):
     """
     YOLOv5的letterbox预处理函数。
@@ -39,6 +58,20 @@ def letterbox(im, new_shape=(640, 640), color=(114, 114, 114)):
     return im, r, (dw, dh)
 
 
+def nms_boxes(boxes, scores, class_ids, iou_threshold):
+    """
+    按类别 NMS。
+    boxes 为 [N, 4] 的 (x1, y1, x2, y2), 返回保留框的下标 (按分数从高到低)。
+    """
+    if not len(scores):
+        return np.zeros(0, dtype=np.intp)
+    # 把不同类别的框平移到互不重叠的区域, 一次 NMS 就只会在同类框之间抑制
+    offsets = class_ids.astype(boxes.dtype)[:, None] * (boxes.max() - boxes.min() + 1)
+    xywh = np.concatenate((boxes[:, :2] + offsets, boxes[:, 2:] - boxes[:, :2]), axis=1)
+    keep = cv2.dnn.NMSBoxes(xywh.tolist(), scores.tolist(), 0.0, iou_threshold)
+    return np.asarray(keep, dtype=np.intp).reshape(-1)
+
+
 def postprocess(outputs, ratio, pad):
     """
     对模型输出进行后处理，解码边界框。
@@ -46,55 +79,45 @@ def postprocess(outputs, ratio, pad):
     # 输出形状为 [1, 25200, 15]
     predictions = np.squeeze(outputs[0])
 
-    # 1. 过滤掉低置信度的框
-    obj_conf_mask = predictions[:, 4] > CONF_THRESHOLD
-    predictions = predictions[obj_conf_mask]
+    # 1. 按目标置信度预筛选, 候选过多时用 argpartition 只保留 top-k
+    objectness = predictions[:, 4]
+    candidates = np.flatnonzero(objectness > CONF_THRESHOLD)
+    if candidates.size > MAX_CANDIDATES:
+        top = np.argpartition(objectness[candidates], -MAX_CANDIDATES)[-MAX_CANDIDATES:]
+        candidates = candidates[top]
 
-    if not predictions.shape[0]:
+    if not candidates.size:
         return [], [], []
+    predictions = predictions[candidates]  # 之后只处理这些候选行
 
     # 2. 获取类别和分数
-    class_scores = predictions[:, 5:]
-    class_ids = np.argmax(class_scores, axis=1)
-    scores = np.max(class_scores, axis=1) * predictions[:, 4]  # 最终分数 = 类别分数 * 目标置信度
+    class_ids = np.argmax(predictions[:, 5:], axis=1)
+    scores = predictions[np.arange(len(class_ids)), 5 + class_ids] * predictions[:, 4]  # 最终分数 = 类别分数 * 目标置信度
 
     # 再次过滤，确保最终分数也满足阈值
     score_mask = scores > CONF_THRESHOLD
+    if not score_mask.any():
+        return [], [], []
     predictions = predictions[score_mask]
     class_ids = class_ids[score_mask]
     scores = scores[score_mask]
 
-    if not predictions.shape[0]:
-        return [], [], []
-
     # 3. 将 (cx, cy, w, h) 转换为 (x1, y1, x2, y2)
-    box_coords = predictions[:, :4]
-    cx, cy, w, h = box_coords[:, 0], box_coords[:, 1], box_coords[:, 2], box_coords[:, 3]
-    x1 = cx - w / 2
-    y1 = cy - h / 2
-    boxes = np.column_stack((x1, y1, w, h))  # NMS函数需要x,y,w,h格式
-
-    # 4. 应用NMS
-    indices = cv2.dnn.NMSBoxes(boxes.tolist(), scores.tolist(), CONF_THRESHOLD, NMS_THRESHOLD)
-
-    if len(indices) == 0:
-        return [], [], []
+    half_wh = predictions[:, 2:4] / 2
+    boxes = np.concatenate((predictions[:, :2] - half_wh, predictions[:, :2] + half_wh), axis=1)
 
-    final_boxes = boxes[indices]
-    final_scores = scores[indices]
-    final_class_ids = class_ids[indices]
+    # 4. 按类别应用NMS
+    keep = nms_boxes(boxes, scores, class_ids, NMS_THRESHOLD)
+    boxes = boxes[keep]
 
-    # 5. 将坐标从640x640空间映射回原始图像空间
-    final_boxes[:, 0] = (final_boxes[:, 0] - pad[0]) / ratio  # x
-    final_boxes[:, 1] = (final_boxes[:, 1] - pad[1]) / ratio  # y
-    final_boxes[:, 2] = final_boxes[:, 2] / ratio  # w
-    final_boxes[:, 3] = final_boxes[:, 3] / ratio  # h
+    # 5. 将坐标从640x640空间映射回原始图像空间, 输出 (x, y, w, h)
+    final_boxes = np.empty_like(boxes)
+    final_boxes[:, 0] = np.clip((boxes[:, 0] - pad[0]) / ratio, 0, None)  # x, 确保在图像范围内
+    final_boxes[:, 1] = np.clip((boxes[:, 1] - pad[1]) / ratio, 0, None)  # y
+    final_boxes[:, 2] = (boxes[:, 2] - boxes[:, 0]) / ratio  # w
+    final_boxes[:, 3] = (boxes[:, 3] - boxes[:, 1]) / ratio  # h
 
-    # 确保坐标在图像范围内
-    final_boxes[:, 0] = np.clip(final_boxes[:, 0], 0, None)
-    final_boxes[:, 1] = np.clip(final_boxes[:, 1], 0, None)
-
-    return final_boxes, final_scores, final_class_ids
+    return final_boxes, scores[keep], class_ids[keep]
 
 
 def draw_results(image, boxes, scores, class_ids):
@@ -116,8 +139,163 @@ def draw_results(image, boxes, scores, class_ids):
     return image
 
 
-def main(args):
-    # 1. 模型初始化
+# --- 批量模式: 一次加载模型, 处理整个目录 / glob / 视频 ---
+
+def list_source_images(source):
+    """目录 -> 其中所有图片; 其它 -> 当作 glob 模式"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, f) for f in os.listdir(source)]
+    else:
+        paths = glob.glob(source)
+    return sorted(p for p in paths if p.lower().endswith(IMAGE_EXTS))
+
+
+def _timed_imread(path):
+    t0 = time.perf_counter()
+    img = cv2.imread(path)
+    return path, img, time.perf_counter() - t0
+
+
+def read_frames(source, workers):
+    """
+    按顺序产出 (name, BGR图像, 解码耗时秒)。
+    图片在线程池中并行解码 (cv2.imread 会释放 GIL), 最多提前解码 workers * 2 张;
+    视频文件按帧顺序读取。
+    """
+    if source.lower().endswith(VIDEO_EXTS) and os.path.isfile(source):
+        cap = cv2.VideoCapture(source)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        index = 0
+        while True:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield f"{stem}_{index:06d}.jpg", frame, time.perf_counter() - t0
+            index += 1
+        cap.release()
+        return
+
+    paths = list_source_images(source)
+    print(f"--> Found {len(paths)} images in {source}")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for path in paths:
+            pending.append(pool.submit(_timed_imread, path))
+            if len(pending) >= workers * 2:
+                path_done, img, dt = pending.pop(0).result()
+                yield os.path.basename(path_done), img, dt
+        for future in pending:
+            path_done, img, dt = future.result()
+            yield os.path.basename(path_done), img, dt
+
+
+class AsyncWriter:
+    """在后台线程中保存结果图片, 不阻塞推理循环"""
+    def __init__(self, max_pending=16):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.write_times = []
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            path, img = item
+            t0 = time.perf_counter()
+            cv2.imwrite(path, img)
+            self.write_times.append(time.perf_counter() - t0)
+
+    def put(self, path, img):
+        self.queue.put((path, img))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def print_latency_report(stage_times, num_images, elapsed):
+    """打印吞吐量和每个阶段的 p50/p95/p99 延迟"""
+    print("\n" + "=" * 20 + " THROUGHPUT REPORT " + "=" * 20)
+    print(f"Images: {num_images}, wall time: {elapsed:.2f}s, throughput: {num_images / elapsed:.2f} images/sec")
+    print(f"{'stage':<12}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for stage, times in stage_times.items():
+        if not times:
+            continue
+        ms = np.array(times) * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        print(f"{stage:<12}{ms.mean():>10.2f}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+    print("=" * 59 + "\n")
+
+
+def run_batch(args, model):
+    """用同一个已加载的模型处理 --source 中的所有图片/视频帧"""
+    output_dir = "inference_results"
+    os.makedirs(output_dir, exist_ok=True)
+    if args.save_raw:
+        os.makedirs(args.save_raw, exist_ok=True)
+    writer = AsyncWriter()
+    stage_times = {'decode': [], 'preprocess': [], 'inference': [], 'postprocess': [], 'draw': []}
+    num_images = 0
+    num_objects = 0
+
+    start = time.perf_counter()
+    for name, orig_img, decode_time in read_frames(args.source, args.workers):
+        if orig_img is None:
+            print(f"Failed to read image: {name}")
+            continue
+        stage_times['decode'].append(decode_time)
+
+        t0 = time.perf_counter()
+        img_rgb = cv2.cvtColor(orig_img, cv2.COLOR_BGR2RGB)
+        img_processed, ratio, pad = letterbox(img_rgb, new_shape=(args.img_size, args.img_size))
+        img_processed = np.expand_dims(img_processed, axis=0)
+        t1 = time.perf_counter()
+        outputs = model.inference(inputs=[img_processed])
+        t2 = time.perf_counter()
+        if outputs is None:
+            print(f'Inference failed on {name}!')
+            continue
+        boxes, scores, class_ids = postprocess(outputs, ratio, pad)
+        t3 = time.perf_counter()
+        stage_times['preprocess'].append(t1 - t0)
+        stage_times['inference'].append(t2 - t1)
+        stage_times['postprocess'].append(t3 - t2)
+        num_images += 1
+        num_objects += len(boxes)
+
+        if args.save_raw:
+            np.save(os.path.join(args.save_raw, os.path.splitext(name)[0] + '.npy'), outputs[0])
+        if len(boxes) > 0:
+            result_img = draw_results(orig_img, boxes, scores, class_ids)
+            stage_times['draw'].append(time.perf_counter() - t3)
+            writer.put(os.path.join(output_dir, f"result_{name}"), result_img)
+
+    writer.close()
+    elapsed = time.perf_counter() - start
+    stage_times['write'] = writer.write_times
+    print(f"Found {num_objects} objects in {num_images} images, results saved to {output_dir}")
+    if num_images:
+        print_latency_report(stage_times, num_images, elapsed)
+
+
+def load_model(args):
+    """按 --backend 加载模型, 返回带 inference(inputs) / release() 的对象"""
+    if args.backend != 'rknn':
+        # ONNX Runtime / cv2.dnn 后端 (开发机上使用) 与 system/backends.py 共用, 板子上只需要下面的 RKNNLite 部分
+        sys.path.append(SYSTEM_DIR)
+        from backends import create_backend
+        try:
+            model = create_backend(args.backend, args.model_path, num_threads=args.threads)
+        except RuntimeError as e:
+            print(e)
+            exit(-1)
+        print('done')
+        return model
+
+    from rknnlite.api import RKNNLite
     rknn_lite = RKNNLite(verbose=False)
 
     print(f'--> Loading RKNN model: {args.model_path}')
@@ -133,6 +311,17 @@ def main(args):
         print(f'Init runtime environment failed! Ret = {ret}')
         exit(ret)
     print('done')
+    return rknn_lite
+
+
+def main(args):
+    # 1. 模型初始化
+    model = load_model(args)
+
+    if args.source:
+        run_batch(args, model)
+        model.release()
+        return
 
     # 2. 读取和预处理图像
     print(f'--> Reading image: {args.image_path}')
@@ -144,7 +333,7 @@ def main(args):
     # Letterbox + BGR to RGB
     # 注意：我们传入的是 uint8 图像，因为归一化已在rknn模型中配置
     img_rgb = cv2.cvtColor(orig_img, cv2.COLOR_BGR2RGB)
-    img_processed, ratio, pad = letterbox(img_rgb, new_shape=(IMG_SIZE, IMG_SIZE))
+    img_processed, ratio, pad = letterbox(img_rgb, new_shape=(args.img_size, args.img_size))
 
     img_processed = np.expand_dims(img_processed, axis=0)
     # img_processed = img_processed.transpose(0, 3, 1, 2)
@@ -152,10 +341,10 @@ def main(args):
     print('--> Inference')
     # rknnlite.inference的输入需要是一个列表
     # 输入数据类型应为uint8，因为rknn.config中已指定了std_values
-    outputs = rknn_lite.inference(inputs=[img_processed])
+    outputs = model.inference(inputs=[img_processed])
     if outputs is None:
         print('Inference failed!')
-        rknn_lite.release()
+        model.release()
         exit(-1)
     print('done')
 
@@ -174,6 +363,12 @@ def main(args):
     print(
         f"Objectness scores stats: Min={np.min(objectness_scores):.4f}, Max={np.max(objectness_scores):.4f}, Mean={np.mean(objectness_scores):.4f}")
     print("=" * 62 + "\n")
+    if args.save_raw:
+        # 保存原始输出, 供 system/bench_postprocess.py 等离线基准测试回放
+        os.makedirs(args.save_raw, exist_ok=True)
+        raw_path = os.path.join(args.save_raw, os.path.splitext(os.path.basename(args.image_path))[0] + '.npy')
+        np.save(raw_path, raw_output)
+        print(f"Raw output saved to {raw_path}")
     # **************************
     # *** 诊断代码结束 ***
     # **************************
@@ -198,13 +393,26 @@ def main(args):
         print(f"Result saved to {save_path}")
 
     # 6. 释放模型
-    rknn_lite.release()
+    model.release()
 
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="YOLOv5 RKNN Inference on RK3588")
-    parser.add_argument('--model_path', type=str, default='./yolov5.rknn', help='Path to the rknn model file')
-    parser.add_argument('--image_path', type=str, required=True, help='Path to the input image')
+    parser = argparse.ArgumentParser(description="YOLOv5 RKNN Inference on RK3588 (ONNX on CPU for comparison)")
+    parser.add_argument('--model_path', type=str, default='./yolov5.rknn',
+                        help='Path to the rknn model file (.onnx for the onnx / opencv backends)')
+    parser.add_argument('--backend', choices=('rknn', 'onnx', 'opencv'), default='rknn',
+                        help='rknn: RKNNLite on the NPU; onnx: ONNX Runtime CPU; opencv: cv2.dnn')
+    parser.add_argument('--threads', type=int, default=4, help='CPU threads for the onnx / opencv backends')
+    parser.add_argument('--img_size', type=int, default=None,
+                        help='Model input size (default: from the model .json metadata, else 640)')
+    source_group = parser.add_mutually_exclusive_group(required=True)
+    source_group.add_argument('--image_path', type=str, help='Path to the input image')
+    source_group.add_argument('--source', type=str,
+                              help='Image directory, glob pattern (quote it) or video file to process in one run')
+    parser.add_argument('--workers', type=int, default=4, help='JPEG decode threads for --source')
+    parser.add_argument('--save_raw', type=str, default=None, help='Directory to save the raw model output (.npy)')
     args = parser.parse_args()
+    if args.img_size is None:
+        args.img_size = model_img_size(args.model_path)
 
     main(args)
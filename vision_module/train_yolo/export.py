@@ -90,6 +90,16 @@ from utils.torch_utils import select_device, smart_inference_mode
 MACOS = platform.system() == "Darwin"  # macOS environment
 
 
+def detect_raw_forward(self, x):
+    """
+    Detect() forward for --raw-heads export: returns the raw per-level conv outputs.
+
+    Each output has shape (bs, na * (5 + nc), ny, nx), with no sigmoid, grid or anchor decoding. The host
+    decodes them (system/yolo_heads.py) and only for cells whose objectness logit passes the threshold.
+    """
+    return tuple(self.m[i](x[i]) for i in range(self.nl))
+
+
 class iOSModel(torch.nn.Module):
     """An iOS-compatible wrapper for YOLOv5 models that normalizes input images based on their dimensions."""
 
@@ -334,12 +344,18 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
     LOGGER.info(f"\n{prefix} starting export with onnx {onnx.__version__}...")
     f = str(file.with_suffix(".onnx"))
 
+    raw_heads = getattr(model.model[-1], "raw_heads", False)
     output_names = ["output0", "output1"] if isinstance(model, SegmentationModel) else ["output0"]
+    if raw_heads:
+        output_names = [f"output{i}" for i in range(model.model[-1].nl)]  # shape(1,na*no,80,80) etc.
     if dynamic:
         dynamic = {"images": {0: "batch", 2: "height", 3: "width"}}  # shape(1,3,640,640)
         if isinstance(model, SegmentationModel):
             dynamic["output0"] = {0: "batch", 1: "anchors"}  # shape(1,25200,85)
             dynamic["output1"] = {0: "batch", 2: "mask_height", 3: "mask_width"}  # shape(1,32,160,160)
+        elif raw_heads:
+            for name in output_names:
+                dynamic[name] = {0: "batch", 2: "height", 3: "width"}
         elif isinstance(model, DetectionModel):
             dynamic["output0"] = {0: "batch", 1: "anchors"}  # shape(1,25200,85)
 
@@ -361,6 +377,10 @@ def export_onnx(model, im, file, opset, dynamic, simplify, prefix=colorstr("ONNX
 
     # Metadata
     d = {"stride": int(max(model.stride)), "names": model.names}
+    if raw_heads:  # pixel anchors and strides needed by the host-side decode
+        m = model.model[-1]
+        d["anchors"] = (m.anchors * m.stride.view(-1, 1, 1)).view(m.nl, -1).tolist()
+        d["strides"] = m.stride.tolist()
     for k, v in d.items():
         meta = model_onnx.metadata_props.add()
         meta.key, meta.value = k, str(v)
@@ -1300,6 +1320,7 @@ def run(
     topk_all=100,  # TF.js NMS: topk for all classes to keep
     iou_thres=0.45,  # TF.js NMS: IoU threshold
     conf_thres=0.25,  # TF.js NMS: confidence threshold
+    raw_heads=False,  # ONNX: output the raw detection-head tensors, decoded on the host
 ):
     """
     Exports a YOLOv5 model to specified formats including ONNX, TensorRT, CoreML, and TensorFlow.
@@ -1330,6 +1351,8 @@ def run(
         iou_thres (float): IoU threshold for NMS. Default is 0.45.
         conf_thres (float): Confidence threshold for NMS. Default is 0.25.
         mlmodel (bool): Flag to use *.mlmodel for CoreML export. Default is False.
+        raw_heads (bool): Export the three raw Detect() conv outputs instead of the decoded (1, N, 5 + nc)
+            tensor, moving sigmoid/grid/anchor decoding to the host. Default is False.
 
     Returns:
         None
@@ -1402,6 +1425,9 @@ def run(
             m.inplace = inplace
             m.dynamic = dynamic
             m.export = True
+            if raw_heads:
+                m.raw_heads = True
+                m.forward = detect_raw_forward.__get__(m)
 
     for _ in range(2):
         y = model(im)  # dry runs
@@ -1524,6 +1550,7 @@ def parse_opt(known=False):
     parser.add_argument("--topk-all", type=int, default=100, help="TF.js NMS: topk for all classes to keep")
     parser.add_argument("--iou-thres", type=float, default=0.45, help="TF.js NMS: IoU threshold")
     parser.add_argument("--conf-thres", type=float, default=0.25, help="TF.js NMS: confidence threshold")
+    parser.add_argument("--raw-heads", action="store_true", help="ONNX: export raw detection heads, decode on host")
     parser.add_argument(
         "--include",
         nargs="+",